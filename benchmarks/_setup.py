@@ -0,0 +1,21 @@
+import os
+
+import django
+
+
+def setup():
+  os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings.settings")
+  django.setup()
+
+
+def setup_test_db():
+  """In-memory test database and locmem mail, like the test suite."""
+  from django.conf import settings
+  from django.core import mail
+  from django.db import connection
+  from django.test.utils import setup_test_environment
+
+  setup_test_environment(debug=False)
+  settings.EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+  connection.creation.create_test_db(verbosity=0)
+  mail.outbox = []
@@ -0,0 +1,105 @@
+"""Memory allocated by the login and verify paths, with tracemalloc.
+
+Runs against an in-memory test database and the locmem mail backend. Run from the
+repository root:
+
+  python -m benchmarks.bench_alloc
+"""
+
+import tracemalloc
+
+from benchmarks._setup import setup, setup_test_db
+
+setup()
+
+from django.core import mail
+from django.core.cache import cache
+
+from django_login_email import email, token
+from django_login_email.views import mixin
+
+N = 500
+loginInfo, registerInfo = email.get_info_class("bench")
+
+
+class Sender(mixin.MailRecordModelMixin, email.EmailVerifyMixin):
+  login_info_class = loginInfo
+  register_info_class = registerInfo
+  tl = email.TimeLimit()
+
+
+def measure(name: str, fn, n: int = N) -> None:
+  fn(0)  # warm caches, imports and the connection.
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  peak_base = tracemalloc.get_traced_memory()[0]
+  tracemalloc.reset_peak()
+  for i in range(1, n + 1):
+    fn(i)
+  after = tracemalloc.take_snapshot()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  stats = after.compare_to(before, "filename")
+  allocated = sum(s.size_diff for s in stats if s.size_diff > 0)
+  print(
+    f"{name:>14}: {allocated / n:10.0f} B retained/op, "
+    f"peak {(peak - peak_base) / 1024:8.1f} KiB over {n} ops"
+  )
+
+
+def objects(name: str, make, n: int = 10000) -> None:
+  tracemalloc.start()
+  items = [make(i) for i in range(n)]
+  size, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del items
+  print(f"{name:>14}: {size / n:10.0f} B/object")
+
+
+def main():
+  setup_test_db()
+
+  s = Sender()
+  tokens = []
+
+  class Keep(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      tokens.append(super().encrypt_mail(*args, **kwargs))
+      return tokens[-1]
+
+  s.get_token_manager = lambda: Keep(10)
+
+  def login(i):
+    cache.clear()
+    mail.outbox.clear()
+    s.send_login_mail(f"user{i}@example.com")
+
+  def verify(i):
+    s.verify_token(tokens[i])
+
+  measure("login", login)
+  measure("verify", verify)
+
+  objects(
+    "LoginToken",
+    lambda i: token.LoginToken(f"user{i}@example.com", i, "salt", "login"),
+  )
+  objects(
+    "dict token",
+    lambda i: {
+      "email": f"user{i}@example.com",
+      "expired_time": i,
+      "salt": "salt",
+      "mail_type": "login",
+    },
+  )
+  objects(
+    "MailRecord",
+    lambda i: email.MailRecord(
+      expired_time=None, email=f"user{i}@example.com", validated=False, salt=""
+    ),
+  )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,51 @@
+"""Import time of the package, with `python -X importtime`.
+
+Prints the slowest modules of `django_login_email` imported at startup. Run from the
+repository root:
+
+  python -m benchmarks.bench_import
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STARTUP = "import django; django.setup(); import django_login_email.views"
+
+
+def importtime(code: str) -> dict:
+  """module -> cumulative import time in us"""
+  env = dict(os.environ, DJANGO_SETTINGS_MODULE="settings.settings")
+  res = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    cwd=ROOT,
+    env=env,
+    capture_output=True,
+    text=True,
+    check=True,
+  )
+  times = {}
+  for line in res.stderr.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line:
+      continue
+    _, cumulative, name = line[len("import time:") :].split("|")
+    times[name.strip()] = int(cumulative)
+  return times
+
+
+def main():
+  times = importtime(STARTUP)
+  top = sorted(
+    ((us, m) for m, us in times.items() if m.startswith("django_login_email")),
+    reverse=True,
+  )
+  print("cumulative import time:")
+  for us, m in top[:10]:
+    print(f"{us / 1000:8.2f} ms  {m}")
+
+
+if __name__ == "__main__":
+  main()
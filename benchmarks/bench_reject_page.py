@@ -0,0 +1,37 @@
+"""Cost of the error page of a refusal, rendered per request vs cached.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_reject_page
+"""
+
+import timeit
+
+from benchmarks._setup import setup
+
+setup()
+
+from django.shortcuts import render
+from django.test import RequestFactory
+
+from django_login_email import rejections
+
+N = 5000
+TEMPLATE = "login_email/error.html"
+MESSAGE = "Too many requests. Please try again later."
+
+
+def main():
+  request = RequestFactory().post("/account/login/")
+  cases = {
+    "render": lambda: render(request, TEMPLATE, {"error": MESSAGE}, status=429),
+    "rejections.reject": lambda: rejections.reject(TEMPLATE, MESSAGE, 429, 600),
+  }
+  for name, fn in cases.items():
+    fn()
+    sec = min(timeit.repeat(fn, number=N, repeat=3))
+    print(f"{name:>20}: {sec / N * 1e6:8.2f} us/response")
+
+
+if __name__ == "__main__":
+  main()
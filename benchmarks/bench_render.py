@@ -0,0 +1,49 @@
+"""Per-send cost of building the mail body.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_render
+"""
+
+import timeit
+
+from benchmarks._setup import setup
+
+setup()
+
+from django.template.loader import render_to_string
+
+from django_login_email import email, render
+
+N = 20000
+TOKEN = "dGhpcyBpcyBhIGZha2UgdG9rZW4gZm9yIGJlbmNobWFya3M%3D" * 3
+
+
+def main():
+  loginInfo, _ = email.get_info_class("bench")
+
+  def legacy():
+    e = loginInfo()
+    e.build_message(TOKEN)
+
+  def uncached():
+    e = loginInfo()
+    context = render.get_context(e)
+    render_to_string(e.text_template_name, context)
+    render_to_string(e.html_template_name, context)
+
+  def compiled():
+    loginInfo().render(TOKEN)
+
+  for name, fn in (
+    ("build_message", legacy),
+    ("template", uncached),
+    ("compiled", compiled),
+  ):
+    fn()
+    sec = min(timeit.repeat(fn, number=N, repeat=3))
+    print(f"{name:>14}: {sec / N * 1e6:8.2f} us/send")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,98 @@
+"""Messages per second, one blocking send at a time vs the concurrent sender, and
+the latency of login mails during a bulk campaign.
+
+Sends to a local aiosmtpd sink that waits `DELAY` seconds per message, like a relay
+on the network. Needs aiosmtplib and aiosmtpd. Run from the repository root:
+
+  python -m benchmarks.bench_smtp
+"""
+
+import asyncio
+import socket
+import time
+
+from benchmarks._setup import setup
+
+setup()
+
+from aiosmtpd.controller import Controller
+from django.core.mail import EmailMessage, get_connection
+
+from django_login_email import smtp
+
+N = 200
+DELAY = 0.02
+
+
+class Sink(object):
+  async def handle_DATA(self, server, session, envelope):
+    await asyncio.sleep(DELAY)
+    return "250 OK"
+
+
+def mail(to: str) -> EmailMessage:
+  return EmailMessage("subject", "body", "noreply@example.com", [to])
+
+
+def messages():
+  return [mail(f"u{i}@example.com") for i in range(N)]
+
+
+def run(name: str, send) -> None:
+  start = time.perf_counter()
+  send(messages())
+  sec = time.perf_counter() - start
+  print(f"{name:>32}: {N / sec:8.1f} messages/s")
+
+
+def main():
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+  controller = Controller(Sink(), hostname="127.0.0.1", port=port)
+  controller.start()
+  options = dict(host="127.0.0.1", port=port, username="", password="", use_tls=False)
+
+  def one_by_one(msgs):
+    # what send_valid does, a connection per message.
+    for m in msgs:
+      m.connection = get_connection(
+        "django.core.mail.backends.smtp.EmailBackend", **options
+      )
+      m.send()
+
+  run("EmailMessage.send", one_by_one)
+  for connections in (1, 4, 16):
+    sender = smtp.AsyncSMTPSender(
+      hostname="127.0.0.1",
+      port=port,
+      username="",
+      password="",
+      start_tls=False,
+      connections=connections,
+    )
+    run(f"AsyncSMTPSender, {connections} sessions", sender.send_messages)
+
+  # logins during a campaign, on 4 sessions.
+  sender = smtp.AsyncSMTPSender(
+    hostname="127.0.0.1", port=port, username="", password="", start_tls=False
+  )
+  campaign = [sender.submit(m, block=True) for m in messages()]
+  latencies = []
+  for i in range(50):
+    start = time.perf_counter()
+    sender.submit(mail(f"login{i}@example.com"), priority="login").result()
+    latencies.append(time.perf_counter() - start)
+    time.sleep(0.01)
+  for f in campaign:
+    f.result()
+  latencies.sort()
+  p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+  print(
+    f"{'login during campaign':>32}: p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms"
+  )
+  controller.stop()
+
+
+if __name__ == "__main__":
+  main()
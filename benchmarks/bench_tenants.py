@@ -0,0 +1,76 @@
+"""Per-request cost of the tenant lookup, with 1000 tenants.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_tenants
+"""
+
+import random
+import time
+
+from benchmarks._setup import setup
+
+setup()
+
+from django.test import override_settings
+
+from django_login_email import email, tenants
+
+TENANTS = 1000
+N = 100000
+TOKEN = "dGhpcyBpcyBhIGZha2UgdG9rZW4gZm9yIGJlbmNobWFya3M%3D" * 3
+loginInfo, registerInfo = email.get_info_class("bench")
+
+
+def loader(tenant_id: str) -> tenants.Tenant:
+  return tenants.Tenant(
+    id=tenant_id,
+    system_name=f"Brand {tenant_id}",
+    verify_url=f"https://{tenant_id}/account/verify?token=",
+  )
+
+
+def lookup(cache_size: int, ids) -> float:
+  """seconds per request: resolve the tenant and pick its info classes."""
+  cache = tenants.TenantCache(loader, cache_size)
+  start = time.perf_counter()
+  for tenant_id in ids:
+    cache.get(tenant_id).get_info_classes(loginInfo, registerInfo)
+  elapsed = time.perf_counter() - start
+  misses = cache.misses / len(ids)
+  print(
+    f"{cache_size:>6} tenants cached: {elapsed / len(ids) * 1e6:8.2f} us/request, "
+    f"{misses:6.1%} misses"
+  )
+  return elapsed
+
+
+def main():
+  names = [f"brand{i}.example.com" for i in range(TENANTS)]
+  ids = [random.choice(names) for _ in range(N)]
+
+  start = time.perf_counter()
+  for name in names:
+    tenants.TenantResources(loader(name)).get_info_classes(loginInfo, registerInfo)
+  build = (time.perf_counter() - start) / TENANTS
+  print(f"build one tenant (key, classes): {build * 1e6:8.2f} us")
+
+  for size in (TENANTS, 256):
+    lookup(size, ids)
+
+  # rendering, the compiled templates are kept for each cached tenant.
+  with override_settings(
+    LOGIN_EMAIL={"TENANT_RESOLVER": "django_login_email.tenants.by_host"}
+  ):
+    cache = tenants.TenantCache(loader, TENANTS)
+    for tenant_id in names:
+      cache.get(tenant_id).get_info_classes(loginInfo, registerInfo)[0]().render(TOKEN)
+    start = time.perf_counter()
+    for tenant_id in ids[:20000]:
+      cache.get(tenant_id).get_info_classes(loginInfo, registerInfo)[0]().render(TOKEN)
+    elapsed = (time.perf_counter() - start) / 20000
+    print(f"lookup + render, warm: {elapsed * 1e6:8.2f} us/send")
+
+
+if __name__ == "__main__":
+  main()
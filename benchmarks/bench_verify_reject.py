@@ -0,0 +1,71 @@
+"""Cost of refusing a token on the verify path.
+
+Runs against an in-memory test database. Run from the repository root:
+
+  python -m benchmarks.bench_verify_reject
+"""
+
+import timeit
+
+from benchmarks._setup import setup, setup_test_db
+
+setup()
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from django_login_email import email, token
+from django_login_email.views import mixin
+
+N = 2000
+GARBAGE = "bm90IGEgdG9rZW4gYXQgYWxsLCBqdXN0IHNvbWUgYnl0ZXMgZm9yIHRoZSBiZW5jaG1hcms%3D"
+loginInfo, registerInfo = email.get_info_class("bench")
+
+
+class Verify(mixin.MailRecordModelMixin, email.EmailVerifyMixin):
+  login_info_class = loginInfo
+  register_info_class = registerInfo
+  tl = email.TimeLimit()
+
+
+def refuse(v: Verify, token_v: str) -> None:
+  try:
+    v.verify_token(token_v)
+  except Exception:
+    pass
+
+
+def run(name: str, v: Verify, token_v: str) -> None:
+  refuse(v, token_v)
+  with CaptureQueriesContext(connection) as queries:
+    refuse(v, token_v)
+  sec = min(timeit.repeat(lambda: refuse(v, token_v), number=N, repeat=3))
+  print(f"{name:>28}: {sec / N * 1e6:8.2f} us/request, {len(queries)} queries")
+
+
+def main():
+  setup_test_db()
+  v = Verify()
+  saved = []
+
+  class Keep(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  v.get_token_manager = lambda: Keep(10)
+  v.send_valid("bench@example.com", "login")
+  consumed = saved[0]
+  v.verify_token(consumed)
+  del v.get_token_manager
+
+  with override_settings(LOGIN_EMAIL={"VERIFY_NEGATIVE_TTL": 0}):
+    run("garbage, no negative cache", v, GARBAGE)
+    run("replay, no negative cache", v, consumed)
+  run("garbage, negative cache", v, GARBAGE)
+  run("replay, negative cache", v, consumed)
+
+
+if __name__ == "__main__":
+  main()
@@ -1,17 +1,203 @@
-from django.contrib import admin
+import ipaddress
+import itertools
 
-from django_login_email import models
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-# Register your models here.
+from django_login_email import audit, conf, cooldown, iputils, models, rejections, tenants
+
+
+def batched(iterable, size: int):
+  it = iter(iterable)
+  while batch := list(itertools.islice(it, size)):
+    yield batch
+
+
+def estimate_count(model, using: str):
+  """Row count from the planner statistics, or None if the database has none."""
+  connection = connections[using]
+  table = model._meta.db_table
+  with connection.cursor() as cursor:
+    if connection.vendor == "postgresql":
+      cursor.execute(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]
+      )
+    elif connection.vendor == "mysql":
+      cursor.execute(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        [table],
+      )
+    else:
+      return None
+    row = cursor.fetchone()
+  if row is None or row[0] is None or row[0] < 0:
+    return None
+  return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+  """Paginator that avoids an exact COUNT(*) on large tables.
+
+  - unfiltered lists use the planner estimate, when it is above `exact_below`.
+  - filtered lists count at most `max_count` rows.
+  """
+
+  exact_below = 10000
+  max_count = 100000
+
+  @cached_property
+  def count(self) -> int:
+    qs = self.object_list
+    if not isinstance(qs, QuerySet):
+      return super().count
+    if not qs.query.has_filters():
+      estimate = estimate_count(qs.model, qs.db)
+      if estimate is not None and estimate >= self.exact_below:
+        return estimate
+      return qs.count()
+    return qs.order_by()[: self.max_count].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+  paginator = EstimatedCountPaginator
+  # skip the second COUNT(*) of "x results (y total)".
+  show_full_result_count = False
+
+
+class MailTypeFilter(admin.SimpleListFilter):
+  """Fixed choices, instead of SELECT DISTINCT over the whole table."""
+
+  title = "mail type"
+  parameter_name = "mail_type"
+
+  def lookups(self, request, model_admin):
+    return (("login", "login"), ("register", "register"))
+
+  def queryset(self, request, queryset):
+    if self.value():
+      return queryset.filter(mail_type=self.value())
+    return queryset
 
 
 @admin.register(models.EmailRecord)
-class EmailRecordAdmin(admin.ModelAdmin):
+class EmailRecordAdmin(LargeTableAdmin):
   list_display = ("email", "expired_time", "validated", "mail_type")
+  list_filter = (MailTypeFilter, "validated", "expired_time")
+  search_fields = ("email",)
+  search_help_text = "Email, or the beginning of it."
+  actions = ("expire", "purge")
+
+  def get_search_results(self, request, queryset, search_term):
+    # prefix match on the unique index of email.
+    search_term = search_term.strip()
+    if not search_term:
+      return queryset, False
+    return queryset.filter(email__startswith=search_term), False
+
+  def release_cooldowns(self, queryset):
+    """Delete the cooldowns of the records, otherwise the cache refuses a new mail."""
+    c = cooldown.get_cooldown()
+    size = conf.get_config().batch_size
+    emails = queryset.values_list("email", flat=True).iterator(chunk_size=size)
+    for batch in batched(emails, size):
+      c.cache.delete_many([c.key(e) for e in batch])
+
+  @admin.action(description="Expire selected tokens, and allow to send again")
+  def expire(self, request, queryset):
+    self.release_cooldowns(queryset)
+    n = queryset.update(expired_time=timezone.now(), validated=True)
+    self.message_user(request, f"{n} records expired.", messages.SUCCESS)
+
+  @admin.action(description="Purge selected records")
+  def purge(self, request, queryset):
+    self.release_cooldowns(queryset)
+    n, _ = queryset.delete()
+    self.message_user(request, f"{n} records purged.", messages.SUCCESS)
+
+
+@admin.register(models.EmailToken)
+class EmailTokenAdmin(LargeTableAdmin):
+  list_display = ("email", "expired_time", "consumed", "mail_type")
+  list_filter = (MailTypeFilter, "consumed", "expired_time")
+  search_fields = ("email",)
+  search_help_text = "Exact email."
+  actions = ("expire",)
+
+  def get_search_results(self, request, queryset, search_term):
+    # exact match, the email index leads with it.
+    search_term = search_term.strip()
+    if not search_term:
+      return queryset, False
+    return queryset.filter(email=search_term), False
+
+  @admin.action(description="Expire selected tokens")
+  def expire(self, request, queryset):
+    n = queryset.update(expired_time=timezone.now(), consumed=True)
+    self.message_user(request, f"{n} tokens expired.", messages.SUCCESS)
 
 
 @admin.register(models.IPBan)
-class IPBanAdmin(admin.ModelAdmin):
+class IPBanAdmin(LargeTableAdmin):
   """Users could cancel limitation by delete the IPBan object; or add new IPBan object."""
 
   list_display = ("ip", "reason", "created_at")
+  list_filter = ("created_at",)
+  search_fields = ("ip",)
+  search_help_text = "Exact IP address."
+  actions = ("unban",)
+
+  def get_search_results(self, request, queryset, search_term):
+    # exact match on the unique index of ip.
+    search_term = search_term.strip()
+    if not search_term:
+      return queryset, False
+    try:
+      ip = str(ipaddress.ip_address(search_term))
+    except ValueError:
+      return queryset.none(), False
+    return queryset.filter(ip=ip), False
+
+  @admin.action(description="Unban selected IPs")
+  def unban(self, request, queryset):
+    # otherwise a counter refuses or bans them again on the next attempt: the send
+    # counters, global and of each tenant, and the verify failures.
+    recorders = [iputils.IPBanUtils.recorder, rejections.get_failure_recorder()]
+    recorders += tenants.get_recorders()
+    size = conf.get_config().batch_size
+    ips = queryset.values_list("ip", flat=True).iterator(chunk_size=size)
+    for batch in batched(ips, size):
+      for recorder in recorders:
+        recorder.reset(batch)
+    n, _ = queryset.delete()
+    self.message_user(request, f"{n} IPs unbanned.", messages.SUCCESS)
+
+
+@admin.register(models.LoginAttempt)
+class LoginAttemptAdmin(LargeTableAdmin):
+  """Read-only, the rows are written by the audit buffer."""
+
+  list_display = ("created_at", "kind", "outcome", "ip", "total_ms")
+  list_filter = ("kind", "outcome", "created_at")
+  search_fields = ("email_hash",)
+  search_help_text = "sha256 of the normalized email."
+  date_hierarchy = "created_at"
+
+  def get_search_results(self, request, queryset, search_term):
+    # an email is hashed, a hash is matched as is.
+    search_term = search_term.strip()
+    if not search_term:
+      return queryset, False
+    if "@" in search_term:
+      search_term = audit.email_hash(search_term)
+    return queryset.filter(email_hash=search_term), False
+
+  def has_add_permission(self, request):
+    return False
+
+  def has_change_permission(self, request, obj=None):
+    return False
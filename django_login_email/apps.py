@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class DjangoLoginEmailConfig(AppConfig):
   default_auto_field = "django.db.models.BigAutoField"
   name = "django_login_email"
+
+  def ready(self):
+    from . import checks, conf  # noqa: F401
+
+    try:
+      warm = conf.get_config().warm_up_on_ready
+    except Exception:
+      # invalid settings are reported by the system checks.
+      return
+    if warm:
+      from . import warmup
+
+      # no connections, they would be shared by the workers forked after it, and
+      # not the URLconf, other apps may not be ready yet.
+      warmup.warm_up(connections=False, urlconf=False)
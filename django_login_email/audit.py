@@ -0,0 +1,233 @@
+# Audit log of login attempts, without one insert per request.
+#
+# With `LOGIN_EMAIL["AUDIT"] = True`, the views append their attempts to an in-process
+# ring buffer. A background thread writes them with one bulk_create every
+# `AUDIT_FLUSH_SIZE` attempts or `AUDIT_FLUSH_INTERVAL_MS` milliseconds, and the rest at
+# shutdown. If the database falls behind, the buffer keeps the newest
+# `AUDIT_BUFFER_SIZE` attempts and counts the dropped ones.
+#
+# A batch with a refused row (IntegrityError, DataError) is written row by row, the
+# refused rows are logged and counted as dropped. A batch that fails otherwise, e.g. the
+# database is down, is queued again at once.
+import atexit
+import collections
+import hashlib
+import ipaddress
+import logging
+import os
+import threading
+import time
+import typing as t
+
+from django.db import (
+  DatabaseError,
+  DataError,
+  IntegrityError,
+  close_old_connections,
+  transaction,
+)
+from django.utils import timezone
+
+from . import conf, cooldown
+
+logger = logging.getLogger(__name__)
+
+
+def email_hash(email: t.Optional[str]) -> str:
+  if not email:
+    return ""
+  return hashlib.sha256(cooldown.normalize_email(email).encode("utf-8")).hexdigest()
+
+
+def normalize_ip(ip: t.Optional[str]) -> t.Optional[str]:
+  """The address, or None if `ip` is not one, e.g. a forged X-Forwarded-For."""
+  if not ip:
+    return None
+  try:
+    return str(ipaddress.ip_address(ip.strip()))
+  except ValueError:
+    return None
+
+
+class Stages(object):
+  """Latency of each stage of a request, in milliseconds."""
+
+  __slots__ = ("start", "last", "times")
+
+  def __init__(self) -> None:
+    self.start = self.last = time.perf_counter()
+    self.times: t.Dict[str, float] = {}
+
+  def lap(self, name: str) -> None:
+    now = time.perf_counter()
+    self.times[name] = round((now - self.last) * 1000, 3)
+    self.last = now
+
+  @property
+  def total_ms(self) -> float:
+    return round((self.last - self.start) * 1000, 3)
+
+
+class AuditBuffer(object):
+  """Ring buffer of attempts, flushed to LoginAttempt in batches."""
+
+  def __init__(
+    self, capacity: int = 10000, flush_size: int = 500, flush_interval_ms: int = 1000
+  ) -> None:
+    self.capacity = capacity
+    self.flush_size = flush_size
+    self.flush_interval = flush_interval_ms / 1000
+    self.dropped = 0
+    self.written = 0
+    self._flush_lock = threading.Lock()
+    self._thread_lock = threading.Lock()
+    self._start()
+
+  def _start(self) -> None:
+    self.pid = os.getpid()
+    self.buffer: t.Deque[t.Dict[str, t.Any]] = collections.deque(maxlen=self.capacity)
+    self._wake = threading.Event()
+    self._thread: t.Optional[threading.Thread] = None
+
+  def _ensure_thread(self) -> None:
+    if self._thread is not None and self.pid == os.getpid():
+      return
+    # one thread, even when concurrent requests add their first attempt.
+    with self._thread_lock:
+      # the thread does not survive a fork, start a new one in the child.
+      if self.pid != os.getpid():
+        self._start()
+      if self._thread is None:
+        self._thread = threading.Thread(
+          target=self._run, daemon=True, name="login-email-audit"
+        )
+        self._thread.start()
+
+  def add(self, attempt: t.Dict[str, t.Any]) -> None:
+    """Queue an attempt, never touches the database."""
+    self._ensure_thread()
+    if len(self.buffer) == self.capacity:
+      self.dropped += 1
+    self.buffer.append(attempt)
+    if len(self.buffer) >= self.flush_size:
+      self._wake.set()
+
+  def _run(self) -> None:
+    while True:
+      self._wake.wait(self.flush_interval)
+      self._wake.clear()
+      try:
+        self.flush()
+      except Exception as e:
+        logger.error(f"Failed to write login attempts: {e!r}")
+      finally:
+        close_old_connections()
+
+  def flush(self) -> int:
+    """Write the buffered attempts, return how many."""
+    from .models import LoginAttempt
+
+    with self._flush_lock:
+      attempts = []
+      while self.buffer:
+        try:
+          attempts.append(self.buffer.popleft())
+        except IndexError:
+          break
+      if not attempts:
+        return 0
+      try:
+        LoginAttempt.objects.bulk_create(
+          [LoginAttempt(**a) for a in attempts], batch_size=conf.get_config().batch_size
+        )
+      except (IntegrityError, DataError):
+        return self._flush_one_by_one(attempts)
+      except DatabaseError:
+        # e.g. the database is down, one insert per row would only retry the outage.
+        self._requeue(attempts)
+        raise
+      self.written += len(attempts)
+      return len(attempts)
+
+  def _flush_one_by_one(self, attempts: t.List[t.Dict[str, t.Any]]) -> int:
+    from .models import LoginAttempt
+
+    failed = []
+    for i, attempt in enumerate(attempts):
+      try:
+        with transaction.atomic(using=LoginAttempt.objects.db):
+          LoginAttempt.objects.create(**attempt)
+      except (IntegrityError, DataError) as e:
+        failed.append((attempt, e))
+      except DatabaseError:
+        # the database went away, the rest of the batch waits for the next flush.
+        self.written += i - len(failed)
+        self._requeue(attempts[i:])
+        raise
+    written = len(attempts) - len(failed)
+    self.written += written
+    for attempt, e in failed:
+      logger.error(f"Dropped a login attempt the database refused: {e!r}")
+    self.dropped += len(failed)
+    return written
+
+  def _requeue(self, attempts: t.List[t.Dict[str, t.Any]]) -> None:
+    """Put `attempts` back before the newer ones, as many as there is room for."""
+    room = max(0, self.capacity - len(self.buffer))
+    kept = attempts[max(0, len(attempts) - room) :] if room else []
+    self.dropped += len(attempts) - len(kept)
+    self.buffer.extendleft(reversed(kept))
+
+  def metrics(self) -> t.Dict[str, int]:
+    return {
+      "buffered": len(self.buffer),
+      "written": self.written,
+      "dropped": self.dropped,
+    }
+
+
+_buffer: t.Optional[AuditBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> AuditBuffer:
+  global _buffer
+  with _buffer_lock:
+    if _buffer is None:
+      c = conf.get_config()
+      _buffer = AuditBuffer(
+        c.audit_buffer_size, c.audit_flush_size, c.audit_flush_interval_ms
+      )
+    return _buffer
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+  if _buffer is not None and _buffer.pid == os.getpid():
+    try:
+      _buffer.flush()
+    except Exception as e:
+      logger.error(f"Failed to write login attempts at exit: {e!r}")
+
+
+def record(
+  kind: str,
+  outcome: str,
+  ip: t.Optional[str] = None,
+  email: t.Optional[str] = None,
+  stages: t.Optional[Stages] = None,
+) -> None:
+  """Add an attempt to the audit log, if `LOGIN_EMAIL["AUDIT"]` is on."""
+  if not conf.get_config().audit:
+    return
+  get_buffer().add(
+    {
+      "created_at": timezone.now(),
+      "kind": kind,
+      "outcome": outcome,
+      "ip": normalize_ip(ip),
+      "email_hash": email_hash(email),
+      "stages": dict(stages.times) if stages else {},
+      "total_ms": stages.total_ms if stages else 0,
+    }
+  )
@@ -0,0 +1,139 @@
+# Circuit breaker around the SMTP send.
+#
+# The state lives in the Django cache, so every worker process sees the same breaker:
+#
+# - closed: sends go through. Calls and failures are counted per `window` seconds.
+#   When the failure rate of the current and previous window reaches `failure_rate`
+#   (with at least `min_calls` calls), the breaker opens.
+# - open: sends fail fast with `CircuitOpenError` for `reset_timeout` seconds.
+# - half-open: after `reset_timeout`, one worker claims a probe. A successful probe
+#   closes the breaker, a failed one opens it again.
+import time
+import typing as t
+
+from django.core.cache import caches
+
+from . import conf, errors
+
+T = t.TypeVar("T")
+
+
+class CircuitBreaker(object):
+  """Failure-rate circuit breaker, shared across processes through the cache."""
+
+  prefix = "login_email:breaker:"
+
+  def __init__(
+    self,
+    name: str = "smtp",
+    failure_rate: float = 0.5,
+    min_calls: int = 5,
+    window: int = 60,
+    reset_timeout: float = 30,
+    cache_alias: str = "default",
+  ) -> None:
+    self.name = name
+    self.failure_rate = failure_rate
+    self.min_calls = min_calls
+    self.window = window
+    self.reset_timeout = reset_timeout
+    self.cache_alias = cache_alias
+
+  @property
+  def cache(self):
+    return caches[self.cache_alias]
+
+  def _key(self, *parts) -> str:
+    return self.prefix + ":".join((self.name,) + tuple(str(p) for p in parts))
+
+  def _incr(self, key: str) -> int:
+    self.cache.add(key, 0, self.window * 2)
+    try:
+      return self.cache.incr(key)
+    except ValueError:
+      # expired between add() and incr().
+      self.cache.set(key, 1, self.window * 2)
+      return 1
+
+  def _counts(self, now: float) -> t.Tuple[int, int]:
+    """calls and failures of the current and previous window."""
+    bucket = int(now // self.window)
+    keys = [
+      self._key(kind, b) for b in (bucket, bucket - 1) for kind in ("calls", "fails")
+    ]
+    values = self.cache.get_many(keys)
+    calls = sum(values.get(k, 0) for k in keys[0::2])
+    fails = sum(values.get(k, 0) for k in keys[1::2])
+    return calls, fails
+
+  def _open(self, now: float) -> None:
+    # keep the state long after reset_timeout, so the half-open probe is still needed.
+    ttl = int(self.reset_timeout + self.window * 2) + 1
+    self.cache.set(self._key("open_until"), now + self.reset_timeout, ttl)
+    self.cache.delete(self._key("probe"))
+
+  def state(self, now: t.Optional[float] = None) -> str:
+    """`closed`, `open` or `half-open`"""
+    now = time.time() if now is None else now
+    open_until = self.cache.get(self._key("open_until"))
+    if open_until is None:
+      return "closed"
+    return "open" if now < open_until else "half-open"
+
+  def allow(self) -> bool:
+    """check if a call could go through. In half-open state, only one probe does."""
+    state = self.state()
+    if state == "closed":
+      return True
+    if state == "open":
+      return False
+    return self.cache.add(self._key("probe"), 1, int(self.reset_timeout) + 1)
+
+  def record_success(self) -> None:
+    now = time.time()
+    self._incr(self._key("calls", int(now // self.window)))
+    if self.cache.get(self._key("open_until")) is not None:
+      self.reset()
+
+  def record_failure(self) -> None:
+    now = time.time()
+    bucket = int(now // self.window)
+    self._incr(self._key("calls", bucket))
+    self._incr(self._key("fails", bucket))
+
+    if self.state(now) != "closed":
+      # the half-open probe failed.
+      self._open(now)
+      return
+    calls, fails = self._counts(now)
+    if calls >= self.min_calls and fails / calls >= self.failure_rate:
+      self._open(now)
+
+  def reset(self) -> None:
+    bucket = int(time.time() // self.window)
+    self.cache.delete_many(
+      [self._key("open_until"), self._key("probe")]
+      + [self._key(kind, b) for b in (bucket, bucket - 1) for kind in ("calls", "fails")]
+    )
+
+  def call(self, fn: t.Callable[[], T]) -> T:
+    if not self.allow():
+      raise errors.CircuitOpenError(f"Circuit {self.name} is open, skip sending.")
+    try:
+      res = fn()
+    except Exception:
+      self.record_failure()
+      raise
+    self.record_success()
+    return res
+
+
+def get_breaker() -> CircuitBreaker:
+  config = conf.get_config()
+  return CircuitBreaker(
+    failure_rate=config.breaker_failure_rate,
+    min_calls=config.breaker_min_calls,
+    window=config.breaker_window,
+    reset_timeout=config.breaker_reset_timeout,
+    cache_alias=config.cache_alias,
+  )
@@ -0,0 +1,65 @@
+import importlib.util
+
+from django.core import checks
+
+from . import conf
+
+
+@checks.register(checks.Tags.compatibility)
+def check_settings(app_configs, **kwargs):
+  """Validate the `LOGIN_EMAIL` settings at startup."""
+  values = conf.read_settings()
+  errors = [
+    checks.Error(f"{conf.SETTING}: {problem}", id="django_login_email.E001")
+    for problem in conf.validate(values)
+  ]
+  errors += [
+    checks.Warning(
+      f"{conf.SETTING}: unknown key {key!r}.",
+      hint=f"Known keys: {', '.join(conf.SCHEMA)}.",
+      id="django_login_email.W001",
+    )
+    for key in conf.unknown_keys(values)
+  ]
+  return errors
+
+
+@checks.register(checks.Tags.compatibility)
+def check_domain_lists(app_configs, **kwargs):
+  """The email domain lists can be read."""
+  values = conf.read_settings()
+  if conf.validate(values):
+    return []
+  errors = []
+  for key in ("DOMAIN_BLOCKLIST", "DOMAIN_ALLOWLIST"):
+    path = values.get(key)
+    if not path:
+      continue
+    try:
+      with open(path, encoding="utf-8"):
+        pass
+    except OSError as e:
+      errors.append(
+        checks.Error(
+          f"{conf.SETTING}: {key} {path!r} cannot be read: {e.strerror}.",
+          id="django_login_email.E002",
+        )
+      )
+  return errors
+
+
+@checks.register(checks.Tags.compatibility)
+def check_mail_dispatch(app_configs, **kwargs):
+  """`MAIL_DISPATCH = "async"` needs aiosmtplib."""
+  values = conf.read_settings()
+  if values.get("MAIL_DISPATCH") != "async":
+    return []
+  if importlib.util.find_spec("aiosmtplib") is None:
+    return [
+      checks.Error(
+        f'{conf.SETTING}: MAIL_DISPATCH "async" requires aiosmtplib.',
+        hint="pip install django-login-email[async]",
+        id="django_login_email.E003",
+      )
+    ]
+  return []
@@ -0,0 +1,322 @@
+# Settings of django-login-email.
+#
+# All tunables live in one `LOGIN_EMAIL` dict in settings.py:
+#
+#   LOGIN_EMAIL = {"TOKEN_TTL_MINUTES": 15, "RATE_LIMIT_TIMES": 5}
+#
+# They are read once into an immutable Config, instead of getattr(settings, ...) on
+# every request. The cache is dropped when a setting changes (override_settings in
+# tests), and the values are validated at startup by the system checks in checks.py.
+# The older top-level names (`LOGIN_EMAIL_<KEY>`, `USE_X_FORWARDED_FOR`) still work,
+# `LOGIN_EMAIL` wins when both are set.
+import functools
+import ipaddress
+import typing as t
+from dataclasses import dataclass, fields
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+SETTING = "LOGIN_EMAIL"
+
+Number = (int, float)
+Network = t.Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@dataclass(frozen=True)
+class Config(object):
+  # tokens and limits
+  token_ttl_minutes: int = 10
+  cooldown_minutes: t.Optional[int] = None
+  cooldown_backend: str = "cache"
+  rate_limit_times: int = 3
+  rate_limit_minutes: int = 10
+  verify_url: str = "http://127.0.0.1:8000/account/verify?token="
+  verify_confirm: bool = False
+  verify_failure_limit: int = 10
+  verify_failure_minutes: int = 10
+  verify_negative_ttl: int = 300
+  # error pages rendered once and kept, see rejections.reject
+  cache_rejections: bool = True
+  # "cache", "bloom" or "off", see replay.py
+  replay_filter: str = "cache"
+  replay_bloom_capacity: int = 100000
+  replay_false_positive_rate: float = 0.001
+  # "record" (one EmailRecord per email) or "table" (EmailToken rows)
+  token_store: str = "record"
+  token_max_per_email: int = 5
+
+  # infrastructure
+  use_x_forwarded_for: bool = False
+  trusted_proxies: t.Tuple[Network, ...] = ()
+  cache_alias: str = "default"
+  read_database: t.Optional[str] = None
+  batch_size: int = 1000
+
+  # sending
+  send_timeout: t.Optional[float] = None
+  breaker_failure_rate: float = 0.5
+  breaker_min_calls: int = 5
+  breaker_window: int = 60
+  breaker_reset_timeout: float = 30
+  # health checks of HealthView, see health.py
+  health_cache_seconds: float = 5
+  health_smtp: bool = False
+  health_thresholds_ms: t.Optional[t.Dict[str, float]] = None
+  # warm the process from AppConfig.ready, see warmup.py
+  warm_up_on_ready: bool = False
+  # adaptive concurrency limits of the views, see shedding.py
+  load_shedding: bool = False
+  shed_initial_limit: int = 20
+  shed_min_limit: int = 1
+  shed_max_limit: int = 200
+  shed_target_ms: float = 500
+  shed_backoff: float = 0.9
+
+  # "sync" sends in the request, "async" queues on smtp.py
+  mail_dispatch: str = "sync"
+  smtp_connections: int = 4
+  smtp_messages_per_connection: int = 100
+  smtp_queue_size: int = 1000
+  smtp_idle_timeout: float = 30
+  # recipient domain -> messages per second, "*" for the others
+  smtp_domain_rates: t.Optional[t.Dict[str, float]] = None
+  smtp_domain_burst: int = 10
+  smtp_domain_connections: t.Optional[int] = None
+  smtp_deferral_seconds: float = 60
+  smtp_max_deferrals: int = 3
+  # "login", "register", "bulk" -> weight, and sessions at once
+  smtp_priority_weights: t.Optional[t.Dict[str, float]] = None
+  smtp_priority_connections: t.Optional[t.Dict[str, int]] = None
+
+  # signals, "sync" or "async"
+  signal_dispatch: str = "sync"
+  signal_workers: int = 2
+  signal_queue_size: int = 1000
+
+  # audit log of attempts
+  audit: bool = False
+  audit_buffer_size: int = 10000
+  audit_flush_size: int = 500
+  audit_flush_interval_ms: int = 1000
+  audit_retention_days: int = 90
+
+  # tenants, see tenants.py
+  tenant_resolver: t.Optional[str] = None
+  tenant_loader: t.Optional[str] = None
+  tenants: t.Optional[t.Dict[str, t.Dict[str, t.Any]]] = None
+  tenant_cache_size: int = 1024
+
+  # email domains
+  domain_blocklist: t.Optional[str] = None
+  domain_allowlist: t.Optional[str] = None
+  domain_reload_interval: float = 60
+
+
+def _positive(v) -> bool:
+  return v > 0
+
+
+def _rate(v) -> bool:
+  return 0 < v <= 1
+
+
+def _networks(v) -> bool:
+  try:
+    parse_networks(v)
+  except (AttributeError, ValueError):
+    return False
+  return True
+
+
+def _domain_rates(v) -> bool:
+  return all(
+    isinstance(r, Number) and not isinstance(r, bool) and r > 0 for r in v.values()
+  )
+
+
+def _priorities(v, types) -> bool:
+  return all(
+    k in ("login", "register", "bulk")
+    and isinstance(n, types)
+    and not isinstance(n, bool)
+    and n > 0
+    for k, n in v.items()
+  )
+
+
+def _health_thresholds(v) -> bool:
+  return all(
+    k in ("database", "cache", "token", "smtp")
+    and isinstance(n, Number)
+    and not isinstance(n, bool)
+    and n > 0
+    for k, n in v.items()
+  )
+
+
+def _cache_alias(v) -> bool:
+  return v in settings.CACHES
+
+
+def _database(v) -> bool:
+  return v in settings.DATABASES
+
+
+# key -> (types, check, description); None is allowed where the default is None.
+SCHEMA: t.Dict[str, t.Tuple[t.Any, t.Optional[t.Callable[[t.Any], bool]], str]] = {
+  "TOKEN_TTL_MINUTES": (int, _positive, "a positive integer"),
+  "COOLDOWN_MINUTES": (int, _positive, "a positive integer"),
+  "COOLDOWN_BACKEND": (
+    str,
+    lambda v: v in ("cache", "database"),
+    '"cache" or "database"',
+  ),
+  "RATE_LIMIT_TIMES": (int, _positive, "a positive integer"),
+  "RATE_LIMIT_MINUTES": (int, _positive, "a positive integer"),
+  "VERIFY_URL": (str, None, "a string"),
+  "VERIFY_CONFIRM": (bool, None, "a boolean"),
+  "VERIFY_FAILURE_LIMIT": (int, _positive, "a positive integer"),
+  "VERIFY_FAILURE_MINUTES": (int, _positive, "a positive integer"),
+  "VERIFY_NEGATIVE_TTL": (int, lambda v: v >= 0, "a non-negative integer"),
+  "CACHE_REJECTIONS": (bool, None, "a boolean"),
+  "REPLAY_FILTER": (
+    str,
+    lambda v: v in ("cache", "bloom", "off"),
+    '"cache", "bloom" or "off"',
+  ),
+  "REPLAY_BLOOM_CAPACITY": (int, _positive, "a positive integer"),
+  "REPLAY_FALSE_POSITIVE_RATE": (Number, lambda v: 0 < v < 1, "a number in (0, 1)"),
+  "TOKEN_STORE": (str, lambda v: v in ("record", "table"), '"record" or "table"'),
+  "TOKEN_MAX_PER_EMAIL": (int, _positive, "a positive integer"),
+  "USE_X_FORWARDED_FOR": (bool, None, "a boolean"),
+  "TRUSTED_PROXIES": ((list, tuple), _networks, "a list of CIDR networks"),
+  "CACHE_ALIAS": (str, _cache_alias, "an alias in CACHES"),
+  "READ_DATABASE": (str, _database, "an alias in DATABASES"),
+  "BATCH_SIZE": (int, _positive, "a positive integer"),
+  "SEND_TIMEOUT": (Number, _positive, "a positive number"),
+  "BREAKER_FAILURE_RATE": (Number, _rate, "a number in (0, 1]"),
+  "BREAKER_MIN_CALLS": (int, _positive, "a positive integer"),
+  "BREAKER_WINDOW": (int, _positive, "a positive integer"),
+  "BREAKER_RESET_TIMEOUT": (Number, _positive, "a positive number"),
+  "HEALTH_CACHE_SECONDS": (Number, lambda v: v >= 0, "a non-negative number"),
+  "HEALTH_SMTP": (bool, None, "a boolean"),
+  "HEALTH_THRESHOLDS_MS": (
+    dict,
+    _health_thresholds,
+    'a dict of "database", "cache", "token" or "smtp" -> positive number',
+  ),
+  "WARM_UP_ON_READY": (bool, None, "a boolean"),
+  "LOAD_SHEDDING": (bool, None, "a boolean"),
+  "SHED_INITIAL_LIMIT": (int, _positive, "a positive integer"),
+  "SHED_MIN_LIMIT": (int, _positive, "a positive integer"),
+  "SHED_MAX_LIMIT": (int, _positive, "a positive integer"),
+  "SHED_TARGET_MS": (Number, _positive, "a positive number"),
+  "SHED_BACKOFF": (Number, lambda v: 0 < v < 1, "a number in (0, 1)"),
+  "MAIL_DISPATCH": (str, lambda v: v in ("sync", "async"), '"sync" or "async"'),
+  "SMTP_CONNECTIONS": (int, _positive, "a positive integer"),
+  "SMTP_MESSAGES_PER_CONNECTION": (int, _positive, "a positive integer"),
+  "SMTP_QUEUE_SIZE": (int, _positive, "a positive integer"),
+  "SMTP_IDLE_TIMEOUT": (Number, _positive, "a positive number"),
+  "SMTP_DOMAIN_RATES": (dict, _domain_rates, "a dict of domain -> positive number"),
+  "SMTP_DOMAIN_BURST": (int, _positive, "a positive integer"),
+  "SMTP_DOMAIN_CONNECTIONS": (int, _positive, "a positive integer"),
+  "SMTP_DEFERRAL_SECONDS": (Number, _positive, "a positive number"),
+  "SMTP_MAX_DEFERRALS": (int, lambda v: v >= 0, "a non-negative integer"),
+  "SMTP_PRIORITY_WEIGHTS": (
+    dict,
+    lambda v: _priorities(v, Number),
+    'a dict of "login", "register" or "bulk" -> positive number',
+  ),
+  "SMTP_PRIORITY_CONNECTIONS": (
+    dict,
+    lambda v: _priorities(v, int),
+    'a dict of "login", "register" or "bulk" -> positive integer',
+  ),
+  "SIGNAL_DISPATCH": (str, lambda v: v in ("sync", "async"), '"sync" or "async"'),
+  "SIGNAL_WORKERS": (int, _positive, "a positive integer"),
+  "SIGNAL_QUEUE_SIZE": (int, _positive, "a positive integer"),
+  "AUDIT": (bool, None, "a boolean"),
+  "AUDIT_BUFFER_SIZE": (int, _positive, "a positive integer"),
+  "AUDIT_FLUSH_SIZE": (int, _positive, "a positive integer"),
+  "AUDIT_FLUSH_INTERVAL_MS": (int, _positive, "a positive integer"),
+  "AUDIT_RETENTION_DAYS": (int, _positive, "a positive integer"),
+  "TENANT_RESOLVER": (str, None, "a dotted path"),
+  "TENANT_LOADER": (str, None, "a dotted path"),
+  "TENANTS": (dict, None, "a dict of tenant id -> options"),
+  "TENANT_CACHE_SIZE": (int, _positive, "a positive integer"),
+  "DOMAIN_BLOCKLIST": (str, None, "a file path"),
+  "DOMAIN_ALLOWLIST": (str, None, "a file path"),
+  "DOMAIN_RELOAD_INTERVAL": (Number, lambda v: v >= 0, "a non-negative number"),
+}
+
+# top-level settings kept for compatibility.
+LEGACY = {key: f"LOGIN_EMAIL_{key}" for key in SCHEMA}
+LEGACY["USE_X_FORWARDED_FOR"] = "USE_X_FORWARDED_FOR"
+
+_defaults = {f.name: f.default for f in fields(Config)}
+
+
+def parse_networks(cidrs: t.Iterable[str]) -> t.Tuple[Network, ...]:
+  """`["10.0.0.0/8", "::1"]` -> ip networks, a single address is a /32 or /128."""
+  return tuple(ipaddress.ip_network(c.strip(), strict=False) for c in cidrs)
+
+
+# keys converted once when the config is built.
+PARSERS: t.Dict[str, t.Callable[[t.Any], t.Any]] = {"TRUSTED_PROXIES": parse_networks}
+
+
+def read_settings() -> t.Dict[str, t.Any]:
+  """The configured keys, from the legacy names and `LOGIN_EMAIL`."""
+  values = {
+    key: getattr(settings, name)
+    for key, name in LEGACY.items()
+    if hasattr(settings, name)
+  }
+  values.update(getattr(settings, SETTING, None) or {})
+  return values
+
+
+def unknown_keys(values: t.Dict[str, t.Any]) -> t.List[str]:
+  return [key for key in values if key not in SCHEMA]
+
+
+def validate(values: t.Dict[str, t.Any]) -> t.List[str]:
+  """Return the problems of `values`, empty if they are fine. Unknown keys are ignored."""
+  problems = []
+  for key, value in values.items():
+    if key not in SCHEMA:
+      continue
+    types, check, description = SCHEMA[key]
+    if value is None and _defaults[key.lower()] is None:
+      continue
+    # bool is an int, but not a number of minutes.
+    ok = isinstance(value, types) and (types is bool or not isinstance(value, bool))
+    if not ok or (check is not None and not check(value)):
+      problems.append(f"{key} must be {description}, got {value!r}.")
+  return problems
+
+
+@functools.lru_cache(maxsize=None)
+def get_config() -> Config:
+  values = read_settings()
+  problems = validate(values)
+  if problems:
+    raise ImproperlyConfigured(f"{SETTING}: {' '.join(problems)}")
+  return Config(
+    **{
+      key.lower(): PARSERS[key](v) if key in PARSERS else v
+      for key, v in values.items()
+      if key in SCHEMA
+    }
+  )
+
+
+@receiver(setting_changed)
+def _reload_on_setting_changed(setting, **kwargs):
+  if (
+    setting == SETTING or setting in LEGACY.values() or setting in ("CACHES", "DATABASES")
+  ):
+    get_config.cache_clear()
@@ -0,0 +1,51 @@
+# Per-email cooldown between two login mails, kept in the cache.
+#
+# `cache.add()` is atomic on every Django cache backend, so claiming the cooldown and
+# checking it is one round trip. Rejected attempts never touch the database.
+import hashlib
+
+from django.core.cache import caches
+
+from . import conf
+
+
+def normalize_email(email: str) -> str:
+  return email.strip().lower()
+
+
+class CacheCooldown(object):
+  """Cooldown of each email, stored in the cache with a TTL."""
+
+  prefix = "login_email:cooldown:"
+
+  def __init__(self, cache_alias: str = "default") -> None:
+    self.cache_alias = cache_alias
+
+  @property
+  def cache(self):
+    return caches[self.cache_alias]
+
+  def key(self, email: str) -> str:
+    # hash the email, keys stay short and safe for memcached.
+    digest = hashlib.sha256(normalize_email(email).encode("utf-8")).hexdigest()
+    return self.prefix + digest
+
+  def claim(self, email: str, seconds: int) -> bool:
+    """Start the cooldown. Return False if it is already running."""
+    return self.cache.add(self.key(email), 1, seconds)
+
+  def extend(self, email: str, seconds: int) -> None:
+    """Keep the cooldown for `seconds`, e.g. to follow the database record."""
+    self.cache.set(self.key(email), 1, max(int(seconds), 1))
+
+  def release(self, email: str) -> None:
+    self.cache.delete(self.key(email))
+
+
+def get_cooldown_backend() -> str:
+  """`cache` or `database`"""
+  return conf.get_config().cooldown_backend
+
+
+def get_cooldown() -> CacheCooldown:
+  return CacheCooldown(conf.get_config().cache_alias)
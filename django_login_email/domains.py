@@ -0,0 +1,167 @@
+# Blocklist / allowlist of email domains.
+#
+# Lists are plain text files, one domain per line, loaded once per process into a
+# frozenset. A domain matches if it, or any parent domain, is in the set, so
+# `mailinator.com` also covers `eu.mailinator.com`.
+#
+# A list that cannot be read (missing, unreadable, deleted while running) is logged
+# once and the previous lists are kept; a missing allowlist at startup allows nothing.
+# `manage.py check` reports such paths.
+import logging
+import os
+import threading
+import time
+import typing as t
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import conf
+
+logger = logging.getLogger(__name__)
+
+Domains = t.FrozenSet[str]
+
+
+def normalize_domain(domain: str) -> str:
+  return domain.strip().strip(".").lower()
+
+
+def get_domain(email: str) -> str:
+  """Read the domain part from the email"""
+  return normalize_domain(email.rpartition("@")[2])
+
+
+def load_domains(path: str) -> Domains:
+  """Read one domain per line. `#` starts a comment."""
+  with open(path, encoding="utf-8") as f:
+    domains = (normalize_domain(line.split("#", 1)[0]) for line in f)
+    return frozenset(d for d in domains if d)
+
+
+def iter_suffixes(domain: str) -> t.Iterator[str]:
+  """a.b.com -> a.b.com, b.com, com"""
+  yield domain
+  i = domain.find(".")
+  while i != -1:
+    yield domain[i + 1 :]
+    i = domain.find(".", i + 1)
+
+
+def match(domain: str, domains: Domains) -> bool:
+  """check if the domain or one of its parent domains is in `domains`."""
+  return any(s in domains for s in iter_suffixes(domain))
+
+
+class DomainFilter(object):
+  """Reject emails whose domain is blocked, or not allowed.
+
+  The files are stat'ed at most once every `reload_interval` seconds, and reloaded
+  when their mtime changes, so long running workers pick up new lists without restart.
+  """
+
+  def __init__(
+    self,
+    blocklist_path: t.Optional[str] = None,
+    allowlist_path: t.Optional[str] = None,
+    reload_interval: float = 60,
+  ) -> None:
+    self.blocklist_path = blocklist_path
+    self.allowlist_path = allowlist_path
+    self.reload_interval = reload_interval
+
+    self.blocklist: Domains = frozenset()
+    self.allowlist: t.Optional[Domains] = None
+    self._mtimes: t.Tuple[t.Optional[float], ...] = ()
+    self._checked_at = 0.0
+    self._lock = threading.Lock()
+    self.reload_or_keep()
+
+  def _stat(self) -> t.Tuple[t.Optional[float], ...]:
+    mtimes = []
+    for path in (self.blocklist_path, self.allowlist_path):
+      try:
+        mtimes.append(os.stat(path).st_mtime if path else None)
+      except OSError:
+        mtimes.append(None)
+    return tuple(mtimes)
+
+  def reload(self) -> None:
+    """load the lists from disk. Build the new sets first, then swap them in.
+
+    Raises OSError when a list cannot be read, the current lists are kept.
+    """
+    with self._lock:
+      mtimes = self._stat()
+      blocklist = (
+        load_domains(self.blocklist_path) if self.blocklist_path else frozenset()
+      )
+      allowlist = load_domains(self.allowlist_path) if self.allowlist_path else None
+      self.blocklist, self.allowlist = blocklist, allowlist
+      self._mtimes = mtimes
+      self._checked_at = time.monotonic()
+
+  def reload_or_keep(self) -> None:
+    """`reload`, but keep the current lists and log when a list cannot be read."""
+    try:
+      self.reload()
+    except OSError as e:
+      with self._lock:
+        # retried once a file changes, not on every check.
+        self._mtimes = self._stat()
+        self._checked_at = time.monotonic()
+        if self.allowlist_path and self.allowlist is None:
+          self.allowlist = frozenset()
+      logger.error("Failed to load email domain list, keeping the current one: %s", e)
+
+  def maybe_reload(self) -> None:
+    now = time.monotonic()
+    if now - self._checked_at < self.reload_interval:
+      return
+    self._checked_at = now
+    if self._stat() != self._mtimes:
+      self.reload_or_keep()
+
+  def is_allowed_domain(self, domain: str) -> bool:
+    self.maybe_reload()
+    domain = normalize_domain(domain)
+    if self.allowlist is not None and not match(domain, self.allowlist):
+      return False
+    return not match(domain, self.blocklist)
+
+  def is_allowed(self, email: str) -> bool:
+    return self.is_allowed_domain(get_domain(email))
+
+
+_filter: t.Optional[DomainFilter] = None
+_filter_lock = threading.Lock()
+
+
+def get_domain_filter() -> DomainFilter:
+  """The process wide filter, built from settings on first use."""
+  global _filter
+  if _filter is None:
+    with _filter_lock:
+      if _filter is None:
+        config = conf.get_config()
+        _filter = DomainFilter(
+          blocklist_path=config.domain_blocklist,
+          allowlist_path=config.domain_allowlist,
+          reload_interval=config.domain_reload_interval,
+        )
+  return _filter
+
+
+def reset_domain_filter() -> None:
+  global _filter
+  _filter = None
+
+
+def is_allowed_email(email: str) -> bool:
+  return get_domain_filter().is_allowed(email)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+  if setting == conf.SETTING or setting.startswith("LOGIN_EMAIL_DOMAIN_"):
+    reset_domain_filter()
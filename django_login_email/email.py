@@ -1,14 +1,27 @@
 import abc
 import datetime
+import functools
+import logging
 import string
 import typing as t
+from concurrent.futures import Future
 from dataclasses import dataclass
 from datetime import timezone
 
 from django.contrib.auth import get_user_model, login, logout
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import router
+from django.utils.html import strip_tags
 
-from . import errors, token
+from . import breaker, conf, cooldown, errors, rejections, render, replay, signals, token
+
+if t.TYPE_CHECKING:
+  from . import smtp
+
+logger = logging.getLogger(__name__)
+
+# default cooldown of a store with several outstanding tokens, see get_cooldown_minutes.
+TABLE_COOLDOWN_MINUTES = 1
 
 
 class EmailInfo(object):
@@ -20,18 +33,43 @@ class EmailInfo(object):
   welcome_text: str
   system_name: str
 
-  url: str = "http://127.0.0.1:8000/account/verify?token="
+  mail_type: str
   login_message: string.Template = string.Template('Click <a href="$url$token">Link</a>')
 
+  text_template_name: str = "login_email/mail/message.txt"
+  html_template_name: str = "login_email/mail/message.html"
+
+  @property
+  def url(self) -> str:
+    """Verify url, `LOGIN_EMAIL["VERIFY_URL"]` unless set on the class or instance."""
+    return self.__dict__.get("_url") or conf.get_config().verify_url
+
+  @url.setter
+  def url(self, value: str):
+    self._url = value
+
   def build_message(self, token):
     self.message = self.welcome_text + self.login_message.substitute(
       url=self.url, token=token
     )
 
+  def render(self, token: str) -> t.Tuple[str, str]:
+    """Return the (text, html) bodies.
+
+    The templates are compiled once per class and language, see `render.get_compiled`.
+    Subclasses overriding `build_message` keep their html, the text is stripped from it.
+    """
+    if type(self).build_message is not EmailInfo.build_message:
+      self.build_message(token)
+      return strip_tags(self.message), self.message
+    return render.get_compiled(self).render(token)
+
 
 class EmailLoginInfo(EmailInfo):
   """Email info for login."""
 
+  mail_type = "login"
+
   def __init__(self):
     self.subject = f"Welcome to {self.system_name}! Please click the link below to login."
     self.from_email = "noreply@example.com"
@@ -43,6 +81,8 @@ class EmailLoginInfo(EmailInfo):
 class EmailRegisterInfo(EmailInfo):
   """Email info for register."""
 
+  mail_type = "register"
+
   def __init__(self):
     self.subject = (
       f"Welcome to {self.system_name}! Please click the link below to register."
@@ -53,9 +93,12 @@ class EmailRegisterInfo(EmailInfo):
     )
 
 
+@functools.lru_cache(maxsize=128)
 def get_info_class(
   sys_name: str,
 ) -> t.Tuple[t.Type[EmailLoginInfo], t.Type[EmailRegisterInfo]]:
+  """Info classes for `sys_name`. Same name, same classes."""
+
   class MyLoginInfo(EmailLoginInfo):
     system_name = sys_name
 
@@ -70,7 +113,7 @@ class TimeLimit(object):
   minutes: int = 10
 
 
-@dataclass
+@dataclass(slots=True)
 class MailRecord(object):
   expired_time: t.Optional[datetime.datetime]
   email: str
@@ -86,6 +129,13 @@ class MailRecordAPI(abc.ABC):
     """Get the mail record from the database."""
     raise NotImplementedError("You must implement get_mail_record")
 
+  def get_mail_record_for_write(self, mail: str) -> MailRecord:
+    """Get the mail record that a write decision depends on.
+
+    Read it from the primary database when reads go to a replica.
+    """
+    return self.get_mail_record(mail)
+
   @abc.abstractmethod
   def save_token(self, token: token.TokenDict):
     """to save token in the database or somewhere."""
@@ -96,6 +146,23 @@ class MailRecordAPI(abc.ABC):
     """Every token should only login once"""
     raise NotImplementedError("")
 
+  def discard_token(self, token: token.TokenDict):
+    """Undo `save_token` for a mail that was not sent, so the cooldown ends with it.
+
+    The default keeps the token: the cooldown then runs until it expires.
+    """
+
+  def consumes_tokens(self) -> bool:
+    """True if `consume_token` checks and disables a token in one step.
+
+    Verify then neither reads the mail record nor calls `disable_token`.
+    """
+    return False
+
+  def consume_token(self, token: token.TokenDict):
+    """Disable an outstanding token, raise ValidatedError or TokenError otherwise."""
+    raise NotImplementedError("You must implement consume_token")
+
 
 class EmailFunc(MailRecordAPI):
   """Mixin to send email."""
@@ -104,28 +171,100 @@ class EmailFunc(MailRecordAPI):
   register_info_class: t.Type[EmailRegisterInfo]
 
   tl: TimeLimit
+  cooldown_backend: t.Optional[str] = None
+  # database alias for read-only lookups, None leaves it to the routers.
+  read_db: t.Optional[str] = None
 
-  def check_user(self, email) -> bool:
+  def check_user(self, email, using: t.Optional[str] = None) -> bool:
     """check if the user exists."""
     User = get_user_model()
-    u = User.objects.filter(email=email)
+    u = User.objects.using(using or self.read_db).filter(email=email)
     return u.exists()
 
+  def get_cooldown_backend(self) -> str:
+    """`cache` claims the cooldown in the cache, `database` only reads EmailRecord."""
+    return self.cooldown_backend or cooldown.get_cooldown_backend()
+
+  def get_cooldown(self) -> cooldown.CacheCooldown:
+    return cooldown.get_cooldown()
+
+  def get_cooldown_minutes(self) -> int:
+    """`LOGIN_EMAIL["COOLDOWN_MINUTES"]`, if unset the token TTL.
+
+    A store that keeps several outstanding tokens (`consumes_tokens`) defaults to
+    TABLE_COOLDOWN_MINUTES instead: a cooldown of the TTL would allow one link at a time.
+    """
+    minutes = conf.get_config().cooldown_minutes
+    if minutes is not None:
+      return minutes
+    if self.consumes_tokens():
+      return min(TABLE_COOLDOWN_MINUTES, self.tl.minutes)
+    return self.tl.minutes
+
   def check_could_send(self, email) -> bool:
-    """check if the email could send."""
-    re = self.get_mail_record(email)
+    """check if the email could send.
+
+    With the cache backend, a running cooldown is rejected without reading the
+    database. The mail record is only read once the cooldown is claimed.
+    """
+    cooldown_minutes = self.get_cooldown_minutes()
+    use_cache = self.get_cooldown_backend() == "cache"
+    if use_cache and not self.get_cooldown().claim(email, cooldown_minutes * 60):
+      return False
+
+    # the record decides whether a new token is saved, read it from the primary.
+    re = self.get_mail_record_for_write(email)
     # TODO: if other user send email, the current user could not sign in.
-    if (re.expired_time is None) or (
-      re.expired_time <= datetime.datetime.now(tz=timezone.utc)
-    ):
+    # the "table" token store keeps the previous tokens valid, see TOKEN_STORE.
+    now = datetime.datetime.now(tz=timezone.utc)
+    if re.expired_time is None:
       return True
+    # the token was saved `tl.minutes` before it expires.
+    ready_at = re.expired_time - datetime.timedelta(
+      minutes=self.tl.minutes - cooldown_minutes
+    )
+    if ready_at <= now:
+      return True
+    if use_cache:
+      # the cache lost the cooldown, follow the database record.
+      self.get_cooldown().extend(email, (ready_at - now).total_seconds())
     return False
 
+  def release_cooldown(self, email):
+    """allow to send again, e.g. when the mail failed to send."""
+    if self.get_cooldown_backend() == "cache":
+      self.get_cooldown().release(email)
+
   def get_token_manager(self) -> token.TokenManager:
     return token.TokenManager(self.tl.minutes)
 
-  def send_valid(self, email: str, mail_type: str):
-    """send login/register mail."""
+  def get_breaker(self) -> breaker.CircuitBreaker:
+    return breaker.get_breaker()
+
+  def get_mail_connection(self):
+    """Mail connection with `LOGIN_EMAIL_SEND_TIMEOUT`, or None for the default one."""
+    timeout = conf.get_config().send_timeout
+    if timeout is None:
+      return None
+    return get_connection(timeout=timeout)
+
+  def get_mail_sender(self) -> "smtp.AsyncSMTPSender":
+    """The concurrent sender of `send_valid_later` and `send_valid_bulk`.
+
+    Raise EmailSendError if it cannot start, e.g. without aiosmtplib.
+    """
+    from . import smtp
+
+    try:
+      return smtp.get_sender()
+    except (ImportError, OSError, RuntimeError) as e:
+      logger.error("Cannot start the mail sender: %s", e)
+      raise errors.EmailSendError(f"Cannot start the mail sender: {e}") from e
+
+  def make_mail(
+    self, email: str, mail_type: str, connection=None
+  ) -> EmailMultiAlternatives:
+    """Save a new token of the email, and return its mail."""
     if mail_type == "login":
       e = self.login_info_class()
     elif mail_type == "register":
@@ -133,16 +272,114 @@ class EmailFunc(MailRecordAPI):
     else:
       raise ValueError(f"Invalid mail type: {mail_type}")
 
+    saved: t.List[token.TokenDict] = []
+
+    def save_token(token_d: token.TokenDict):
+      self.save_token(token_d)
+      saved.append(token_d)
+
     m = self.get_token_manager()
-    encrypt_token = m.encrypt_mail(email, mail_type, self.save_token)
-    e.build_message(encrypt_token)
+    try:
+      encrypt_token = m.encrypt_mail(email, mail_type, save_token)
+      text, html = e.render(encrypt_token)
+    except Exception:
+      for token_d in saved:
+        self.discard_token(token_d)
+      raise
+
+    msg = EmailMultiAlternatives(
+      e.subject, text, e.from_email, [email], connection=connection
+    )
+    msg.attach_alternative(html, "text/html")
+    # for `discard_mail`, if the mail is not sent.
+    msg.login_email_tokens = saved
+    return msg
+
+  def discard_mail(self, msg: EmailMultiAlternatives):
+    """Discard the tokens of a mail that was not sent, see `discard_token`."""
+    for token_d in getattr(msg, "login_email_tokens", ()):
+      try:
+        self.discard_token(token_d)
+      except Exception:
+        logger.exception("Cannot discard the token of an unsent mail")
+
+  def check_breaker(self) -> breaker.CircuitBreaker:
+    # fail fast, before the token is saved.
+    b = self.get_breaker()
+    if not b.allow():
+      raise errors.CircuitOpenError("Mail relay is failing, skip sending.")
+    return b
 
-    msg = EmailMessage(e.subject, e.message, e.from_email, [email])
-    msg.content_subtype = "html"
+  def send_valid(self, email: str, mail_type: str):
+    """send login/register mail."""
+    if mail_type not in ("login", "register"):
+      raise ValueError(f"Invalid mail type: {mail_type}")
+    b = self.check_breaker()
+    msg = self.make_mail(email, mail_type, connection=self.get_mail_connection())
     try:
       msg.send()
     except Exception as e:
+      b.record_failure()
+      self.discard_mail(msg)
       raise errors.EmailSendError(f"Failed to send email: {e}") from e
+    b.record_success()
+
+  def on_mail_sent(self, result: "smtp.SendResult", mail_type: str):
+    """Result of a queued mail, called on a worker thread."""
+    b = self.get_breaker()
+    if result.ok:
+      b.record_success()
+      for email in result.message.to:
+        signals.emit(signals.mail_sent, self.__class__, email=email, mail_type=mail_type)
+      return
+    b.record_failure()
+    # allow to ask again, the mail never arrived.
+    self.discard_mail(result.message)
+    for email in result.message.to:
+      self.release_cooldown(email)
+    logger.error(f"Failed to send email to {result.message.to}: {result.error!r}")
+
+  def send_valid_later(self, email: str, mail_type: str) -> "Future[smtp.SendResult]":
+    """Queue the mail on the concurrent sender and return at once.
+
+    Raise EmailSendError if the queue is full. The result goes to `on_mail_sent`.
+    """
+    self.check_breaker()
+    # before the token is saved.
+    sender = self.get_mail_sender()
+    msg = self.make_mail(email, mail_type)
+    try:
+      return sender.submit(
+        msg,
+        callback=functools.partial(self.on_mail_sent, mail_type=mail_type),
+        priority=mail_type,
+      )
+    except Exception:
+      # e.g. the queue is full.
+      self.discard_mail(msg)
+      raise
+
+  def send_valid_bulk(
+    self, emails: t.Iterable[str], mail_type: str
+  ) -> t.List["smtp.SendResult"]:
+    """Send a mail to each email on the concurrent sender, and wait for them."""
+    self.check_breaker()
+    sender = self.get_mail_sender()
+    msgs: t.List[EmailMultiAlternatives] = []
+    try:
+      for email in emails:
+        msgs.append(self.make_mail(email, mail_type))
+    except Exception:
+      # none is sent, the tokens saved so far go too.
+      for msg in msgs:
+        self.discard_mail(msg)
+      raise
+    # after the interactive mails, see SMTP_PRIORITY_WEIGHTS.
+    return sender.send_messages(
+      msgs,
+      callback=functools.partial(self.on_mail_sent, mail_type=mail_type),
+      priority="bulk",
+    )
 
   def send_login_mail(self, email: str):
     """
@@ -153,12 +390,27 @@ class EmailFunc(MailRecordAPI):
       mail_type = "register"
     else:
       mail_type = "login"
+    sender = self.__class__
+    signals.emit(signals.mail_requested, sender, email=email, mail_type=mail_type)
 
     # if the email could not send, raise exception.
     if not self.check_could_send(email=email):
-      raise errors.RateLimitError(f"Cannot send. Wait {self.tl.minutes} minutes.")
+      signals.emit(signals.rate_limited, sender, scope="email", key=email)
+      raise errors.RateLimitError(
+        f"Cannot send. Wait {self.get_cooldown_minutes()} minutes."
+      )
 
-    self.send_valid(email, mail_type)
+    try:
+      if conf.get_config().mail_dispatch == "async":
+        # mail_sent is emitted by on_mail_sent, once the mail is sent.
+        self.send_valid_later(email, mail_type)
+        return
+      self.send_valid(email, mail_type)
+    except Exception:
+      # the token of the mail is discarded, the claim too.
+      self.release_cooldown(email)
+      raise
+    signals.emit(signals.mail_sent, sender, email=email, mail_type=mail_type)
 
 
 class EmailVerifyMixin(MailRecordAPI):
@@ -166,31 +418,96 @@ class EmailVerifyMixin(MailRecordAPI):
 
   tl: TimeLimit
 
+  def get_token_manager(self) -> token.TokenManager:
+    return token.TokenManager(self.tl.minutes)
+
+  def get_negative_cache(self) -> rejections.NegativeCache:
+    return rejections.get_negative_cache()
+
+  def get_replay_filter(self) -> t.Optional[replay.ReplayFilter]:
+    return replay.get_replay_filter(self.tl.minutes)
+
+  def peek_token(self, token_v: str) -> token.TokenDict:
+    """Decrypt the token and check its expiry, without reading the database.
+
+    A token that passes could still be disabled or validated, only verify_token knows.
+    """
+    self.get_negative_cache().check(token_v)
+    m = self.get_token_manager()
+    token_d = m.transform_token(m.decrypt_token(token=token_v))
+    if token_d["expired_time"] <= int(datetime.datetime.now().timestamp()):
+      raise errors.TokenError("Token expired.")
+    return token_d
+
   def verify_token(self, token_v: str):
-    m = token.TokenManager(self.tl.minutes)
+    """Verify the token and return its user.
+
+    Rejected and consumed tokens are kept in the negative cache for
+    `LOGIN_EMAIL["VERIFY_NEGATIVE_TTL"]` seconds, and refused before any decrypt.
+    """
+    neg = self.get_negative_cache()
+    try:
+      neg.check(token_v)
+      u, token_d = self._verify_token(token_v)
+    except (errors.LoginMailError, ValueError, KeyError) as e:
+      if not isinstance(e, errors.InactiveUserError):
+        neg.add(token_v, validated=isinstance(e, errors.ValidatedError))
+      signals.emit(
+        signals.token_rejected, self.__class__, reason=type(e).__name__, error=e
+      )
+      raise
+    neg.add(token_v, validated=True)
+    signals.emit(
+      signals.token_verified,
+      self.__class__,
+      email=token_d["email"],
+      mail_type=token_d.get("mail_type"),
+      user=u,
+    )
+    return u
+
+  def _verify_token(self, token_v: str):
+    m = self.get_token_manager()
     token_str = m.decrypt_token(token=token_v)
     token_d = m.transform_token(token_str)
 
-    mr = self.get_mail_record(m.get_mail(token_d))
-    if mr.validated:
+    # a consumed token is refused without reading the record.
+    replay_filter = self.get_replay_filter()
+    if replay_filter is not None and replay_filter.is_consumed(token_d["salt"]):
       raise errors.ValidatedError("Token already validated.")
 
-    token_d = m.check_token(token_d, lambda: mr.salt)
-    if token_d is None:
-      raise errors.TokenError("Invalid token.")
+    single_step = self.consumes_tokens()
+    if single_step:
+      # the token is authenticated, its expiry is checked without the database.
+      if token_d["expired_time"] <= int(datetime.datetime.now().timestamp()):
+        raise errors.TokenError("Token expired.")
+    else:
+      # the salt check decides whether the token is disabled, read it from the primary.
+      mr = self.get_mail_record_for_write(m.get_mail(token_d))
+      if mr.validated:
+        raise errors.ValidatedError("Token already validated.")
+
+      token_d = m.check_token(token_d, lambda: mr.salt)
+      if token_d is None:
+        raise errors.TokenError("Invalid token.")
 
     User = get_user_model()
-    u = User.objects.filter(email=m.get_mail(token_d)).first()
-    if not u:
+    users = User.objects.db_manager(router.db_for_write(User))
+    u = users.filter(email=m.get_mail(token_d)).first()
+    if u is not None and not u.is_active:
+      raise errors.InactiveUserError("Inactive user, disallow login.")
+
+    if single_step:
+      self.consume_token(token_d)
+    else:
+      self.disable_token(token=token_d)
+    if u is None:
       # if user not exist, create a new user.
       # support register by email.
       u = User.objects.create(username=m.get_mail(token_d), email=m.get_mail(token_d))
-
-    if not u.is_active:
-      raise errors.InactiveUserError("Inactive user, disallow login.")
-
-    self.disable_token(token=token_d)
-    return u
+    if replay_filter is not None:
+      replay_filter.add(token_d["salt"])
+    return u, token_d
 
   def verify_login_mail(self, request, token_v: str):
     """
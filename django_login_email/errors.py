@@ -32,3 +32,9 @@ class EmailSendError(LoginMailError):
   """When email sending fails"""
 
   pass
+
+
+class CircuitOpenError(EmailSendError):
+  """When the mail relay is failing, and sending is skipped"""
+
+  pass
@@ -1,22 +1,34 @@
 from django import forms
 
+from django_login_email import domains
+
 from . import register
 
 
-class LoginForm(forms.Form):
+class EmailDomainMixin(object):
+  """Reject blocked email domains before any DB or SMTP work."""
+
+  def clean_email(self):
+    email = self.cleaned_data["email"]
+    if not domains.is_allowed_email(email):
+      raise forms.ValidationError("This email domain is not allowed.")
+    return email
+
+
+class LoginForm(EmailDomainMixin, forms.Form):
   """Just check the login request."""
 
   email = forms.EmailField(label="email")
 
 
-class RegisterForm(forms.Form):
+class RegisterForm(EmailDomainMixin, forms.Form):
   """Just check the register request."""
 
   email = forms.EmailField(label="email")
 
   def is_valid(self) -> bool:
     res = super().is_valid()
-    if register.is_registered(self.cleaned_data["email"]):
+    if res and register.is_registered(self.cleaned_data["email"]):
       self.add_error("email", "User already registered.")
       return False
     return res
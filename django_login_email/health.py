@@ -0,0 +1,150 @@
+# Health of the process, for load balancer probes.
+#
+# Each check is timed against its threshold in `LOGIN_EMAIL["HEALTH_THRESHOLDS_MS"]`:
+#
+# - "database": a lookup of EmailRecord, on the read database.
+# - "cache": a set and get on the cache of the rate limits.
+# - "token": a token encrypted and decrypted.
+# - "smtp": a NOOP to the mail relay, with `LOGIN_EMAIL["HEALTH_SMTP"]` only.
+#
+# A failing check makes the process "error" (503, to be drained), a slow one
+# "degraded". The result is kept `HEALTH_CACHE_SECONDS`, so probes stay cheap and a
+# burst of them runs the checks once.
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+
+from django.core.cache import caches
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import conf, models, shedding, token
+
+logger = logging.getLogger(__name__)
+
+PROBE_EMAIL = "health@example.invalid"
+
+THRESHOLDS_MS = {"database": 100, "cache": 50, "token": 20, "smtp": 1000}
+
+
+class HealthCheckError(Exception):
+  pass
+
+
+def check_database() -> None:
+  models.EmailRecord.objects.filter(email=PROBE_EMAIL).exists()
+
+
+def check_cache() -> None:
+  cache = caches[conf.get_config().cache_alias]
+  key = f"login_email:health:{os.getpid()}"
+  value = time.time()
+  cache.set(key, value, 60)
+  if cache.get(key) != value:
+    raise HealthCheckError("cache did not return the value set")
+
+
+def check_token() -> None:
+  manager = token.TokenManager(1)
+  plain = manager.decrypt_token(
+    manager.encrypt_mail(PROBE_EMAIL, "login", lambda _: None)
+  )
+  if json.loads(plain)["email"] != PROBE_EMAIL:
+    raise HealthCheckError("token did not decrypt to its email")
+
+
+def check_smtp() -> None:
+  connection = get_connection(timeout=conf.get_config().send_timeout or 10)
+  connection.open()
+  try:
+    # only the SMTP backend has a session, e.g. the locmem one has nothing to ask.
+    session = getattr(connection, "connection", None)
+    if session is not None:
+      code, _ = session.noop()
+      if code != 250:
+        raise HealthCheckError(f"NOOP answered {code}")
+  finally:
+    connection.close()
+
+
+CHECKS: t.Dict[str, t.Callable[[], None]] = {
+  "database": check_database,
+  "cache": check_cache,
+  "token": check_token,
+  "smtp": check_smtp,
+}
+
+
+def get_thresholds() -> t.Dict[str, float]:
+  return {**THRESHOLDS_MS, **(conf.get_config().health_thresholds_ms or {})}
+
+
+def run_check(name: str, threshold_ms: float) -> t.Dict[str, t.Any]:
+  start = time.perf_counter()
+  error = None
+  try:
+    CHECKS[name]()
+  except Exception as e:
+    logger.warning("login_email health: %s failed", name, exc_info=True)
+    # the class only, the message may tell hosts or credentials to the prober.
+    error = type(e).__name__
+  ms = (time.perf_counter() - start) * 1000
+  result: t.Dict[str, t.Any] = {"ms": round(ms, 3), "threshold_ms": threshold_ms}
+  if error is not None:
+    result.update(status="error", error=error)
+  else:
+    result["status"] = "ok" if ms <= threshold_ms else "slow"
+  return result
+
+
+def run_checks(smtp: bool = False) -> t.Dict[str, t.Any]:
+  thresholds = get_thresholds()
+  names = [n for n in CHECKS if smtp or n != "smtp"]
+  checks = {name: run_check(name, thresholds[name]) for name in names}
+  statuses = {c["status"] for c in checks.values()}
+  if "error" in statuses:
+    status = "error"
+  elif "slow" in statuses:
+    status = "degraded"
+  else:
+    status = "ok"
+  return {
+    "status": status,
+    "checked_at": time.time(),
+    "checks": checks,
+    "limiters": shedding.metrics(),
+  }
+
+
+_results: t.Dict[bool, t.Tuple[float, t.Dict[str, t.Any]]] = {}
+_lock = threading.Lock()
+
+
+def get_health(smtp: t.Optional[bool] = None, clock=time.monotonic) -> t.Dict[str, t.Any]:
+  """The last result younger than `HEALTH_CACHE_SECONDS`, or a new one."""
+  c = conf.get_config()
+  if smtp is None:
+    smtp = c.health_smtp
+  # one probe runs the checks, the others wait for its result.
+  with _lock:
+    cached = _results.get(smtp)
+    if cached is not None and clock() < cached[0]:
+      return cached[1]
+    result = run_checks(smtp)
+    _results[smtp] = (clock() + c.health_cache_seconds, result)
+    return result
+
+
+def clear() -> None:
+  with _lock:
+    _results.clear()
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+  if setting in (conf.SETTING, "CACHES", "EMAIL_BACKEND"):
+    clear()
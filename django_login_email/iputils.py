@@ -1,14 +1,80 @@
-from django.core.cache import cache
+import ipaddress
+import typing as t
+
+from django.core.cache import caches
 from django.http import HttpRequest
 
+from . import conf, signals
 from .models import IPBan
 
+CLIENT_IP_ATTR = "_login_email_client_ip"
+
+
+def is_trusted(ip, networks: t.Sequence[conf.Network]) -> bool:
+  return any(ip.version == n.version and ip in n for n in networks)
 
-class Recorder(object):
-  """用于记录发送情况"""
 
-  times = 3
-  minutes = 10
+def client_ip_from_chain(
+  remote_addr: str, x_forwarded_for: t.Optional[str], networks: t.Sequence[conf.Network]
+) -> str:
+  """The nearest address in `X-Forwarded-For, REMOTE_ADDR` that is not a trusted proxy.
+
+  Only trusted proxies append to the header, so the hops are read from the right, and
+  the walk stops at the first one which is not trusted. A malformed hop ends the walk
+  too, the last valid address is used then.
+  """
+  hops = [h.strip() for h in x_forwarded_for.split(",")] if x_forwarded_for else []
+  ip = remote_addr
+  for hop in reversed(hops + [remote_addr]):
+    try:
+      addr = ipaddress.ip_address(hop)
+    except ValueError:
+      break
+    ip = hop
+    if not is_trusted(addr, networks):
+      break
+  return ip
+
+
+class Recorder(object):
+  """用于记录发送情况
+
+  `times` and `minutes` come from `LOGIN_EMAIL["RATE_LIMIT_TIMES"]` and
+  `LOGIN_EMAIL["RATE_LIMIT_MINUTES"]`; subclasses could still set them as class attributes.
+  """
+
+  def __init__(
+    self,
+    times: t.Optional[int] = None,
+    minutes: t.Optional[int] = None,
+    prefix: str = "",
+    action: str = "send email",
+    bans: bool = True,
+  ) -> None:
+    self._times = times
+    self._minutes = minutes
+    # keys are `prefix + ip`, a prefix gives a separate bucket, e.g. per tenant.
+    self.prefix = prefix
+    # what is counted, for the reason of the ban.
+    self.action = action
+    # False only refuses the IP while its counter lasts, without an IPBan row.
+    self.bans = bans
+
+  @property
+  def times(self) -> int:
+    if self._times is None:
+      return conf.get_config().rate_limit_times
+    return self._times
+
+  @property
+  def minutes(self) -> int:
+    if self._minutes is None:
+      return conf.get_config().rate_limit_minutes
+    return self._minutes
+
+  @property
+  def cache(self):
+    return caches[conf.get_config().cache_alias]
 
   def record(self, ip: str):
     """
@@ -19,21 +85,38 @@ class Recorder(object):
 
     Else, incr `ip` in cache.
     """
-    count = cache.get_or_set(ip, 0, self.minutes * 60)
+    key = self.prefix + ip
+    count = self.cache.get_or_set(key, 0, self.minutes * 60)
     if count < self.times:
-      cache.incr(ip)
+      self.cache.incr(key)
       return True
+    elif self.bans:
+      self.ban(ip)
     else:
-      IPBan.add_ip_ban(
-        ip, f"send email more than {self.times} times in {self.minutes} minutes"
-      )
+      signals.emit(signals.rate_limited, self.__class__, scope="ip", key=ip)
     return False
 
+  def ban(self, ip: str):
+    reason = f"{self.action} more than {self.times} times in {self.minutes} minutes"
+    IPBan.add_ip_ban(ip, reason)
+    signals.emit(signals.rate_limited, self.__class__, scope="ip", key=ip)
+    signals.emit(signals.ip_banned, self.__class__, ip=ip, reason=reason)
+
+  def exceeded(self, ip: str) -> bool:
+    """Whether `ip` is over the limit, one cache read."""
+    return (self.cache.get(self.prefix + ip) or 0) >= self.times
+
+  def reset(self, ips: t.Iterable[str]):
+    """Forget the send counters of `ips`, e.g. after unbanning them."""
+    self.cache.delete_many([self.prefix + ip for ip in ips])
+
 
 class IPBanUtils(object):
   """用于处理 IP 禁止发送的情况"""
 
   recorder = Recorder()
+  # database alias for read-only lookups, None leaves it to the routers.
+  read_db: t.Optional[str] = None
 
   def get_times(self):
     return self.recorder.times
@@ -43,9 +126,11 @@ class IPBanUtils(object):
 
     Security Note:
         By default, this method only uses REMOTE_ADDR to prevent IP spoofing.
-        Set USE_X_FORWARDED_FOR = True in Django settings only if your application
-        is behind a trusted reverse proxy (nginx, apache, cloudflare, etc.) and
-        the proxy is properly configured to set X-Forwarded-For.
+        Behind proxies, list them in `LOGIN_EMAIL["TRUSTED_PROXIES"]`: X-Forwarded-For
+        is then walked right to left, skipping the trusted hops. The older
+        USE_X_FORWARDED_FOR = True takes the first entry, which the client could forge.
+
+    The result is kept on the request, so it is only computed once per request.
 
     Args:
         request: Django HTTP请求对象
@@ -53,22 +138,27 @@ class IPBanUtils(object):
     Returns:
         str: 用户的IP地址
     """
-    # Check if we should trust X-Forwarded-For header (only behind trusted proxy)
-    from django.conf import settings
+    ip = getattr(request, CLIENT_IP_ATTR, None)
+    if ip is None:
+      ip = self.compute_client_ip(request)
+      setattr(request, CLIENT_IP_ATTR, ip)
+    return ip
 
-    use_x_forwarded_for = getattr(settings, "USE_X_FORWARDED_FOR", False)
+  def compute_client_ip(self, request: HttpRequest) -> str:
+    c = conf.get_config()
+    remote_addr = request.META.get("REMOTE_ADDR", "")
+    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    if c.trusted_proxies:
+      return client_ip_from_chain(remote_addr, x_forwarded_for, c.trusted_proxies)
 
-    if use_x_forwarded_for:
-      x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-      if x_forwarded_for:
-        # Get the first IP in the chain (client IP)
-        # Format: "client, proxy1, proxy2"
-        ip = x_forwarded_for.split(",")[0].strip()
-        return ip
+    # Check if we should trust X-Forwarded-For header (only behind trusted proxy)
+    if c.use_x_forwarded_for and x_forwarded_for:
+      # Get the first IP in the chain (client IP)
+      # Format: "client, proxy1, proxy2"
+      return x_forwarded_for.split(",")[0].strip()
 
     # Default: use REMOTE_ADDR (safe, cannot be spoofed)
-    ip = request.META.get("REMOTE_ADDR", "")
-    return ip
+    return remote_addr
 
   def record_send(self, request: HttpRequest) -> bool:
     """记录发送情况
@@ -83,13 +173,14 @@ class IPBanUtils(object):
     ip = self.get_client_ip(request)
     return self.recorder.record(ip)
 
-  def is_ip_banned(self, ip: str) -> bool:
+  def is_ip_banned(self, ip: str, using: t.Optional[str] = None) -> bool:
     """检查IP是否被禁止
 
     Args:
         ip: 需要检查的IP地址
+        using: 数据库别名，默认由 router 决定
 
     Returns:
         bool: 如果IP被禁止返回True，否则返回False
     """
-    return IPBan.objects.filter(ip=ip).exists()
+    return IPBan.objects.using(using or self.read_db).filter(ip=ip).exists()
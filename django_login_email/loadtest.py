@@ -0,0 +1,311 @@
+# Load test for a deployment of the login_email urls.
+#
+# The deployment must send its mails to the SMTP sink started here
+# (EMAIL_HOST/EMAIL_PORT), so real tokens can be read back from the mails. Synthetic
+# clients are spread over the 198.18.0.0/15 benchmark range with X-Forwarded-For,
+# which the target only honours when the load test's address is in
+# LOGIN_EMAIL["TRUSTED_PROXIES"], or with the older USE_X_FORWARDED_FOR = True.
+#
+# Usage: python manage.py login_email_loadtest --base-url http://127.0.0.1:8000
+import collections
+import http.cookiejar
+import ipaddress
+import math
+import random
+import re
+import socketserver
+import threading
+import time
+import typing as t
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from . import token
+
+KINDS = ("login", "verify", "replay", "expired", "banned")
+DEFAULT_MIX = {"login": 5, "verify": 3, "replay": 1, "expired": 1, "banned": 1}
+
+TOKEN_RE = re.compile(r"[?&]token=([^\"'\s&<>]+)")
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+BENCHMARK_NET = ipaddress.ip_network("198.18.0.0/15")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+  """Just enough SMTP to accept mails from Django's smtp backend."""
+
+  def reply(self, line: str):
+    self.wfile.write(line.encode("ascii") + b"\r\n")
+
+  def handle(self):
+    self.reply("220 login-email sink")
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        return
+      cmd = line.decode("utf-8", "replace").strip().upper()
+      if cmd.startswith("EHLO"):
+        self.reply("250-login-email sink")
+        self.reply("250 AUTH PLAIN")
+      elif cmd.startswith("HELO"):
+        self.reply("250 login-email sink")
+      elif cmd.startswith("AUTH"):
+        # any credentials are fine.
+        self.reply("235 authenticated")
+      elif cmd.startswith("DATA"):
+        self.reply("354 end with <CRLF>.<CRLF>")
+        data = []
+        for raw in self.rfile:
+          if raw in (b".\r\n", b".\n"):
+            break
+          data.append(raw[1:] if raw.startswith(b"..") else raw)
+        self.server.sink.add(b"".join(data).decode("utf-8", "replace"))
+        self.reply("250 queued")
+      elif cmd.startswith("QUIT"):
+        self.reply("221 bye")
+        return
+      else:
+        # MAIL, RCPT, RSET, NOOP
+        self.reply("250 ok")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+
+class SMTPSink(object):
+  """In-process SMTP server that keeps the tokens of the received mails."""
+
+  def __init__(self, host: str = "127.0.0.1", port: int = 1025) -> None:
+    self.server = _SMTPServer((host, port), _SMTPHandler)
+    self.server.sink = self
+    self.tokens: t.Deque[str] = collections.deque()
+    self.received = 0
+    self._lock = threading.Lock()
+    self._thread: t.Optional[threading.Thread] = None
+
+  @property
+  def port(self) -> int:
+    return self.server.server_address[1]
+
+  def add(self, message: str) -> None:
+    # quoted-printable bodies wrap long lines with "=\r\n".
+    message = message.replace("=\r\n", "").replace("=\n", "").replace("=3D", "=")
+    found = TOKEN_RE.search(message)
+    with self._lock:
+      self.received += 1
+      if found:
+        self.tokens.append(found.group(1))
+
+  def pop_token(self) -> t.Optional[str]:
+    with self._lock:
+      return self.tokens.popleft() if self.tokens else None
+
+  def start(self) -> "SMTPSink":
+    self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self) -> None:
+    self.server.shutdown()
+    self.server.server_close()
+
+
+@dataclass
+class Result(object):
+  kind: str
+  outcome: str
+  latency: float
+
+
+def percentile(values: t.Sequence[float], p: float) -> float:
+  """nearest-rank percentile of sorted values."""
+  if not values:
+    return 0.0
+  k = max(0, min(len(values), math.ceil(p / 100 * len(values))) - 1)
+  return values[k]
+
+
+@dataclass
+class Report(object):
+  results: t.List[Result] = field(default_factory=list)
+  elapsed: float = 0.0
+
+  def format(self) -> str:
+    lines = [
+      f"requests: {len(self.results)} in {self.elapsed:.2f}s "
+      f"({len(self.results) / max(self.elapsed, 1e-9):.1f} req/s)",
+      f"{'kind':<10}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    by_kind = collections.defaultdict(list)
+    for r in self.results:
+      by_kind[r.kind].append(r.latency * 1000)
+    for kind in ("all",) + KINDS:
+      values = sorted(
+        [r.latency * 1000 for r in self.results] if kind == "all" else by_kind[kind]
+      )
+      if not values:
+        continue
+      lines.append(
+        f"{kind:<10}{len(values):>8}"
+        + "".join(f"{percentile(values, p):>10.1f}" for p in (50, 90, 99))
+        + f"{values[-1]:>10.1f}"
+      )
+    lines.append("outcomes:")
+    outcomes = collections.Counter(f"{r.kind}:{r.outcome}" for r in self.results)
+    for outcome, count in sorted(outcomes.items()):
+      lines.append(f"  {outcome:<30}{count:>8}")
+    return "\n".join(lines)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+  def redirect_request(self, *args, **kwargs):
+    return None
+
+
+_plain_opener = urllib.request.build_opener(_NoRedirect())
+
+
+class LoadTest(object):
+  """Drive the login and verify urls with a mix of traffic from concurrent workers."""
+
+  def __init__(
+    self,
+    base_url: str,
+    sink: SMTPSink,
+    login_path: str = "/account/login",
+    verify_path: str = "/account/verify",
+    mix: t.Optional[t.Dict[str, int]] = None,
+    workers: int = 8,
+    clients: int = 1000,
+    banned_ips: t.Sequence[str] = (),
+    email_domain: str = "loadtest.example.com",
+    timeout: float = 10,
+  ) -> None:
+    self.base_url = base_url.rstrip("/")
+    self.sink = sink
+    self.login_url = self.base_url + login_path
+    self.verify_url = self.base_url + verify_path
+    self.mix = mix or DEFAULT_MIX
+    self.workers = workers
+    self.clients = [str(BENCHMARK_NET[i + 1]) for i in range(clients)]
+    self.banned_ips = list(banned_ips) or [str(BENCHMARK_NET[-2])]
+    self.email_domain = email_domain
+    self.timeout = timeout
+
+    self.consumed: t.Deque[str] = collections.deque(maxlen=1000)
+    self._local = threading.local()
+    self._counter = 0
+    self._lock = threading.Lock()
+
+  def _opener(self) -> urllib.request.OpenerDirector:
+    if not hasattr(self._local, "opener"):
+      jar = http.cookiejar.CookieJar()
+      self._local.opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(jar), _NoRedirect()
+      )
+    return self._local.opener
+
+  def _request(
+    self, url: str, data=None, ip: t.Optional[str] = None, session: bool = True
+  ) -> t.Tuple[int, str]:
+    """`session=False` sends no cookies, like a click from a mail client."""
+    headers = {"X-Forwarded-For": ip} if ip else {}
+    if data is not None:
+      data = urllib.parse.urlencode(data).encode("utf-8")
+      headers["Referer"] = url
+    req = urllib.request.Request(url, data=data, headers=headers)
+    opener = self._opener() if session else _plain_opener
+    try:
+      with opener.open(req, timeout=self.timeout) as resp:
+        return resp.status, resp.read().decode("utf-8", "replace")
+    except urllib.error.HTTPError as e:
+      return e.code, e.read().decode("utf-8", "replace")
+
+  def _next_email(self) -> str:
+    with self._lock:
+      self._counter += 1
+      return f"user{self._counter}@{self.email_domain}"
+
+  def _classify(self, status: int, body: str) -> str:
+    if 300 <= status < 400:
+      return f"{status}:redirect"
+    if "Failed!" in body:
+      return f"{status}:rejected"
+    if "Success!" in body:
+      return f"{status}:sent"
+    return str(status)
+
+  def _login(self, ip: str) -> str:
+    status, body = self._request(self.login_url, ip=ip)
+    csrf = CSRF_RE.search(body)
+    if status != 200 or not csrf:
+      return f"{status}:no-form"
+    data = {"csrfmiddlewaretoken": csrf.group(1), "email": self._next_email()}
+    return self._classify(*self._request(self.login_url, data=data, ip=ip))
+
+  def _verify(self, token_v: str, ip: str) -> str:
+    url = self.verify_url + "?" + urllib.parse.urlencode({"token": token_v}, safe="%")
+    return self._classify(*self._request(url, ip=ip, session=False))
+
+  def _expired_token(self) -> str:
+    # needs the SECRET_KEY of the target.
+    m = token.TokenManager(-1)
+    return m.encrypt_mail(self._next_email(), "login", lambda _: None)
+
+  def run_one(self, kind: str) -> Result:
+    ip = random.choice(self.clients)
+    start = time.perf_counter()
+    if kind == "login":
+      outcome = self._login(ip)
+    elif kind == "banned":
+      outcome = self._login(random.choice(self.banned_ips))
+    elif kind == "verify":
+      token_v = self.sink.pop_token()
+      if token_v is None:
+        # no mail yet, send one instead.
+        kind, outcome = "login", self._login(ip)
+      else:
+        outcome = self._verify(token_v, ip)
+        self.consumed.append(token_v)
+    elif kind == "replay":
+      if not self.consumed:
+        kind, outcome = "login", self._login(ip)
+      else:
+        outcome = self._verify(random.choice(self.consumed), ip)
+    elif kind == "expired":
+      outcome = self._verify(self._expired_token(), ip)
+    else:
+      raise ValueError(f"Invalid kind: {kind}")
+    return Result(kind=kind, outcome=outcome, latency=time.perf_counter() - start)
+
+  def _safe_run_one(self, kind: str) -> Result:
+    start = time.perf_counter()
+    try:
+      return self.run_one(kind)
+    except Exception as e:
+      return Result(kind, f"error:{type(e).__name__}", time.perf_counter() - start)
+
+  def run(self, requests: int) -> Report:
+    kinds = [k for k in KINDS if self.mix.get(k)]
+    weights = [self.mix[k] for k in kinds]
+    plan = random.choices(kinds, weights=weights, k=requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      results = list(pool.map(self._safe_run_one, plan))
+    return Report(results=results, elapsed=time.perf_counter() - start)
+
+
+def parse_mix(value: str) -> t.Dict[str, int]:
+  """`login=5,verify=3` -> {"login": 5, "verify": 3}"""
+  mix = {}
+  for part in value.split(","):
+    kind, _, weight = part.partition("=")
+    kind = kind.strip()
+    if kind not in KINDS:
+      raise ValueError(f"Invalid kind: {kind}, expected one of {', '.join(KINDS)}")
+    mix[kind] = int(weight or 1)
+  return mix
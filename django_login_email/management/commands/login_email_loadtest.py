@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from django_login_email import conf, loadtest, models
+
+
+class Command(BaseCommand):
+  help = (
+    "Load test the login_email urls of a running deployment. "
+    "Point its EMAIL_HOST/EMAIL_PORT at --smtp-host/--smtp-port."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--login-path", default="/account/login")
+    parser.add_argument("--verify-path", default="/account/verify")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=1000, help="synthetic client IPs")
+    parser.add_argument(
+      "--mix",
+      default=",".join(f"{k}={v}" for k, v in loadtest.DEFAULT_MIX.items()),
+      help=f"weights of {', '.join(loadtest.KINDS)}",
+    )
+    parser.add_argument("--smtp-host", default="127.0.0.1")
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument(
+      "--seed-bans",
+      type=int,
+      default=0,
+      help=(
+        "ban N synthetic IPs in the database first (target must share the database), "
+        "removed after the run"
+      ),
+    )
+
+  def handle(self, *args, **options):
+    try:
+      mix = loadtest.parse_mix(options["mix"])
+    except ValueError as e:
+      raise CommandError(str(e)) from e
+
+    started = timezone.now()
+    already_banned = set(
+      models.IPBan.objects.filter(
+        ip__in=[str(loadtest.BENCHMARK_NET[-2 - i]) for i in range(options["seed_bans"])]
+      ).values_list("ip", flat=True)
+    )
+    banned_ips = []
+    sink = None
+    try:
+      for i in range(options["seed_bans"]):
+        ip = str(loadtest.BENCHMARK_NET[-2 - i])
+        models.IPBan.add_ip_ban(ip, "login_email_loadtest")
+        banned_ips.append(ip)
+
+      sink = loadtest.SMTPSink(options["smtp_host"], options["smtp_port"]).start()
+      lt = loadtest.LoadTest(
+        base_url=options["base_url"],
+        sink=sink,
+        login_path=options["login_path"],
+        verify_path=options["verify_path"],
+        mix=mix,
+        workers=options["workers"],
+        clients=options["clients"],
+        banned_ips=banned_ips,
+      )
+      report = lt.run(options["requests"])
+    finally:
+      if sink is not None:
+        sink.stop()
+      # the seeded bans, and the synthetic clients the run got banned.
+      ips = [ip for ip in banned_ips if ip not in already_banned]
+      ips += [str(loadtest.BENCHMARK_NET[i + 1]) for i in range(options["clients"])]
+      removed = self.remove_bans(ips, started)
+      self.stdout.write(f"bans removed: {removed}")
+
+    self.stdout.write(report.format())
+    self.stdout.write(f"mails received: {sink.received}")
+
+  def remove_bans(self, ips, since) -> int:
+    """Delete the bans of `ips` created since `since`, in batches."""
+    size = conf.get_config().batch_size
+    removed = 0
+    for i in range(0, len(ips), size):
+      bans = models.IPBan.objects.filter(ip__in=ips[i : i + size], created_at__gte=since)
+      removed += bans.delete()[0]
+    return removed
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_login_email import conf, models
+
+
+class Command(BaseCommand):
+  help = "Delete LoginAttempt rows older than the retention period, in batches."
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--days",
+      type=int,
+      default=None,
+      help='Keep this many days, LOGIN_EMAIL["AUDIT_RETENTION_DAYS"] by default.',
+    )
+
+  def handle(self, *args, **options):
+    c = conf.get_config()
+    days = options["days"]
+    if days is None:
+      days = c.audit_retention_days
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    old = models.LoginAttempt.objects.filter(created_at__lt=cutoff)
+
+    # small batches keep the locks short on a busy table.
+    deleted = 0
+    while True:
+      pks = list(old.values_list("pk", flat=True)[: c.batch_size])
+      if not pks:
+        break
+      deleted += models.LoginAttempt.objects.filter(pk__in=pks).delete()[0]
+    self.stdout.write(
+      self.style.SUCCESS(f"Deleted {deleted} login attempts older than {days} days.")
+    )
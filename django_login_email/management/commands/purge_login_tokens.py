@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_login_email import conf, models
+
+
+class Command(BaseCommand):
+  help = "Delete expired EmailToken rows, in batches."
+
+  def handle(self, *args, **options):
+    size = conf.get_config().batch_size
+    expired = models.EmailToken.objects.filter(expired_time__lte=timezone.now())
+
+    # small batches keep the locks short on a busy table.
+    deleted = 0
+    while True:
+      pks = list(expired.values_list("pk", flat=True)[:size])
+      if not pks:
+        break
+      deleted += models.EmailToken.objects.filter(pk__in=pks).delete()[0]
+    self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired tokens."))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_login_email import domains
+
+
+class Command(BaseCommand):
+  help = (
+    "Validate the email domain lists and touch them, "
+    "so running workers reload them on their next check."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--no-touch",
+      action="store_true",
+      help="Only validate the lists, do not update their mtime.",
+    )
+
+  def handle(self, *args, **options):
+    f = domains.get_domain_filter()
+    paths = [p for p in (f.blocklist_path, f.allowlist_path) if p]
+    if not paths:
+      raise CommandError(
+        "Neither LOGIN_EMAIL_DOMAIN_BLOCKLIST nor LOGIN_EMAIL_DOMAIN_ALLOWLIST is set."
+      )
+
+    try:
+      f.reload()
+    except OSError as e:
+      raise CommandError(f"Failed to load domain list: {e}") from e
+
+    if not options["no_touch"]:
+      for path in paths:
+        os.utime(path)
+
+    self.stdout.write(f"blocklist: {len(f.blocklist)} domains")
+    if f.allowlist is not None:
+      self.stdout.write(f"allowlist: {len(f.allowlist)} domains")
+    self.stdout.write(
+      self.style.SUCCESS(f"Workers reload within {f.reload_interval} seconds.")
+    )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_login_email import warmup
+
+
+class Command(BaseCommand):
+  help = (
+    "Warm the keys, templates, database and cache connections of the process, "
+    "e.g. from gunicorn post_fork with call_command."
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      "--no-connections",
+      action="store_true",
+      help="Skip the database and cache steps, e.g. before a fork.",
+    )
+
+  def handle(self, *args, **options):
+    timings = warmup.warm_up(connections=not options["no_connections"])
+    for name, seconds in timings.items():
+      if seconds is None:
+        self.stdout.write(self.style.ERROR(f"{name}: failed"))
+      else:
+        self.stdout.write(f"{name}: {seconds * 1000:.1f} ms")
+    failed = [name for name, seconds in timings.items() if seconds is None]
+    if failed:
+      raise CommandError(f"Warm-up failed: {', '.join(failed)}, see the log.")
+    self.stdout.write(self.style.SUCCESS("Warmed up."))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+  dependencies = [
+    ("django_login_email", "0007_rename_sault_to_salt"),
+  ]
+
+  operations = [
+    migrations.AlterField(
+      model_name="emailrecord",
+      name="expired_time",
+      field=models.DateTimeField(
+        default=django.utils.timezone.now, verbose_name="Last register request time"
+      ),
+    ),
+  ]
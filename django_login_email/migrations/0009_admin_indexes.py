@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+  dependencies = [
+    ("django_login_email", "0008_emailrecord_expired_time_default"),
+  ]
+
+  operations = [
+    migrations.AlterField(
+      model_name="ipban",
+      name="created_at",
+      field=models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name="Created at"
+      ),
+    ),
+    migrations.AddIndex(
+      model_name="emailrecord",
+      index=models.Index(fields=["expired_time"], name="login_email_expired_idx"),
+    ),
+    migrations.AddIndex(
+      model_name="emailrecord",
+      index=models.Index(
+        fields=["mail_type", "validated"], name="login_email_type_valid_idx"
+      ),
+    ),
+  ]
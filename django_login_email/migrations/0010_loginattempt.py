@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+  dependencies = [
+    ("django_login_email", "0009_admin_indexes"),
+  ]
+
+  operations = [
+    migrations.CreateModel(
+      name="LoginAttempt",
+      fields=[
+        (
+          "id",
+          models.BigAutoField(
+            auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+          ),
+        ),
+        (
+          "created_at",
+          models.DateTimeField(
+            default=django.utils.timezone.now, verbose_name="Created at"
+          ),
+        ),
+        ("kind", models.CharField(max_length=16, verbose_name="Kind")),
+        ("outcome", models.CharField(max_length=32, verbose_name="Outcome")),
+        (
+          "ip",
+          models.GenericIPAddressField(blank=True, null=True, verbose_name="IP Address"),
+        ),
+        (
+          "email_hash",
+          models.CharField(blank=True, max_length=64, verbose_name="Email hash"),
+        ),
+        ("stages", models.JSONField(default=dict, verbose_name="Stage latencies")),
+        ("total_ms", models.FloatField(default=0, verbose_name="Total ms")),
+      ],
+      options={
+        "indexes": [
+          models.Index(fields=["created_at"], name="login_email_attempt_time_idx"),
+          models.Index(
+            fields=["email_hash", "created_at"], name="login_email_attempt_hash_idx"
+          ),
+        ],
+      },
+    ),
+  ]
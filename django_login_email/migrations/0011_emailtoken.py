@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+  dependencies = [
+    ("django_login_email", "0010_loginattempt"),
+  ]
+
+  operations = [
+    migrations.CreateModel(
+      name="EmailToken",
+      fields=[
+        (
+          "id",
+          models.CharField(
+            max_length=32, primary_key=True, serialize=False, verbose_name="Token id"
+          ),
+        ),
+        ("email", models.EmailField(max_length=254, verbose_name="Email")),
+        ("mail_type", models.CharField(max_length=100, verbose_name="Mail type")),
+        ("expired_time", models.DateTimeField(verbose_name="Expired time")),
+        ("consumed", models.BooleanField(default=False, verbose_name="Consumed")),
+      ],
+      options={
+        "indexes": [
+          models.Index(
+            fields=["email", "expired_time"], name="login_email_token_email_idx"
+          ),
+          models.Index(fields=["expired_time"], name="login_email_token_expired_idx"),
+        ],
+      },
+    ),
+  ]
@@ -0,0 +1,18 @@
+# 0007 renamed sault to salt without the verbose name of the model, "Salt". No schema
+# change.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+  dependencies = [
+    ("django_login_email", "0011_emailtoken"),
+  ]
+
+  operations = [
+    migrations.AlterField(
+      model_name="emailrecord",
+      name="salt",
+      field=models.CharField(max_length=100, verbose_name="Salt"),
+    ),
+  ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -6,14 +7,21 @@ from django.db import models
 class EmailRecord(models.Model):
   """Record the token for login/register."""
 
+  # not auto_now_add, it would overwrite the expired time of the first token.
   expired_time = models.DateTimeField(
-    auto_now_add=True, verbose_name="Last register request time"
+    default=timezone.now, verbose_name="Last register request time"
   )
   validated = models.BooleanField(default=False, verbose_name="Register Token validated")
   mail_type = models.CharField(max_length=100, verbose_name="Mail type")
   salt = models.CharField(max_length=100, verbose_name="Salt")
   email = models.EmailField(verbose_name="Email", unique=True, null=False)
 
+  class Meta:
+    indexes = [
+      models.Index(fields=["expired_time"], name="login_email_expired_idx"),
+      models.Index(fields=["mail_type", "validated"], name="login_email_type_valid_idx"),
+    ]
+
   @classmethod
   def set_email_expired_time(cls, email, datetime) -> "EmailRecord":
     obj, _ = cls.objects.get_or_create(email=email)
@@ -29,12 +37,38 @@ class EmailRecord(models.Model):
     return f"Email: {self.email}, mail_type: {self.mail_type}"
 
 
+class EmailToken(models.Model):
+  """One outstanding token, with `LOGIN_EMAIL["TOKEN_STORE"] = "table"`.
+
+  An email may have several tokens, e.g. one per device, and a new token does not
+  invalidate the others. Verify is one UPDATE on the primary key.
+  """
+
+  # digest of the salt, see `replay.token_id`.
+  id = models.CharField(max_length=32, primary_key=True, verbose_name="Token id")
+  email = models.EmailField(verbose_name="Email")
+  mail_type = models.CharField(max_length=100, verbose_name="Mail type")
+  expired_time = models.DateTimeField(verbose_name="Expired time")
+  consumed = models.BooleanField(default=False, verbose_name="Consumed")
+
+  class Meta:
+    indexes = [
+      models.Index(fields=["email", "expired_time"], name="login_email_token_email_idx"),
+      models.Index(fields=["expired_time"], name="login_email_token_expired_idx"),
+    ]
+
+  def __str__(self) -> str:
+    return f"Email: {self.email}, mail_type: {self.mail_type}"
+
+
 class IPBan(models.Model):
   """用于处理 IP 禁止发送的情况"""
 
   ip = models.GenericIPAddressField(verbose_name="IP Address", unique=True)
   reason = models.TextField(verbose_name="Reason")
-  created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created at")
+  created_at = models.DateTimeField(
+    auto_now_add=True, verbose_name="Created at", db_index=True
+  )
 
   def __str__(self) -> str:
     return f"IP: {self.ip}"
@@ -46,3 +80,29 @@ class IPBan(models.Model):
     obj.reason = reason
     obj.save()
     return obj
+
+
+class LoginAttempt(models.Model):
+  """Audit log of login and verify attempts, written in batches by `audit.py`."""
+
+  created_at = models.DateTimeField(default=timezone.now, verbose_name="Created at")
+  kind = models.CharField(max_length=16, verbose_name="Kind")
+  outcome = models.CharField(max_length=32, verbose_name="Outcome")
+  ip = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP Address")
+  # sha256 of the normalized email, never the email itself.
+  email_hash = models.CharField(max_length=64, blank=True, verbose_name="Email hash")
+  # stage -> milliseconds
+  stages = models.JSONField(default=dict, verbose_name="Stage latencies")
+  total_ms = models.FloatField(default=0, verbose_name="Total ms")
+
+  class Meta:
+    # the time index also suits range partitioning by created_at.
+    indexes = [
+      models.Index(fields=["created_at"], name="login_email_attempt_time_idx"),
+      models.Index(
+        fields=["email_hash", "created_at"], name="login_email_attempt_hash_idx"
+      ),
+    ]
+
+  def __str__(self) -> str:
+    return f"{self.kind}: {self.outcome} at {self.created_at}"
@@ -0,0 +1,133 @@
+# Cheap rejections.
+#
+# A token that was rejected or consumed is remembered by its hash for a few minutes,
+# so the same token is refused again before any decrypt or database work. Clients
+# that keep failing are throttled per IP with the send-limit Recorder, until their
+# counter expires: no IPBan row, a shared address or a mail scanner must not lose
+# the login page for good.
+#
+# The error pages are rendered once per (template, message, language) and kept, a
+# refusal only copies the bytes into a response with its status and Retry-After.
+import hashlib
+import threading
+import typing as t
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.cache import patch_cache_control
+
+from . import conf, errors, iputils
+
+MAX_PAGES = 256
+
+
+class NegativeCache(object):
+  """Hashes of tokens refused recently, with a TTL."""
+
+  prefix = "login_email:verify:neg:"
+  # values, a used link is told apart from a bad token.
+  REJECTED = 1
+  VALIDATED = 2
+
+  def __init__(
+    self, cache_alias: str = "default", ttl: int = 300, scope: str = ""
+  ) -> None:
+    self.cache_alias = cache_alias
+    self.ttl = ttl
+    # e.g. the tenant, a token refused by one tenant may be valid for another.
+    self.scope = scope
+
+  @property
+  def cache(self):
+    return caches[self.cache_alias]
+
+  def key(self, token_v: str) -> str:
+    # tokens are long and secret, keep only a digest.
+    digest = hashlib.sha256(token_v.encode("utf-8")).hexdigest()[:32]
+    return f"{self.prefix}{self.scope}:{digest}" if self.scope else self.prefix + digest
+
+  def get(self, token_v: str) -> t.Optional[int]:
+    """`REJECTED`, `VALIDATED`, or None when the token was not refused recently."""
+    if self.ttl <= 0:
+      return None
+    return self.cache.get(self.key(token_v))
+
+  def seen(self, token_v: str) -> bool:
+    return self.get(token_v) is not None
+
+  def check(self, token_v: str) -> None:
+    """Raise as the token was refused recently."""
+    seen = self.get(token_v)
+    if seen == self.VALIDATED:
+      raise errors.ValidatedError("Token already validated.")
+    if seen is not None:
+      raise errors.TokenError("Token rejected recently.")
+
+  def add(self, token_v: str, validated: bool = False) -> None:
+    if self.ttl > 0:
+      value = self.VALIDATED if validated else self.REJECTED
+      self.cache.set(self.key(token_v), value, self.ttl)
+
+
+def get_negative_cache(scope: str = "") -> NegativeCache:
+  c = conf.get_config()
+  return NegativeCache(c.cache_alias, c.verify_negative_ttl, scope)
+
+
+def get_failure_recorder() -> iputils.Recorder:
+  """Verify failures of each IP, refused over `LOGIN_EMAIL["VERIFY_FAILURE_LIMIT"]`."""
+  c = conf.get_config()
+  return iputils.Recorder(
+    c.verify_failure_limit,
+    c.verify_failure_minutes,
+    prefix="login_email:verify:fail:",
+    action="fail to verify",
+    bans=False,
+  )
+
+
+_pages: "OrderedDict[t.Tuple[str, str, t.Optional[str]], bytes]" = OrderedDict()
+_pages_lock = threading.Lock()
+
+
+def get_page(template: str, message: str) -> bytes:
+  """`template` rendered with `error`, without the request. Kept per language."""
+  key = (template, message, translation.get_language())
+  with _pages_lock:
+    if key in _pages:
+      _pages.move_to_end(key)
+      return _pages[key]
+  content = render_to_string(template, {"error": message}).encode("utf-8")
+  with _pages_lock:
+    _pages[key] = content
+    while len(_pages) > MAX_PAGES:
+      _pages.popitem(last=False)
+  return content
+
+
+def reject(
+  template: str, message: str, status: int, retry_after: t.Optional[int] = None
+) -> HttpResponse:
+  """The cached error page, with `status` and `Retry-After` in seconds."""
+  response = HttpResponse(get_page(template, str(message)), status=status)
+  if retry_after is not None:
+    response["Retry-After"] = str(int(retry_after))
+  # a refusal is about this client, shared caches must not keep it.
+  patch_cache_control(response, private=True, no_store=True)
+  return response
+
+
+def clear_pages() -> None:
+  with _pages_lock:
+    _pages.clear()
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+  if setting in ("TEMPLATES", "LANGUAGE_CODE"):
+    clear_pages()
@@ -0,0 +1,111 @@
+# Compiled mail bodies.
+#
+# The text and html templates of a mail are rendered once per info class, language and
+# value of each field of the context (subject, welcome_text, url, ...), with a
+# placeholder where the token goes. The output is split around the placeholder, so each send only joins
+# the token into the cached parts instead of running the template engine.
+import threading
+import typing as t
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import translation
+
+from . import conf
+
+if t.TYPE_CHECKING:
+  from .email import EmailInfo
+
+SLOT = "\x00token\x00"
+MAX_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CompiledMessage(object):
+  text_parts: t.Tuple[str, ...]
+  html_parts: t.Tuple[str, ...]
+
+  def render(self, token: str) -> t.Tuple[str, str]:
+    """(text, html) with the token filled in.
+
+    The token is url-quoted base64, so it needs no html escaping.
+    """
+    return token.join(self.text_parts), token.join(self.html_parts)
+
+
+_compiled: "OrderedDict[t.Hashable, CompiledMessage]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_context(info: "EmailInfo") -> t.Dict[str, t.Any]:
+  return {
+    "system_name": info.system_name,
+    "mail_type": info.mail_type,
+    "subject": info.subject,
+    "welcome_text": info.welcome_text,
+    "url": info.url,
+    "token": SLOT,
+    "link": info.url + SLOT,
+    "login_link": info.login_message.substitute(url=info.url, token=SLOT),
+  }
+
+
+def compile_message(info: "EmailInfo") -> CompiledMessage:
+  context = get_context(info)
+  text = render_to_string(info.text_template_name, context)
+  html = render_to_string(info.html_template_name, context)
+  return CompiledMessage(
+    text_parts=tuple(text.split(SLOT)),
+    html_parts=tuple(html.split(SLOT)),
+  )
+
+
+def get_max_size() -> int:
+  """With tenants, room for the login and register mail of each cached tenant."""
+  c = conf.get_config()
+  if c.tenant_resolver:
+    return max(MAX_SIZE, 2 * c.tenant_cache_size)
+  return MAX_SIZE
+
+
+def get_compiled(info: "EmailInfo") -> CompiledMessage:
+  # every field of the context, an instance may set any of them.
+  key = (
+    type(info),
+    info.system_name,
+    info.mail_type,
+    info.subject,
+    info.welcome_text,
+    info.url,
+    info.login_message.template,
+    info.text_template_name,
+    info.html_template_name,
+    translation.get_language(),
+  )
+  with _lock:
+    compiled = _compiled.get(key)
+    if compiled is not None:
+      _compiled.move_to_end(key)
+      return compiled
+
+  compiled = compile_message(info)
+  max_size = get_max_size()
+  with _lock:
+    _compiled[key] = compiled
+    while len(_compiled) > max_size:
+      _compiled.popitem(last=False)
+  return compiled
+
+
+def clear_cache() -> None:
+  with _lock:
+    _compiled.clear()
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+  if setting == "TEMPLATES":
+    clear_cache()
@@ -0,0 +1,149 @@
+# Replay filter of consumed tokens, checked before the mail record is read.
+#
+# A token is identified by a digest of its salt, which is random per token. Once a
+# token is consumed, its id is kept until the token would expire anyway:
+#
+# - "cache": a key per id in the Django cache, shared by all processes.
+# - "bloom": an in-process Bloom filter, rotated in time buckets that span the token
+#   TTL. A hit is only a possible replay, it is confirmed in the cache; without the
+#   cache key the database decides as before. A miss costs no network round trip.
+import hashlib
+import math
+import threading
+import time
+import typing as t
+
+from django.core.cache import caches
+
+from . import conf
+
+
+def token_id(salt: str) -> str:
+  return hashlib.sha256(salt.encode("utf-8")).hexdigest()[:32]
+
+
+class BloomFilter(object):
+  """`capacity` items with a false-positive rate of about `fp_rate`."""
+
+  def __init__(self, capacity: int, fp_rate: float) -> None:
+    self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+    self.hashes = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+    self.count = 0
+
+  def _positions(self, item: str) -> t.Iterator[int]:
+    # double hashing, two 64-bit halves of one digest.
+    digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    for i in range(self.hashes):
+      yield (h1 + i * h2) % self.size
+
+  def add(self, item: str) -> None:
+    for p in self._positions(item):
+      self.bits[p >> 3] |= 1 << (p & 7)
+    self.count += 1
+
+  def __contains__(self, item: str) -> bool:
+    return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class RotatingBloomFilter(object):
+  """Bloom filters per time bucket, an item is kept for at least `ttl` seconds."""
+
+  def __init__(
+    self, ttl: float, capacity: int, fp_rate: float, buckets: int = 4, clock=time.time
+  ) -> None:
+    self.bucket_seconds = ttl / buckets
+    # each bucket may answer wrongly, share the rate between them.
+    self.fp_rate = fp_rate / (buckets + 1)
+    self.buckets = buckets
+    self.capacity = capacity
+    self.clock = clock
+    self._filters: t.Dict[int, BloomFilter] = {}
+    self._lock = threading.Lock()
+
+  def _current(self) -> int:
+    index = int(self.clock() // self.bucket_seconds)
+    # buckets + 1 filters cover the ttl, whatever the offset in the current bucket.
+    for old in [i for i in self._filters if i < index - self.buckets]:
+      del self._filters[old]
+    return index
+
+  def add(self, item: str) -> None:
+    with self._lock:
+      index = self._current()
+      if index not in self._filters:
+        self._filters[index] = BloomFilter(self.capacity, self.fp_rate)
+      self._filters[index].add(item)
+
+  def __contains__(self, item: str) -> bool:
+    with self._lock:
+      self._current()
+      return any(item in f for f in self._filters.values())
+
+
+class ReplayFilter(object):
+  """Consumed token ids, `backend` is "cache" or "bloom"."""
+
+  prefix = "login_email:replay:"
+
+  def __init__(
+    self,
+    backend: str,
+    ttl: int,
+    cache_alias: str = "default",
+    capacity: int = 100000,
+    fp_rate: float = 0.001,
+  ) -> None:
+    self.backend = backend
+    self.ttl = ttl
+    self.cache_alias = cache_alias
+    self.bloom = (
+      RotatingBloomFilter(ttl, capacity, fp_rate) if backend == "bloom" else None
+    )
+
+  @property
+  def cache(self):
+    return caches[self.cache_alias]
+
+  def add(self, salt: str) -> None:
+    tid = token_id(salt)
+    if self.bloom is not None:
+      self.bloom.add(tid)
+    self.cache.set(self.prefix + tid, 1, self.ttl)
+
+  def is_consumed(self, salt: str) -> bool:
+    """True only when the cache has the id; False means "ask the database"."""
+    tid = token_id(salt)
+    if self.bloom is not None and tid not in self.bloom:
+      return False
+    return self.cache.get(self.prefix + tid) is not None
+
+
+_filters: t.Dict[t.Tuple, ReplayFilter] = {}
+_filters_lock = threading.Lock()
+
+
+def get_replay_filter(ttl_minutes: int) -> t.Optional[ReplayFilter]:
+  """The filter of the process for tokens of `ttl_minutes`, None when it is off."""
+  c = conf.get_config()
+  if c.replay_filter == "off" or ttl_minutes <= 0:
+    return None
+  key = (
+    c.replay_filter,
+    ttl_minutes,
+    c.cache_alias,
+    c.replay_bloom_capacity,
+    c.replay_false_positive_rate,
+  )
+  with _filters_lock:
+    if key not in _filters:
+      _filters[key] = ReplayFilter(
+        c.replay_filter,
+        ttl_minutes * 60,
+        c.cache_alias,
+        c.replay_bloom_capacity,
+        c.replay_false_positive_rate,
+      )
+    return _filters[key]
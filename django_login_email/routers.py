@@ -0,0 +1,26 @@
+from . import conf
+
+
+class LoginEmailRouter(object):
+  """Send reads of the login email models to a replica.
+
+  Add it to `DATABASE_ROUTERS` and set `LOGIN_EMAIL_READ_DATABASE` to the replica
+  alias. Writes are left to the next router, or the default database. Lookups that
+  feed a write decision are pinned to the primary by the mixins with `using=`.
+  """
+
+  route_app_labels = {"django_login_email"}
+
+  def db_for_read(self, model, **hints):
+    if model._meta.app_label in self.route_app_labels:
+      return conf.get_config().read_database
+    return None
+
+  def db_for_write(self, model, **hints):
+    return None
+
+  def allow_relation(self, obj1, obj2, **hints):
+    # replica and primary hold the same rows.
+    if {obj1._meta.app_label, obj2._meta.app_label} & self.route_app_labels:
+      return True
+    return None
@@ -0,0 +1,115 @@
+# Adaptive load shedding of the login and verify views.
+#
+# With `LOGIN_EMAIL["LOAD_SHEDDING"] = True`, each view has a limit of requests in
+# flight, adapted to its latency (AIMD):
+#
+# - a request faster than `SHED_TARGET_MS` adds 1 / limit, about +1 per `limit` requests;
+# - a slower or failed one multiplies the limit by `SHED_BACKOFF`, at most once per
+#   `SHED_TARGET_MS`, so one slow burst does not collapse it.
+#
+# Requests over the limit get a 503 from the cached error page, before any database or
+# SMTP work. The limits are per process, see `metrics()`.
+import threading
+import time
+import typing as t
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import conf
+
+
+class AdaptiveLimiter(object):
+  """AIMD limit of the requests in flight."""
+
+  def __init__(
+    self,
+    name: str,
+    initial: int = 20,
+    min_limit: int = 1,
+    max_limit: int = 200,
+    target_ms: float = 500,
+    backoff: float = 0.9,
+    clock=time.monotonic,
+  ) -> None:
+    self.name = name
+    self.min_limit = min_limit
+    self.max_limit = max_limit
+    self.limit = float(min(max(initial, min_limit), max_limit))
+    self.target = target_ms / 1000
+    self.backoff = backoff
+    self.clock = clock
+    self.in_flight = 0
+    self.counters = dict.fromkeys(("accepted", "rejected", "slow"), 0)
+    # moving average of the latency, in seconds.
+    self.latency = 0.0
+    self._last_decrease = -float("inf")
+    self._lock = threading.Lock()
+
+  def acquire(self) -> bool:
+    """Take a slot, False if the limit is reached and the request should be shed."""
+    with self._lock:
+      if self.in_flight >= int(self.limit):
+        self.counters["rejected"] += 1
+        return False
+      self.in_flight += 1
+      self.counters["accepted"] += 1
+      return True
+
+  def release(self, seconds: float, ok: bool = True) -> None:
+    """Give the slot back, with the latency of the request."""
+    with self._lock:
+      self.in_flight -= 1
+      self.latency += (seconds - self.latency) * 0.1
+      if ok and seconds <= self.target:
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        return
+      self.counters["slow"] += 1
+      now = self.clock()
+      if now - self._last_decrease >= self.target:
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+  def metrics(self) -> t.Dict[str, t.Any]:
+    with self._lock:
+      return {
+        **self.counters,
+        "limit": int(self.limit),
+        "in_flight": self.in_flight,
+        "latency_ms": round(self.latency * 1000, 3),
+      }
+
+
+_limiters: t.Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, **options) -> AdaptiveLimiter:
+  """The limiter of the process for `name`, `options` override the `SHED_*` settings."""
+  with _limiters_lock:
+    if name not in _limiters:
+      c = conf.get_config()
+      kwargs = {
+        "initial": c.shed_initial_limit,
+        "min_limit": c.shed_min_limit,
+        "max_limit": c.shed_max_limit,
+        "target_ms": c.shed_target_ms,
+        "backoff": c.shed_backoff,
+      }
+      kwargs.update(options)
+      _limiters[name] = AdaptiveLimiter(name, **kwargs)
+    return _limiters[name]
+
+
+def metrics() -> t.Dict[str, t.Dict[str, t.Any]]:
+  """State of each limiter of the process."""
+  with _limiters_lock:
+    limiters = list(_limiters.values())
+  return {limiter.name: limiter.metrics() for limiter in limiters}
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+  if setting == conf.SETTING:
+    with _limiters_lock:
+      _limiters.clear()
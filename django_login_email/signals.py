@@ -0,0 +1,141 @@
+# Signals of the login lifecycle.
+#
+#   from django_login_email import signals
+#
+#   @receiver(signals.mail_sent)
+#   def on_mail_sent(sender, email, mail_type, **kwargs): ...
+#
+# By default receivers run in the request, like any Django signal. With
+# `LOGIN_EMAIL["SIGNAL_DISPATCH"] = "async"`, they run after the transaction commits on
+# a few worker threads, fed by a bounded queue. A full queue drops the event instead of
+# blocking the request; see `get_dispatcher().metrics()`.
+import logging
+import os
+import queue
+import threading
+import time
+import typing as t
+
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+
+from . import conf
+
+logger = logging.getLogger(__name__)
+
+# email, mail_type
+mail_requested = Signal()
+# email, mail_type
+mail_sent = Signal()
+# email, mail_type, user
+token_verified = Signal()
+# reason, the error
+token_rejected = Signal()
+# ip, reason
+ip_banned = Signal()
+# scope ("ip" or "email"), key (the ip or the email)
+rate_limited = Signal()
+
+
+class AsyncDispatcher(object):
+  """Send signals from worker threads, the queue holds at most `queue_size` events."""
+
+  def __init__(self, workers: int = 2, queue_size: int = 1000) -> None:
+    self.workers = workers
+    self.queue_size = queue_size
+    self._lock = threading.Lock()
+    self._start()
+
+  def _start(self) -> None:
+    self.pid = os.getpid()
+    self.queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+    self.threads: t.List[threading.Thread] = []
+    self.counters = dict.fromkeys(("queued", "dispatched", "dropped", "failed"), 0)
+    self.max_depth = 0
+    self.max_wait = 0.0
+
+  def _ensure_threads(self) -> None:
+    # threads do not survive a fork, start new ones in the child.
+    if self.pid != os.getpid():
+      self._start()
+    if len(self.threads) < self.workers:
+      for _ in range(self.workers - len(self.threads)):
+        th = threading.Thread(target=self._run, daemon=True, name="login-email-signals")
+        th.start()
+        self.threads.append(th)
+
+  def submit(self, signal: Signal, sender, **kwargs) -> bool:
+    """Queue the event, False if the queue is full and it is dropped."""
+    with self._lock:
+      self._ensure_threads()
+      try:
+        self.queue.put_nowait((time.monotonic(), signal, sender, kwargs))
+      except queue.Full:
+        self.counters["dropped"] += 1
+        logger.warning("login_email signal queue is full, event dropped.")
+        return False
+      self.counters["queued"] += 1
+      self.max_depth = max(self.max_depth, self.queue.qsize())
+    return True
+
+  def _run(self) -> None:
+    while True:
+      queued_at, signal, sender, kwargs = self.queue.get()
+      try:
+        self.max_wait = max(self.max_wait, time.monotonic() - queued_at)
+        failed = send_robust(signal, sender, **kwargs)
+        with self._lock:
+          self.counters["dispatched"] += 1
+          self.counters["failed"] += failed
+      finally:
+        close_old_connections()
+        self.queue.task_done()
+
+  def join(self) -> None:
+    """Wait until the queued events are sent."""
+    self.queue.join()
+
+  def metrics(self) -> t.Dict[str, t.Any]:
+    with self._lock:
+      return {
+        **self.counters,
+        "depth": self.queue.qsize(),
+        "max_depth": self.max_depth,
+        "max_wait": self.max_wait,
+        "capacity": self.queue_size,
+        "workers": len(self.threads),
+      }
+
+
+_dispatcher: t.Optional[AsyncDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> AsyncDispatcher:
+  global _dispatcher
+  with _dispatcher_lock:
+    if _dispatcher is None:
+      c = conf.get_config()
+      _dispatcher = AsyncDispatcher(c.signal_workers, c.signal_queue_size)
+    return _dispatcher
+
+
+def send_robust(signal: Signal, sender, **kwargs) -> int:
+  """Send the signal, log the errors of receivers and return how many failed."""
+  failed = 0
+  for receiver, res in signal.send_robust(sender, **kwargs):
+    if isinstance(res, Exception):
+      failed += 1
+      logger.error(f"login_email signal receiver {receiver!r} failed: {res!r}")
+  return failed
+
+
+def emit(signal: Signal, sender, **kwargs) -> None:
+  """Send the signal with the configured dispatch. A failing receiver never fails the
+  request."""
+  if not signal.has_listeners(sender):
+    return
+  if conf.get_config().signal_dispatch == "async":
+    transaction.on_commit(lambda: get_dispatcher().submit(signal, sender, **kwargs))
+  else:
+    send_robust(signal, sender, **kwargs)
@@ -0,0 +1,620 @@
+# Concurrent SMTP sending on asyncio, with aiosmtplib:
+#
+#   pip install "django-login-email[async]"
+#
+#   sender = smtp.get_sender()
+#   results = sender.send_messages(messages)           # bulk, waits for all of them
+#   future = sender.submit(message, callback=done)     # deferred, returns at once
+#
+# An event loop thread runs `SMTP_CONNECTIONS` sessions at once. A session sends up to
+# `SMTP_MESSAGES_PER_CONNECTION` messages before it reconnects, and is closed when idle
+# for `SMTP_IDLE_TIMEOUT` seconds. The server is Django's EMAIL_HOST, EMAIL_PORT, ...;
+# EMAIL_BACKEND is not used. Callbacks run on a worker thread, not on the loop, so they
+# may use the database. A session sends one message at a time, aiosmtplib has no ESMTP
+# PIPELINING: the throughput comes from the concurrent sessions and their reuse.
+#
+# Providers throttle per recipient domain. Queued messages are grouped by domain, and a
+# session takes a batch of one domain at a time, at most `SMTP_DOMAIN_RATES[domain]`
+# messages per second and `SMTP_DOMAIN_CONNECTIONS` sessions per domain. A 4xx reply
+# defers the rest of the batch, and pauses the domain for the delay the server asks
+# for, or `SMTP_DEFERRAL_SECONDS`.
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import math
+import os
+import re
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import close_old_connections
+
+from . import conf, errors
+
+logger = logging.getLogger(__name__)
+
+# "try again in 30 seconds", "retry after 5 min", ...
+RETRY_AFTER = re.compile(
+  r"(?:retry|try again)\D{0,20}?(\d+)\s*(s|sec|second|m|min|minute|h|hour)?", re.I
+)
+UNITS = {"m": 60, "h": 3600}
+
+# highest first
+PRIORITIES = ("login", "register", "bulk")
+WEIGHTS = {"login": 8, "register": 4, "bulk": 1}
+
+
+@dataclass(slots=True)
+class SendResult(object):
+  message: EmailMessage
+  error: t.Optional[BaseException] = None
+
+  @property
+  def ok(self) -> bool:
+    return self.error is None
+
+
+Callback = t.Callable[[SendResult], None]
+
+
+@dataclass(slots=True)
+class _Item(object):
+  message: EmailMessage
+  future: "concurrent.futures.Future[SendResult]"
+  callback: t.Optional[Callback]
+  deferrals: int = 0
+  queued_at: float = field(default_factory=time.monotonic)
+
+
+class _Session(object):
+  """The SMTP connection of a worker, and how many messages it sent."""
+
+  __slots__ = ("smtp", "sent")
+
+  def __init__(self) -> None:
+    self.smtp = None
+    self.sent = 0
+
+
+def recipient_domain(message: EmailMessage) -> str:
+  recipients = message.recipients()
+  return recipients[0].rsplit("@", 1)[-1].lower() if recipients else ""
+
+
+def deferral_code(error: BaseException) -> t.Optional[int]:
+  """The 4xx code of a temporary refusal, None for anything else."""
+  codes = [getattr(error, "code", None)]
+  # all the recipients refused, each with its code.
+  codes += [getattr(r, "code", None) for r in getattr(error, "recipients", ())]
+  temporary = [c for c in codes if isinstance(c, int) and 400 <= c < 500]
+  return temporary[0] if temporary else None
+
+
+def retry_after(error: BaseException) -> t.Optional[float]:
+  """Seconds asked by the server in its reply, e.g. "421 try again in 30 seconds"."""
+  text = " ".join(
+    str(getattr(e, "message", e)) for e in [error, *getattr(error, "recipients", ())]
+  )
+  match = RETRY_AFTER.search(text)
+  if match is None:
+    return None
+  unit = (match.group(2) or "s")[0].lower()
+  return int(match.group(1)) * UNITS.get(unit, 1)
+
+
+class TokenBucket(object):
+  """`rate` messages per second, bursts of `burst`."""
+
+  __slots__ = ("rate", "burst", "tokens", "updated", "clock")
+
+  def __init__(self, rate: float, burst: int, clock=time.monotonic) -> None:
+    self.rate = rate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.clock = clock
+    self.updated = clock()
+
+  def reserve(self) -> float:
+    """Take a token, return how many seconds to wait before using it."""
+    now = self.clock()
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+    self.tokens -= 1
+    return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Class(object):
+  """Queued messages of one priority, per recipient domain."""
+
+  __slots__ = (
+    "name",
+    "weight",
+    "limit",
+    "queues",
+    "order",
+    "active",
+    "vtime",
+    "max_wait",
+  )
+
+  def __init__(self, name: str, weight: float, limit: t.Optional[int]) -> None:
+    self.name = name
+    self.weight = weight
+    # sessions at once, None for all of them.
+    self.limit = limit
+    self.queues: t.Dict[str, t.Deque[_Item]] = {}
+    self.order: t.Deque[str] = collections.deque()
+    self.active = 0
+    # messages handed out / weight, the class with the least goes next.
+    self.vtime = 0.0
+    self.max_wait = 0.0
+
+  def depth(self) -> int:
+    return sum(len(q) for q in self.queues.values())
+
+
+class DomainScheduler(object):
+  """Queued messages per priority and recipient domain, handed out in batches.
+
+  The priorities share the sessions by weight (weighted fair queuing on the number of
+  messages), each within its session limit. In a priority, the domains take turns, and
+  a domain is served by at most `domain_limit` sessions. A batch is split between the
+  `sessions` when a domain has few messages. A domain paused by a deferral waits, in
+  every priority. Runs on the loop thread only.
+  """
+
+  def __init__(
+    self,
+    rates: t.Optional[t.Dict[str, float]] = None,
+    burst: int = 10,
+    batch_size: int = 100,
+    weights: t.Optional[t.Dict[str, float]] = None,
+    limits: t.Optional[t.Dict[str, int]] = None,
+    sessions: int = 1,
+    domain_limit: t.Optional[int] = None,
+    clock=time.monotonic,
+  ) -> None:
+    # domain -> messages per second, "*" for the others; no entry, no limit.
+    self.rates = {k.lower(): v for k, v in (rates or {}).items()}
+    self.burst = burst
+    self.batch_size = batch_size
+    self.sessions = sessions
+    self.domain_limit = domain_limit
+    self.clock = clock
+    weights = {**WEIGHTS, **(weights or {})}
+    limits = limits or {}
+    self.classes = {p: _Class(p, weights[p], limits.get(p)) for p in PRIORITIES}
+    # (priority, domain) -> sessions sending it
+    self.busy: t.Dict[t.Tuple[str, str], int] = {}
+    self.paused: t.Dict[str, float] = {}
+    self.buckets: t.Dict[str, TokenBucket] = {}
+    self._wake = asyncio.Event()
+
+  def put(
+    self,
+    domain: str,
+    items: t.Iterable[_Item],
+    priority: str = "bulk",
+    front: bool = False,
+  ) -> None:
+    c = self.classes[priority]
+    if not c.queues:
+      # an idle class gets no credit for the time it had nothing to send.
+      backlogged = [o.vtime for o in self.classes.values() if o.queues]
+      c.vtime = max(c.vtime, min(backlogged, default=c.vtime))
+    if domain not in c.queues:
+      c.queues[domain] = collections.deque()
+      c.order.append(domain)
+    if front:
+      c.queues[domain].extendleft(reversed(list(items)))
+    else:
+      c.queues[domain].extend(items)
+    self._wake.set()
+
+  def _ready_domain(self, c: _Class, now: float) -> t.Tuple[t.Optional[str], float]:
+    wait = math.inf
+    for domain in c.order:
+      busy = self.busy.get((c.name, domain), 0)
+      if self.domain_limit is not None and busy >= self.domain_limit:
+        continue
+      until = self.paused.get(domain, 0)
+      if until > now:
+        wait = min(wait, until - now)
+        continue
+      return domain, wait
+    return None, wait
+
+  def _take(self) -> t.Tuple[t.Optional[t.Tuple[str, str, t.List[_Item]]], float]:
+    """A ready batch, or None and the seconds until a paused domain is ready."""
+    now = self.clock()
+    wait = math.inf
+    candidates = []
+    for rank, c in enumerate(self.classes.values()):
+      if c.limit is not None and c.active >= c.limit:
+        continue
+      domain, w = self._ready_domain(c, now)
+      wait = min(wait, w)
+      if domain is not None:
+        candidates.append((c.vtime, rank, domain))
+    if not candidates:
+      return None, wait
+    _, rank, domain = min(candidates)
+    c = list(self.classes.values())[rank]
+    queue = c.queues[domain]
+    size = min(self.batch_size, math.ceil(len(queue) / self.sessions))
+    batch = [queue.popleft() for _ in range(size)]
+    # the domain goes last in the turns of its class.
+    c.order.remove(domain)
+    if queue:
+      c.order.append(domain)
+    else:
+      del c.queues[domain]
+    if self.paused.get(domain, now) <= now:
+      self.paused.pop(domain, None)
+    c.active += 1
+    c.vtime += len(batch) / c.weight
+    c.max_wait = max(c.max_wait, now - batch[0].queued_at)
+    self.busy[c.name, domain] = self.busy.get((c.name, domain), 0) + 1
+    return (c.name, domain, batch), wait
+
+  async def next_batch(
+    self, timeout: float
+  ) -> t.Optional[t.Tuple[str, str, t.List[_Item]]]:
+    """Wait for a (priority, domain, items) batch, None after `timeout` seconds."""
+    deadline = self.clock() + timeout
+    while True:
+      batch, wait = self._take()
+      if batch is not None:
+        return batch
+      left = deadline - self.clock()
+      if left <= 0:
+        return None
+      self._wake.clear()
+      try:
+        await asyncio.wait_for(self._wake.wait(), min(wait, left))
+      except asyncio.TimeoutError:
+        pass
+
+  def release(self, priority: str, domain: str) -> None:
+    key = (priority, domain)
+    self.busy[key] -= 1
+    if not self.busy[key]:
+      del self.busy[key]
+    self.classes[priority].active -= 1
+    self._wake.set()
+
+  def defer(
+    self, priority: str, domain: str, items: t.List[_Item], seconds: float
+  ) -> None:
+    """Queue the items again, first, and pause the domain."""
+    self.paused[domain] = self.clock() + seconds
+    self.put(domain, items, priority, front=True)
+
+  def bucket(self, domain: str) -> t.Optional[TokenBucket]:
+    if domain not in self.buckets:
+      rate = self.rates.get(domain, self.rates.get("*"))
+      if rate is None:
+        return None
+      self.buckets[domain] = TokenBucket(rate, self.burst, self.clock)
+    return self.buckets[domain]
+
+  def metrics(self) -> t.Dict[str, t.Dict[str, float]]:
+    """Per priority: queued messages, age of the oldest, sessions, longest wait."""
+    now = self.clock()
+    return {
+      c.name: {
+        "depth": c.depth(),
+        "oldest_age": max((now - q[0].queued_at for q in c.queues.values()), default=0),
+        "active": c.active,
+        "max_wait": c.max_wait,
+      }
+      for c in self.classes.values()
+    }
+
+  def __len__(self) -> int:
+    return sum(c.depth() for c in self.classes.values())
+
+
+class AsyncSMTPSender(object):
+  """Send EmailMessages on `connections` concurrent SMTP sessions.
+
+  At most `queue_size` messages wait; `submit` raises EmailSendError beyond that.
+  """
+
+  def __init__(
+    self,
+    hostname: t.Optional[str] = None,
+    port: t.Optional[int] = None,
+    username: t.Optional[str] = None,
+    password: t.Optional[str] = None,
+    use_tls: t.Optional[bool] = None,
+    start_tls: t.Optional[bool] = None,
+    timeout: t.Optional[float] = None,
+    connections: int = 4,
+    messages_per_connection: int = 100,
+    queue_size: int = 1000,
+    idle_timeout: float = 30,
+    domain_rates: t.Optional[t.Dict[str, float]] = None,
+    domain_burst: int = 10,
+    deferral_seconds: float = 60,
+    max_deferrals: int = 3,
+    priority_weights: t.Optional[t.Dict[str, float]] = None,
+    priority_connections: t.Optional[t.Dict[str, int]] = None,
+    domain_connections: t.Optional[int] = None,
+  ) -> None:
+    # imported here, the dependency is optional.
+    import aiosmtplib
+
+    self.aiosmtplib = aiosmtplib
+    self.hostname = hostname or settings.EMAIL_HOST
+    self.port = port or settings.EMAIL_PORT
+    self.username = settings.EMAIL_HOST_USER if username is None else username
+    self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+    self.use_tls = settings.EMAIL_USE_SSL if use_tls is None else use_tls
+    self.start_tls = settings.EMAIL_USE_TLS if start_tls is None else start_tls
+    self.timeout = settings.EMAIL_TIMEOUT if timeout is None else timeout
+    self.connections = connections
+    self.messages_per_connection = messages_per_connection
+    self.queue_size = queue_size
+    self.idle_timeout = idle_timeout
+    self.domain_rates = domain_rates
+    self.domain_burst = domain_burst
+    self.deferral_seconds = deferral_seconds
+    self.max_deferrals = max_deferrals
+    self.priority_weights = priority_weights
+    self.domain_connections = domain_connections
+    # bulk keeps sessions free for logins by default.
+    self.priority_connections = (
+      {"bulk": max(1, connections - 1)}
+      if priority_connections is None
+      else priority_connections
+    )
+    self._lock = threading.Lock()
+    self._start()
+
+  def _start(self) -> None:
+    self.pid = os.getpid()
+    self.loop: t.Optional[asyncio.AbstractEventLoop] = None
+    self.scheduler: t.Optional[DomainScheduler] = None
+    # a campaign filling the queue does not refuse logins.
+    self._slots = {p: threading.BoundedSemaphore(self.queue_size) for p in PRIORITIES}
+    # callbacks, off the loop.
+    self._executor = concurrent.futures.ThreadPoolExecutor(
+      max_workers=2, thread_name_prefix="login-email-smtp-cb"
+    )
+    self.counters = dict.fromkeys(
+      ("sent", "failed", "rejected", "deferred", "connects"), 0
+    )
+
+  def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+    # the loop thread does not survive a fork, start a new one in the child.
+    with self._lock:
+      if self.pid != os.getpid():
+        self._start()
+      if self.loop is None:
+        ready = threading.Event()
+        threading.Thread(
+          target=self._run, args=(ready,), daemon=True, name="login-email-smtp"
+        ).start()
+        ready.wait()
+      return self.loop
+
+  def _run(self, ready: threading.Event) -> None:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    self.scheduler = DomainScheduler(
+      self.domain_rates,
+      self.domain_burst,
+      self.messages_per_connection,
+      self.priority_weights,
+      self.priority_connections,
+      self.connections,
+      self.domain_connections,
+    )
+    for _ in range(self.connections):
+      loop.create_task(self._worker())
+    self.loop = loop
+    ready.set()
+    loop.run_forever()
+
+  def submit(
+    self,
+    message: EmailMessage,
+    callback: t.Optional[Callback] = None,
+    block: bool = False,
+    priority: str = "bulk",
+  ) -> "concurrent.futures.Future[SendResult]":
+    """Queue the message, the future and `callback` get its SendResult.
+
+    `priority` is "login", "register" or "bulk".
+    """
+    if priority not in PRIORITIES:
+      raise ValueError(f"Invalid priority: {priority}")
+    loop = self._ensure_loop()
+    if not self._slots[priority].acquire(blocking=block):
+      self.counters["rejected"] += 1
+      raise errors.EmailSendError("The mail queue is full.")
+    future: "concurrent.futures.Future[SendResult]" = concurrent.futures.Future()
+    item = _Item(message, future, callback)
+    loop.call_soon_threadsafe(
+      self.scheduler.put, recipient_domain(message), [item], priority
+    )
+    return future
+
+  def send_messages(
+    self,
+    messages: t.Iterable[EmailMessage],
+    callback: t.Optional[Callback] = None,
+    priority: str = "bulk",
+  ) -> t.List[SendResult]:
+    """Send all the messages and wait, in the order given.
+
+    A full queue makes this wait for room instead of failing.
+    """
+    futures = [self.submit(m, callback, True, priority) for m in messages]
+    return [f.result() for f in futures]
+
+  async def _connect(self):
+    smtp = self.aiosmtplib.SMTP(
+      hostname=self.hostname,
+      port=self.port,
+      username=self.username or None,
+      password=self.password or None,
+      use_tls=self.use_tls,
+      start_tls=self.start_tls or None,
+      timeout=self.timeout,
+    )
+    await smtp.connect()
+    self.counters["connects"] += 1
+    return smtp
+
+  async def _close(self, smtp) -> None:
+    if smtp is None:
+      return
+    try:
+      await smtp.quit()
+    except Exception:
+      smtp.close()
+
+  async def _worker(self) -> None:
+    """One SMTP session, sending batches of one domain at a time."""
+    session = _Session()
+    while True:
+      batch = await self.scheduler.next_batch(self.idle_timeout)
+      if batch is None:
+        await self._close(session.smtp)
+        session.smtp = None
+        continue
+      priority, domain, items = batch
+      try:
+        await self._send_batch(session, priority, domain, items)
+      finally:
+        self.scheduler.release(priority, domain)
+
+  async def _send_batch(
+    self, session: _Session, priority: str, domain: str, items: t.List[_Item]
+  ):
+    # items before `done` are completed or deferred.
+    done = 0
+    try:
+      bucket = self.scheduler.bucket(domain)
+      for i, item in enumerate(items):
+        if bucket is not None:
+          delay = bucket.reserve()
+          if delay > 0:
+            await asyncio.sleep(delay)
+        error = await self._send_one(session, item.message)
+        code = deferral_code(error) if error is not None else None
+        if code is not None and item.deferrals < self.max_deferrals:
+          # the provider asks to slow down, keep the rest of the batch for later.
+          seconds = retry_after(error) or self.deferral_seconds
+          logger.info(f"{domain} deferred mail with {code}, retry in {seconds}s.")
+          item.deferrals += 1
+          self.counters["deferred"] += 1
+          self.scheduler.defer(priority, domain, items[i:], seconds)
+          return
+        self.counters["failed" if error else "sent"] += 1
+        self._executor.submit(
+          self._complete, SendResult(item.message, error), item, priority
+        )
+        done = i + 1
+    except Exception as e:
+      # otherwise the futures of the batch never resolve and their slots stay taken.
+      logger.exception(f"login_email sender failed a batch of {domain}")
+      for item in items[done:]:
+        self.counters["failed"] += 1
+        self._executor.submit(self._complete, SendResult(item.message, e), item, priority)
+
+  async def _send_one(
+    self, session: _Session, message: EmailMessage
+  ) -> t.Optional[BaseException]:
+    """Send on the session of the worker, return the error if any."""
+    # a reused session may have been dropped by the server, retry once on a new one.
+    for retry in (False, True):
+      try:
+        if session.smtp is not None and session.sent >= self.messages_per_connection:
+          await self._close(session.smtp)
+          session.smtp = None
+        reused = session.smtp is not None and session.smtp.is_connected
+        if not reused:
+          session.smtp, session.sent = await self._connect(), 0
+        await session.smtp.send_message(
+          message.message(), sender=message.from_email, recipients=message.recipients()
+        )
+        session.sent += 1
+        return None
+      except self.aiosmtplib.SMTPServerDisconnected as e:
+        session.smtp = None
+        if not reused or retry:
+          return e
+      except (
+        self.aiosmtplib.SMTPResponseException,
+        self.aiosmtplib.SMTPRecipientsRefused,
+      ) as e:
+        # the session is fine, the server refused this message.
+        return e
+      except Exception as e:
+        if session.smtp is not None:
+          session.smtp.close()
+        session.smtp = None
+        return e
+    return None
+
+  def _complete(self, result: SendResult, item: _Item, priority: str) -> None:
+    self._slots[priority].release()
+    try:
+      if item.callback is not None:
+        item.callback(result)
+    except Exception as e:
+      logger.error(f"login_email send callback {item.callback!r} failed: {e!r}")
+    finally:
+      close_old_connections()
+      item.future.set_result(result)
+
+  def metrics(self) -> t.Dict[str, t.Any]:
+    """Counters, and per priority the queue depth and age, see DomainScheduler."""
+    classes: t.Dict[str, t.Any] = {}
+    if self.loop is not None and self.pid == os.getpid():
+      # the scheduler belongs to the loop thread, read it there.
+      future = asyncio.run_coroutine_threadsafe(self._scheduler_metrics(), self.loop)
+      classes = future.result(timeout=1)
+    return {
+      **self.counters,
+      "queued": sum(c["depth"] for c in classes.values()),
+      "connections": self.connections,
+      "priorities": classes,
+    }
+
+  async def _scheduler_metrics(self):
+    return self.scheduler.metrics()
+
+
+_sender: t.Optional[AsyncSMTPSender] = None
+_sender_lock = threading.Lock()
+
+
+def get_sender() -> AsyncSMTPSender:
+  global _sender
+  with _sender_lock:
+    if _sender is None:
+      c = conf.get_config()
+      _sender = AsyncSMTPSender(
+        timeout=c.send_timeout,
+        connections=c.smtp_connections,
+        messages_per_connection=c.smtp_messages_per_connection,
+        queue_size=c.smtp_queue_size,
+        idle_timeout=c.smtp_idle_timeout,
+        domain_rates=c.smtp_domain_rates,
+        domain_burst=c.smtp_domain_burst,
+        deferral_seconds=c.smtp_deferral_seconds,
+        max_deferrals=c.smtp_max_deferrals,
+        priority_weights=c.smtp_priority_weights,
+        priority_connections=c.smtp_priority_connections,
+        domain_connections=c.smtp_domain_connections,
+      )
+    return _sender
@@ -0,0 +1,257 @@
+# Several brands on one deployment.
+#
+#   LOGIN_EMAIL = {
+#     "TENANT_RESOLVER": "django_login_email.tenants.by_host",
+#     "TENANTS": {
+#       "login.brand-a.com": {"SYSTEM_NAME": "Brand A", "FROM_EMAIL": "a@brand-a.com"},
+#     },
+#   }
+#
+# The resolver maps a request to a tenant id, the loader (`TENANTS` by default, or
+# `TENANT_LOADER`) maps the id to its options. The resources of a tenant (info classes,
+# token key, limits, IP counters) are built once and kept in a bounded LRU, so requests
+# neither rebuild classes nor derive keys. Requests without a known tenant use the
+# global settings.
+import collections
+import functools
+import hashlib
+import threading
+import typing as t
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+from django.http.request import split_domain_port
+from django.utils.module_loading import import_string
+
+from . import conf, email, iputils, token
+
+TENANT_ATTR = "_login_email_tenant"
+# unknown ids kept apart from the tenants, e.g. junk Host headers must not evict them.
+MAX_UNKNOWN = 256
+
+# option -> Tenant field
+OPTIONS = {
+  "SYSTEM_NAME": "system_name",
+  "FROM_EMAIL": "from_email",
+  "VERIFY_URL": "verify_url",
+  "TOKEN_TTL_MINUTES": "token_ttl_minutes",
+  "RATE_LIMIT_TIMES": "rate_limit_times",
+  "RATE_LIMIT_MINUTES": "rate_limit_minutes",
+  "SECRET": "secret",
+  "BAN_SCOPE": "ban_scope",
+}
+
+
+@dataclass(frozen=True)
+class Tenant(object):
+  id: str
+  system_name: t.Optional[str] = None
+  from_email: t.Optional[str] = None
+  verify_url: t.Optional[str] = None
+  token_ttl_minutes: t.Optional[int] = None
+  rate_limit_times: t.Optional[int] = None
+  rate_limit_minutes: t.Optional[int] = None
+  # token key material, SECRET_KEY and the tenant id by default.
+  secret: t.Optional[str] = None
+  # "global" shares the IP counters of all tenants, "tenant" counts per tenant.
+  ban_scope: str = "global"
+
+  @classmethod
+  def from_options(cls, tenant_id: str, options: t.Dict[str, t.Any]) -> "Tenant":
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+      raise ValueError(f"Unknown tenant options: {', '.join(sorted(unknown))}")
+    return cls(id=tenant_id, **{OPTIONS[k]: v for k, v in options.items()})
+
+
+def get_scope(tenant_id: str) -> str:
+  """The tenant in cache keys, short and safe."""
+  return hashlib.sha256(tenant_id.encode("utf-8")).hexdigest()[:16]
+
+
+def get_recorder_prefix(tenant_id: str) -> str:
+  """Prefix of the IP counters of a tenant with `ban_scope = "tenant"`."""
+  return f"login_email:tenant:{get_scope(tenant_id)}:"
+
+
+class TenantResources(object):
+  """What a request of the tenant needs, built once."""
+
+  __slots__ = ("tenant", "tl", "token_key", "recorder", "scope", "_info_classes", "_lock")
+
+  def __init__(self, tenant: Tenant) -> None:
+    from .views.limit import LoginTimeLimit
+
+    self.tenant = tenant
+    self.tl = LoginTimeLimit(tenant.token_ttl_minutes)
+    secret = tenant.secret or f"{settings.SECRET_KEY}:tenant:{tenant.id}"
+    self.token_key = token.derive_key(secret)
+    self.scope = get_scope(tenant.id)
+    prefix = ""
+    if tenant.ban_scope == "tenant":
+      prefix = get_recorder_prefix(tenant.id)
+    self.recorder = iputils.Recorder(
+      tenant.rate_limit_times, tenant.rate_limit_minutes, prefix=prefix
+    )
+    self._info_classes: t.Dict[t.Tuple[type, type], t.Tuple[type, type]] = {}
+    self._lock = threading.Lock()
+
+  def get_token_manager(self) -> token.TokenManager:
+    return token.TokenManager(self.tl.minutes, key=self.token_key)
+
+  def get_info_classes(
+    self,
+    login_base: t.Type[email.EmailLoginInfo],
+    register_base: t.Type[email.EmailRegisterInfo],
+  ) -> t.Tuple[t.Type[email.EmailLoginInfo], t.Type[email.EmailRegisterInfo]]:
+    """Subclasses of the view's info classes, with the options of the tenant."""
+    bases = (login_base, register_base)
+    with self._lock:
+      if bases not in self._info_classes:
+        self._info_classes[bases] = (
+          self._subclass(login_base),
+          self._subclass(register_base),
+        )
+      return self._info_classes[bases]
+
+  def _subclass(self, base: type) -> type:
+    tenant = self.tenant
+    attrs: t.Dict[str, t.Any] = {"tenant": tenant}
+    if tenant.system_name is not None:
+      attrs["system_name"] = tenant.system_name
+    if tenant.verify_url is not None:
+      attrs["url"] = tenant.verify_url
+    if tenant.from_email is not None:
+
+      def __init__(self):
+        base.__init__(self)
+        self.from_email = tenant.from_email
+
+      attrs["__init__"] = __init__
+    return type(base.__name__, (base,), attrs)
+
+
+def by_host(request: HttpRequest) -> str:
+  """The host of the request, without the port. IPv6 hosts keep their brackets."""
+  domain, _ = split_domain_port(request.get_host())
+  return domain
+
+
+def by_attribute(request: HttpRequest) -> t.Optional[str]:
+  """`request.tenant`, e.g. set by a middleware. Its `id`, or itself if a string."""
+  tenant = getattr(request, "tenant", None)
+  if tenant is None or isinstance(tenant, str):
+    return tenant
+  return str(getattr(tenant, "id", tenant))
+
+
+def load_from_settings(tenant_id: str) -> t.Optional[Tenant]:
+  """`LOGIN_EMAIL["TENANTS"][tenant_id]`"""
+  options = (conf.get_config().tenants or {}).get(tenant_id)
+  if options is None:
+    return None
+  return Tenant.from_options(tenant_id, options)
+
+
+class TenantCache(object):
+  """LRU of TenantResources, at most `max_size` tenants and `max_unknown` unknown ids."""
+
+  def __init__(
+    self,
+    loader: t.Callable[[str], t.Optional[Tenant]],
+    max_size: int,
+    max_unknown: int = MAX_UNKNOWN,
+  ) -> None:
+    self.loader = loader
+    self.max_size = max_size
+    self.max_unknown = max_unknown
+    self.hits = self.misses = 0
+    self._data: "collections.OrderedDict[str, TenantResources]" = (
+      collections.OrderedDict()
+    )
+    self._unknown: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, tenant_id: str) -> t.Optional[TenantResources]:
+    with self._lock:
+      if tenant_id in self._data:
+        self._data.move_to_end(tenant_id)
+        self.hits += 1
+        return self._data[tenant_id]
+      if tenant_id in self._unknown:
+        self._unknown.move_to_end(tenant_id)
+        self.hits += 1
+        return None
+      self.misses += 1
+
+    # build outside the lock, the loader may query the database.
+    tenant = self.loader(tenant_id)
+    resources = TenantResources(tenant) if tenant is not None else None
+    with self._lock:
+      if resources is None:
+        # a separate LRU, so unknown ids never evict tenants.
+        self._unknown[tenant_id] = None
+        while len(self._unknown) > self.max_unknown:
+          self._unknown.popitem(last=False)
+        return None
+      self._data[tenant_id] = resources
+      self._data.move_to_end(tenant_id)
+      while len(self._data) > self.max_size:
+        self._data.popitem(last=False)
+    return resources
+
+  def __len__(self) -> int:
+    return len(self._data)
+
+  def ids(self) -> t.List[str]:
+    """The ids of the cached tenants."""
+    with self._lock:
+      return list(self._data)
+
+
+@functools.lru_cache(maxsize=None)
+def get_resolver() -> t.Optional[t.Callable[[HttpRequest], t.Optional[str]]]:
+  path = conf.get_config().tenant_resolver
+  return import_string(path) if path else None
+
+
+@functools.lru_cache(maxsize=None)
+def get_cache() -> TenantCache:
+  c = conf.get_config()
+  loader = import_string(c.tenant_loader) if c.tenant_loader else load_from_settings
+  return TenantCache(loader, c.tenant_cache_size)
+
+
+def get_resources(tenant_id: str) -> t.Optional[TenantResources]:
+  return get_cache().get(tenant_id)
+
+
+def get_recorders() -> t.List[iputils.Recorder]:
+  """IP recorders of every tenant known to the process, for `Recorder.reset`.
+
+  The tenants of `LOGIN_EMAIL["TENANTS"]` and those in the tenant cache: a tenant of
+  `TENANT_LOADER` that the process never loaded is not known.
+  """
+  ids = set(conf.get_config().tenants or {}) | set(get_cache().ids())
+  return [iputils.Recorder(prefix=get_recorder_prefix(i)) for i in sorted(ids)]
+
+
+def resolve(request: HttpRequest) -> t.Optional[TenantResources]:
+  """The resources of the request's tenant, None without one. Kept on the request."""
+  if hasattr(request, TENANT_ATTR):
+    return getattr(request, TENANT_ATTR)
+  resolver = get_resolver()
+  tenant_id = resolver(request) if resolver is not None else None
+  resources = get_resources(tenant_id) if tenant_id else None
+  setattr(request, TENANT_ATTR, resources)
+  return resources
+
+
+@receiver(setting_changed)
+def _clear_on_setting_changed(setting, **kwargs):
+  if setting in (conf.SETTING, "SECRET_KEY"):
+    get_resolver.cache_clear()
+    get_cache.cache_clear()
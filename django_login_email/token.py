@@ -8,20 +8,63 @@ import os
 import typing as t
 import urllib.parse
 
-from Crypto.Cipher import AES
 from django.conf import settings
 
 Token = str
 EmailAndSalt = str
 Email = str
 
-TokenDict = t.TypedDict(
-  "TokenDict", {"email": Email, "expired_time": int, "salt": str, "mail_type": str}
-)
+
+class LoginToken(object):
+  """Content of a token, read like the dict it replaces: `token["email"]`."""
+
+  __slots__ = ("email", "expired_time", "salt", "mail_type")
+
+  def __init__(self, email: Email, expired_time: int, salt: str, mail_type: str) -> None:
+    self.email = email
+    self.expired_time = expired_time
+    self.salt = salt
+    self.mail_type = mail_type
+
+  @classmethod
+  def from_dict(cls, d: t.Mapping[str, t.Any]) -> "LoginToken":
+    """Missing keys raise KeyError, unknown keys are ignored."""
+    return cls(d["email"], d["expired_time"], d["salt"], d["mail_type"])
+
+  def to_dict(self) -> t.Dict[str, t.Any]:
+    return {k: getattr(self, k) for k in self.__slots__}
+
+  def __getitem__(self, key: str):
+    if key not in self.__slots__:
+      raise KeyError(key)
+    return getattr(self, key)
+
+  def get(self, key: str, default=None):
+    return getattr(self, key, default) if key in self.__slots__ else default
+
+  def keys(self) -> t.Tuple[str, ...]:
+    return self.__slots__
+
+  def __eq__(self, other) -> bool:
+    if isinstance(other, LoginToken):
+      other = other.to_dict()
+    return self.to_dict() == other
+
+  def __repr__(self) -> str:
+    return f"LoginToken({self.to_dict()!r})"
+
+
+# kept for compatibility, a LoginToken works where the dict did.
+TokenDict = LoginToken
 
 logger = logging.getLogger(__name__)
 
 
+def derive_key(secret: str) -> bytes:
+  """32-byte AES key from a secret."""
+  return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
 class TokenGenerator(object):
   """generate token by minutes"""
 
@@ -38,14 +81,9 @@ class TokenGenerator(object):
 
   def gen(self, email, mail_type: str, save_token: t.Callable[[TokenDict], None]) -> str:
     """call save_token to save token in database or somewhere"""
-    token: TokenDict = {
-      "email": email,
-      "expired_time": self.get_expired_time(),
-      "salt": self.gen_salt(email),
-      "mail_type": mail_type,
-    }
+    token = LoginToken(email, self.get_expired_time(), self.gen_salt(email), mail_type)
     save_token(token)
-    token_str = json.dumps(token)
+    token_str = json.dumps(token.to_dict())
     return token_str
 
 
@@ -55,25 +93,25 @@ class TokenManager(object):
   key: bytes
   generator: TokenGenerator
 
-  def __init__(self, minutes: int) -> None:
+  def __init__(self, minutes: int, key: t.Optional[bytes] = None) -> None:
     # Use SHA-256 to derive a fixed 32-byte key from SECRET_KEY
-    self.key = hashlib.sha256(settings.SECRET_KEY.encode("utf-8")).digest()
+    self.key = key or derive_key(settings.SECRET_KEY)
     self.generator: TokenGenerator = TokenGenerator(minutes)
 
   def transform_token(self, token_uncrypt: Token) -> TokenDict:
-    token_dict: TokenDict = json.loads(token_uncrypt)
-    return token_dict
+    return LoginToken.from_dict(json.loads(token_uncrypt))
 
   def check_token(
     self, token_dict: TokenDict, get_salt: t.Callable[[], str]
   ) -> t.Optional[TokenDict]:
     """check salt and expire-time"""
-    logger.info(f"token_dict: {token_dict}")
+    # lazy %-formatting, the token is not formatted unless debug logging is on.
+    logger.debug("token_dict: %s", token_dict)
     if not token_dict["salt"] == get_salt():
-      logger.info(f"salt is error, {token_dict['salt']}, {get_salt()}")
+      logger.info("salt is error, email: %s", token_dict["email"])
       return None
     if token_dict["expired_time"] > int(datetime.datetime.now().timestamp()):
-      logger.info("expired_time is ok")
+      logger.debug("expired_time is ok")
       return token_dict
     logger.info("expired_time is error")
     return None
@@ -83,12 +121,17 @@ class TokenManager(object):
     return token_uncrypt["email"]
 
   def _encrypt(self, plaintext, key):
+    # pycryptodome is imported on first use, not at startup.
+    from Crypto.Cipher import AES
+
     cipher = AES.new(key, AES.MODE_EAX)
     nonce = cipher.nonce
     ciphertext, tag = cipher.encrypt_and_digest(plaintext)
     return nonce + ciphertext + tag
 
   def _decrypt(self, ciphertext, key):
+    from Crypto.Cipher import AES
+
     nonce = ciphertext[:16]
     tag = ciphertext[-16:]
     ciphertext = ciphertext[16:-16]
@@ -0,0 +1,24 @@
+import typing as t
+
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.cache import never_cache
+
+from django_login_email import health
+
+
+@method_decorator(never_cache, name="dispatch")
+class HealthView(View):
+  """JSON health of the process, for load balancer probes, see health.py.
+
+  503 when a check fails, so the worker is drained. Route it only where the probes
+  reach, e.g. `path("health", HealthView.as_view())`.
+  """
+
+  # None follows `LOGIN_EMAIL["HEALTH_SMTP"]`.
+  smtp: t.Optional[bool] = None
+
+  def get(self, request, *args, **kwargs):
+    result = health.get_health(smtp=self.smtp)
+    return JsonResponse(result, status=503 if result["status"] == "error" else 200)
@@ -1,5 +1,20 @@
-from django_login_email import email
+import typing as t
+
+from django_login_email import conf, email
 
 
 class LoginTimeLimit(email.TimeLimit):
-  minutes = 10
+  """Token TTL from `LOGIN_EMAIL["TOKEN_TTL_MINUTES"]`, unless `minutes` is given."""
+
+  def __init__(self, minutes: t.Optional[int] = None):
+    self._minutes = minutes
+
+  @property
+  def minutes(self) -> int:
+    if self._minutes is None:
+      return conf.get_config().token_ttl_minutes
+    return self._minutes
+
+  @minutes.setter
+  def minutes(self, value: int):
+    self._minutes = value
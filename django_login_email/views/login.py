@@ -7,10 +7,10 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
 from django.views.generic.edit import FormView
 
-from django_login_email import email, errors, forms, iputils
+from django_login_email import audit, email, errors, forms, iputils
 
 from . import limit
-from .mixin import MailRecordModelMixin
+from .mixin import LoadSheddingMixin, MailRecordModelMixin, TenantViewMixin
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +21,25 @@ class MyEmailLoginInfo(email.EmailLoginInfo):
     self.from_email = settings.EMAIL_HOST_USER
 
 
-class EmailLoginView(FormView, MailRecordModelMixin, iputils.IPBanUtils):
-  """process login by email"""
+class EmailLoginView(
+  LoadSheddingMixin,
+  TenantViewMixin,
+  FormView,
+  MailRecordModelMixin,
+  iputils.IPBanUtils,
+):
+  """process login by email
+
+  Refusals answer 403 (banned), 429 with Retry-After (rate limits) or 503 (the mail
+  relay fails), with the cached error page. Over its adaptive limit, see shedding.py,
+  a POST gets 503 before any work.
+  """
 
   template_name = "login_email/login.html"
-  error_template: str = "login_email/error.html"
   success_template: str = "login_email/success.html"
 
   form_class = forms.LoginForm
+  shed_name = "login"
 
   login_info_class = MyEmailLoginInfo
   register_info_class = email.EmailRegisterInfo
@@ -40,11 +51,20 @@ class EmailLoginView(FormView, MailRecordModelMixin, iputils.IPBanUtils):
       return redirect("home")
     return super().get(request, *args, **kwargs)
 
+  def record_attempt(self, outcome: str, email: str, stages: audit.Stages):
+    """add the attempt to the audit log, see `LOGIN_EMAIL["AUDIT"]`."""
+    audit.record("login", outcome, self.get_client_ip(self.request), email, stages)
+
   def form_valid(self, form):
     """check the email"""
+    stages = audit.Stages()
+    mail = form.cleaned_data["email"]
 
     if self.is_ip_banned(self.get_client_ip(self.request)):
-      return render(self.request, self.error_template, {"error": "Your IP is banned."})
+      stages.lap("ban_check")
+      self.record_attempt("banned", mail, stages)
+      return self.reject("Your IP is banned.", 403)
+    stages.lap("ban_check")
 
     # Not allow to login if the user is already authenticated.
     if self.request.user.is_authenticated:
@@ -53,28 +73,38 @@ class EmailLoginView(FormView, MailRecordModelMixin, iputils.IPBanUtils):
     # Record the send attempt and check if rate limit is exceeded (before sending email)
     if not self.record_send(self.request):
       logger.warning(f"IP rate limit exceeded for {self.get_client_ip(self.request)}")
-      return render(
-        self.request,
-        self.error_template,
-        {"error": "Too many requests. Please try again later."},
+      stages.lap("rate_limit")
+      self.record_attempt("rate_limited_ip", mail, stages)
+      return self.reject(
+        "Too many requests. Please try again later.",
+        429,
+        retry_after=self.recorder.minutes * 60,
       )
+    stages.lap("rate_limit")
 
     try:
       # send login mail. If user not exist, send register mail.
-      self.send_login_mail(form.cleaned_data["email"])
+      self.send_login_mail(mail)
     except errors.RateLimitError as e:
       logger.warning(f"Rate limit exceeded: {e}")
-      return render(self.request, self.error_template, {"error": e})
+      stages.lap("send")
+      self.record_attempt("rate_limited_email", mail, stages)
+      return self.reject(e, 429, retry_after=self.get_cooldown_minutes() * 60)
     except errors.EmailSendError as e:
       logger.error(f"Email sending failed: {e}")
-      return render(
-        self.request,
-        self.error_template,
-        {"error": "Failed to send email. Please try again later."},
+      stages.lap("send")
+      self.record_attempt("send_failed", mail, stages)
+      retry_after = None
+      if isinstance(e, errors.CircuitOpenError):
+        retry_after = self.get_breaker().reset_timeout
+      return self.reject(
+        "Failed to send email. Please try again later.", 503, retry_after=retry_after
       )
     except ValueError as e:
       logger.error(f"Invalid mail type: {e}")
-      return render(
-        self.request, self.error_template, {"error": "Internal error occurred."}
-      )
+      stages.lap("send")
+      self.record_attempt("error", mail, stages)
+      return self.reject("Internal error occurred.", 500)
+    stages.lap("send")
+    self.record_attempt("sent", mail, stages)
     return render(self.request, self.success_template, {"form": form})
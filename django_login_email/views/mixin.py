@@ -1,52 +1,262 @@
 import datetime
+import time
+import typing as t
 
-from .. import email, models, token
+from django.db import router
+from django.db.models import F
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+from .. import conf, email, errors, models, rejections, replay, shedding, tenants, token
 from . import utils
 
 
+class TenantViewMixin(object):
+  """Use the resources of the request's tenant, see `LOGIN_EMAIL["TENANT_RESOLVER"]`.
+
+  The tenant's info classes, time limit and IP recorder are set on the view instance,
+  so a request without a tenant keeps the class attributes. The tenant is resolved in
+  `dispatch`, after LoadSheddingMixin admitted the request when it comes first.
+  """
+
+  tenant: t.Optional[tenants.TenantResources] = None
+
+  def dispatch(self, request, *args, **kwargs):
+    self.resolve_tenant(request)
+    return super().dispatch(request, *args, **kwargs)
+
+  def resolve_tenant(self, request) -> None:
+    self.tenant = tenants.resolve(request)
+    if self.tenant is None:
+      return
+    self.tl = self.tenant.tl
+    self.recorder = self.tenant.recorder
+    if hasattr(self, "login_info_class"):
+      self.login_info_class, self.register_info_class = self.tenant.get_info_classes(
+        self.login_info_class, self.register_info_class
+      )
+
+  def get_token_manager(self) -> token.TokenManager:
+    if self.tenant is not None:
+      return self.tenant.get_token_manager()
+    return super().get_token_manager()
+
+  def get_negative_cache(self) -> rejections.NegativeCache:
+    if self.tenant is not None:
+      return rejections.get_negative_cache(scope=self.tenant.scope)
+    return super().get_negative_cache()
+
+
+class RejectionMixin(object):
+  """Error pages with a status code, rendered once, see `rejections.reject`.
+
+  The cached page is rendered without the request. An `error_template` that needs it
+  (e.g. the user or a csrf token) sets `cache_rejections = False`.
+  """
+
+  error_template: str = "login_email/error.html"
+  # None follows `LOGIN_EMAIL["CACHE_REJECTIONS"]`.
+  cache_rejections: t.Optional[bool] = None
+
+  def reject(
+    self, message, status: int, retry_after: t.Optional[float] = None
+  ) -> HttpResponse:
+    cache = self.cache_rejections
+    if cache is None:
+      cache = conf.get_config().cache_rejections
+    if cache:
+      return rejections.reject(self.error_template, message, status, retry_after)
+    response = render(
+      self.request, self.error_template, {"error": message}, status=status
+    )
+    if retry_after is not None:
+      response["Retry-After"] = str(int(retry_after))
+    return response
+
+
+class LoadSheddingMixin(RejectionMixin):
+  """Refuse requests over the adaptive limit of the view with a fast 503.
+
+  See shedding.py. `load_shedding` (None follows `LOGIN_EMAIL["LOAD_SHEDDING"]`) and
+  `shed_options` (e.g. `{"target_ms": 300}`) configure each view, views with the same
+  `shed_name` share a limiter. It comes before TenantViewMixin, so a refused request
+  does not load its tenant.
+  """
+
+  load_shedding: t.Optional[bool] = None
+  shed_name: str = ""
+  shed_methods: t.Tuple[str, ...] = ("POST",)
+  shed_options: t.ClassVar[t.Dict[str, t.Any]] = {}
+
+  def get_limiter(self) -> t.Optional[shedding.AdaptiveLimiter]:
+    enabled = self.load_shedding
+    if enabled is None:
+      enabled = conf.get_config().load_shedding
+    if not enabled:
+      return None
+    return shedding.get_limiter(
+      self.shed_name or type(self).__name__, **self.shed_options
+    )
+
+  def dispatch(self, request, *args, **kwargs):
+    limiter = self.get_limiter() if request.method in self.shed_methods else None
+    if limiter is None:
+      return super().dispatch(request, *args, **kwargs)
+    if not limiter.acquire():
+      return self.reject("The service is busy. Please try again later.", 503, 1)
+    start = time.perf_counter()
+    ok = False
+    try:
+      response = super().dispatch(request, *args, **kwargs)
+      ok = response.status_code < 500
+      return response
+    finally:
+      limiter.release(time.perf_counter() - start, ok)
+
+
 class MailRecordModelMixin(email.EmailFunc):
   """Here is an example for MailRecord, using django model. You could implement yourself."""
 
+  # database alias for writes, None leaves it to the routers.
+  write_db: t.Optional[str] = None
+  # "record" or "table", None reads `LOGIN_EMAIL["TOKEN_STORE"]`.
+  token_store: t.Optional[str] = None
+
+  def get_write_db(self, model: t.Optional[type] = None) -> str:
+    """The alias of the writes, and of the reads they depend on."""
+    return self.write_db or router.db_for_write(model or models.EmailRecord)
+
+  def get_tokens(self):
+    return models.EmailToken.objects.using(self.get_write_db(models.EmailToken))
+
+  def get_records(self):
+    return models.EmailRecord.objects.using(self.get_write_db())
+
+  def get_token_store(self) -> str:
+    return self.token_store or conf.get_config().token_store
+
+  def consumes_tokens(self) -> bool:
+    return self.get_token_store() == "table"
+
   def reset_mail(self, mail: str):
     """reset mail token expired time."""
+    delta = datetime.timedelta(minutes=self.tl.minutes)
+    if self.consumes_tokens():
+      self.get_tokens().filter(email=mail).update(expired_time=F("expired_time") - delta)
+      self.release_cooldown(mail)
+      return
     # models.EmailLogin.objects.filter(email=mail).delete()
-    e = models.EmailRecord.objects.get(email=mail)
-    e.expired_time = e.expired_time - datetime.timedelta(minutes=self.tl.minutes)
+    e = self.get_records().get(email=mail)
+    e.expired_time = e.expired_time - delta
     e.validated = False
     e.save()
+    self.release_cooldown(mail)
 
-  def get_mail_record(self, mail: str) -> email.MailRecord:
+  def get_mail_record(self, mail: str, using: t.Optional[str] = None) -> email.MailRecord:
     """get mail record to validate the salt, and validated status."""
     # for easy to change. use a function.
-    try:
-      e = models.EmailRecord.objects.get(email=mail)
-      return email.MailRecord(
-        email=e.email, expired_time=e.expired_time, validated=e.validated, salt=e.salt
-      )
-    except models.EmailRecord.DoesNotExist:
+    if self.consumes_tokens():
+      return self._get_latest_token(mail, using)
+    # only the four columns, no model instance.
+    row = (
+      models.EmailRecord.objects.using(using or self.read_db)
+      .filter(email=mail)
+      .values_list("expired_time", "validated", "salt")
+      .first()
+    )
+    if row is None:
+      return email.MailRecord(email=mail, expired_time=None, validated=False, salt="")
+    expired_time, validated, salt = row
+    return email.MailRecord(
+      email=mail, expired_time=expired_time, validated=validated, salt=salt
+    )
+
+  def _get_latest_token(self, mail: str, using: t.Optional[str]) -> email.MailRecord:
+    # the newest token decides the cooldown, on the email index.
+    row = (
+      models.EmailToken.objects.using(using or self.read_db)
+      .filter(email=mail)
+      .order_by("-expired_time")
+      .values_list("expired_time", "consumed")
+      .first()
+    )
+    if row is None:
       return email.MailRecord(email=mail, expired_time=None, validated=False, salt="")
+    return email.MailRecord(email=mail, expired_time=row[0], validated=row[1], salt="")
+
+  def get_mail_record_for_write(self, mail: str) -> email.MailRecord:
+    model = models.EmailToken if self.consumes_tokens() else models.EmailRecord
+    return self.get_mail_record(mail, using=self.get_write_db(model))
 
   def transform_timestamp(self, ts: int) -> datetime.datetime:
     return utils.transform_timestamp(ts)
 
   def save_token(self, token: token.TokenDict):
     """When generate new token, should call this method."""
-    try:
-      mail = models.EmailRecord.objects.get(email=token["email"])
-      mail.salt = token["salt"]
-      mail.expired_time = self.transform_timestamp(token["expired_time"])
-      mail.mail_type = token["mail_type"]
-      mail.validated = False
-      mail.save()
-
-    except models.EmailRecord.DoesNotExist:
-      models.EmailRecord.objects.create(
-        email=token["email"],
-        salt=token["salt"],
-        expired_time=self.transform_timestamp(token["expired_time"]),
-        mail_type=token["mail_type"],
-        validated=False,
-      )
+    if self.consumes_tokens():
+      self._insert_token(token)
+      return
+    fields = {
+      "salt": token["salt"],
+      "expired_time": self.transform_timestamp(token["expired_time"]),
+      "mail_type": token["mail_type"],
+      "validated": False,
+    }
+    # one UPDATE for a known email, no SELECT and no model instance.
+    records = self.get_records()
+    if not records.filter(email=token["email"]).update(**fields):
+      records.create(email=token["email"], **fields)
+
+  def _insert_token(self, token: token.TokenDict):
+    tokens = self.get_tokens().filter(email=token["email"])
+    # expired tokens of the email go now, the rest with purge_login_tokens.
+    tokens.filter(expired_time__lte=timezone.now()).delete()
+    # at most `TOKEN_MAX_PER_EMAIL` outstanding, the oldest are dropped.
+    keep = conf.get_config().token_max_per_email - 1
+    old = list(
+      tokens.filter(consumed=False)
+      .order_by("-expired_time")
+      .values_list("pk", flat=True)[keep:]
+    )
+    if old:
+      self.get_tokens().filter(pk__in=old).delete()
+    self.get_tokens().create(
+      id=replay.token_id(token["salt"]),
+      email=token["email"],
+      mail_type=token["mail_type"],
+      expired_time=self.transform_timestamp(token["expired_time"]),
+    )
+
+  def discard_token(self, token: token.TokenDict):
+    """Drop the token of an unsent mail, the cooldown read from the record ends."""
+    if self.consumes_tokens():
+      self.get_tokens().filter(pk=replay.token_id(token["salt"])).delete()
+      return
+    # expired, and disabled: the link never arrived and the cooldown is over.
+    expired_time = timezone.now() - datetime.timedelta(
+      minutes=self.get_cooldown_minutes()
+    )
+    self.get_records().filter(email=token["email"], salt=token["salt"]).update(
+      expired_time=expired_time, validated=True
+    )
 
   def disable_token(self, token: token.TokenDict):
-    models.EmailRecord.objects.filter(salt=token["salt"]).update(validated=True)
+    if self.consumes_tokens():
+      self.get_tokens().filter(pk=replay.token_id(token["salt"])).update(consumed=True)
+      return
+    self.get_records().filter(salt=token["salt"]).update(validated=True)
+
+  def consume_token(self, token: token.TokenDict):
+    """One UPDATE on the primary key, the row lock is held only by this token."""
+    tid = replay.token_id(token["salt"])
+    tokens = self.get_tokens().filter(pk=tid)
+    if tokens.filter(consumed=False, expired_time__gt=timezone.now()).update(
+      consumed=True
+    ):
+      return
+    # refused, a second read tells why.
+    consumed = tokens.values_list("consumed", flat=True).first()
+    if consumed:
+      raise errors.ValidatedError("Token already validated.")
+    raise errors.TokenError("Invalid token.")
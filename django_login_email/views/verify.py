@@ -0,0 +1,153 @@
+import logging
+import typing as t
+from typing import Any
+
+from django.http import Http404, HttpRequest, HttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.generic import TemplateView
+
+from django_login_email import audit, conf, email, errors, iputils, rejections
+
+from . import limit
+from .mixin import LoadSheddingMixin, MailRecordModelMixin, TenantViewMixin
+
+logger = logging.getLogger(__name__)
+
+
+class EmailVerifyView(
+  LoadSheddingMixin,
+  TenantViewMixin,
+  TemplateView,
+  email.EmailVerifyMixin,
+  MailRecordModelMixin,
+  iputils.IPBanUtils,
+):
+  """verify token in url
+
+  With `confirm` (`LOGIN_EMAIL["VERIFY_CONFIRM"]` by default), the GET only renders
+  `confirm_template`, and the token is verified by its POST. Mail scanners which
+  prefetch the link then neither consume the token nor touch the database.
+
+  An IP with more than `LOGIN_EMAIL["VERIFY_FAILURE_LIMIT"]` failures is refused
+  before the token is read, with 429 and Retry-After until its counter expires.
+  Refused tokens get 403. A link clicked again is not a failure. Over its adaptive
+  limit, see shedding.py, a request gets 503 before any work.
+  """
+
+  tl = limit.LoginTimeLimit()
+  confirm_template: str = "login_email/confirm.html"
+  # None follows `LOGIN_EMAIL["VERIFY_CONFIRM"]`.
+  confirm: t.Optional[bool] = None
+  shed_name = "verify"
+  shed_methods = ("GET", "POST")
+
+  def get_confirm(self) -> bool:
+    if self.confirm is None:
+      return conf.get_config().verify_confirm
+    return self.confirm
+
+  def get_failure_recorder(self) -> iputils.Recorder:
+    return rejections.get_failure_recorder()
+
+  def is_throttled(self) -> bool:
+    return self.get_failure_recorder().exceeded(self.get_client_ip(self.request))
+
+  def record_failure(self):
+    """count the failure, the IP is throttled once it reaches the limit."""
+    self.get_failure_recorder().record(self.get_client_ip(self.request))
+
+  def render_throttled(self) -> HttpResponse:
+    return self.reject(
+      "Too many failed attempts. Please try again later.",
+      429,
+      retry_after=self.get_failure_recorder().minutes * 60,
+    )
+
+  def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+    token = request.GET.get("token", None)
+    if token is None:
+      raise Http404("Invalid Request")
+    if self.is_throttled():
+      return self.render_throttled()
+    if self.get_confirm():
+      return self.render_confirm(token)
+    return self.verify(token)
+
+  def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+    token = request.POST.get("token", None)
+    if token is None:
+      raise Http404("Invalid Request")
+    if self.is_throttled():
+      return self.render_throttled()
+    return self.verify(token)
+
+  def render_confirm(self, token: str) -> HttpResponse:
+    """the landing page of the link, only decrypts the token."""
+    try:
+      token_d = self.peek_token(token)
+    except errors.ValidatedError as e:
+      return self.reject(e, 403)
+    except errors.TokenError:
+      self.get_negative_cache().add(token)
+      self.record_failure()
+      return self.reject("Invalid or expired token.", 403)
+    except (ValueError, KeyError) as e:
+      logger.error(f"Token decryption/parsing error: {e}")
+      self.get_negative_cache().add(token)
+      self.record_failure()
+      raise Http404("Invalid Request")
+    response = render(
+      self.request,
+      self.confirm_template,
+      {"token": token, "email": token_d["email"]},
+    )
+    # the page holds a live token.
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+  def record_attempt(self, outcome: str, stages: audit.Stages, email: str = ""):
+    """add the attempt to the audit log, see `LOGIN_EMAIL["AUDIT"]`."""
+    audit.record("verify", outcome, self.get_client_ip(self.request), email, stages)
+
+  def verify(self, token: str) -> HttpResponse:
+    stages = audit.Stages()
+    try:
+      self.verify_login_mail(request=self.request, token_v=token)
+    except errors.ValidatedError as e:
+      # a second click, or a mail scanner, not someone guessing tokens.
+      stages.lap("verify")
+      self.record_attempt("validated", stages)
+      return self.reject(e, 403)
+    except errors.TokenError as e:
+      logger.error(f"Token error: {e}")
+      stages.lap("verify")
+      self.record_failure()
+      self.record_attempt("rejected", stages)
+      return self.reject("Invalid or expired token.", 403)
+    except errors.InactiveUserError as e:
+      logger.warning(f"Inactive user attempted login: {e}")
+      stages.lap("verify")
+      self.record_attempt("inactive", stages)
+      return self.reject("Your account is inactive.", 403)
+    except (ValueError, KeyError) as e:
+      logger.error(f"Token decryption/parsing error: {e}")
+      stages.lap("verify")
+      self.record_failure()
+      self.record_attempt("invalid", stages)
+      raise Http404("Invalid Request")
+    stages.lap("verify")
+    self.record_attempt("verified", stages, self.request.user.email)
+    return redirect(self.get_success_url())
+
+  def get_success_url(self):
+    return reverse("login_email:home")
+
+
+class EmailLogoutView(TemplateView, email.EmailLogoutMixin):
+  login_url: str = "login_email:login"
+
+  def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+    self.logout(request=request)
+    return redirect(self.login_url)
@@ -0,0 +1,147 @@
+# Warm-up of a fresh process.
+#
+# The first requests of a worker otherwise pay for the pycryptodome import and key
+# derivation, the template compilation, the compiled mail bodies and the first database
+# and cache connections. `warm_up()` does that work ahead:
+#
+# - `LOGIN_EMAIL["WARM_UP_ON_READY"]` runs it from `AppConfig.ready` without the
+#   database and cache steps, for the package's own views. With gunicorn `--preload`
+#   the master warms once and the workers inherit it: no connection is opened before
+#   the fork.
+# - `warm_up()` or `manage.py warm_login_email` in gunicorn `post_fork` run every step
+#   in the worker, connections included, for the views of the URLconf: subclasses of
+#   EmailLoginView and EmailVerifyView with their templates, info classes and token TTL.
+#
+# `AppConfig.ready` never reads the URLconf: it may run before other apps are ready,
+# e.g. before the admin has registered its models.
+#
+# A failing step is logged and skipped, warming up never stops a worker from starting.
+import logging
+import time
+import typing as t
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template import loader
+from django.urls import get_resolver
+from django.utils import translation
+
+from . import conf, models, rejections, render, tenants, token
+
+logger = logging.getLogger(__name__)
+
+# an address and a mailbox that are never real.
+PROBE_IP = "192.0.2.1"
+PROBE_EMAIL = "warm-up@example.invalid"
+
+
+def _view_classes(patterns=None) -> t.Iterator[type]:
+  """Class-based views of the URLconf."""
+  if patterns is None:
+    patterns = get_resolver().url_patterns
+  for p in patterns:
+    if hasattr(p, "url_patterns"):
+      yield from _view_classes(p.url_patterns)
+    elif hasattr(p.callback, "view_class"):
+      yield p.callback.view_class
+
+
+def _views(urlconf: bool = True) -> t.Tuple[t.List[type], t.List[type]]:
+  """The login and verify views routed by the project, or the package's own ones."""
+  from .views.login import EmailLoginView
+  from .views.verify import EmailVerifyView
+
+  if not urlconf:
+    return [EmailLoginView], [EmailVerifyView]
+  classes = set(_view_classes())
+  return (
+    [c for c in classes if issubclass(c, EmailLoginView)],
+    [c for c in classes if issubclass(c, EmailVerifyView)],
+  )
+
+
+def _tenant_resources() -> t.List[tenants.TenantResources]:
+  """The tenants of `LOGIN_EMAIL["TENANTS"]`, as many as the tenant cache keeps."""
+  c = conf.get_config()
+  if not c.tenant_resolver or c.tenant_loader:
+    return []
+  ids = list(c.tenants or {})[: c.tenant_cache_size]
+  return [r for r in map(tenants.get_resources, ids) if r is not None]
+
+
+def warm_keys(urlconf: bool = True) -> None:
+  """Derive the token keys, and encrypt and decrypt a token once."""
+  login_views, verify_views = _views(urlconf)
+  ttls = {view.tl.minutes for view in login_views + verify_views} or {1}
+  managers = [token.TokenManager(minutes) for minutes in ttls]
+  managers += [r.get_token_manager() for r in _tenant_resources()]
+  for manager in managers:
+    manager.decrypt_token(manager.encrypt_mail(PROBE_EMAIL, "login", lambda _: None))
+
+
+def warm_templates(urlconf: bool = True) -> None:
+  """Compile the page templates, the error pages and the mail bodies of the views."""
+  login_views, verify_views = _views(urlconf)
+  names = {view.template_name for view in login_views}
+  names.update(view.success_template for view in login_views)
+  names.update(view.confirm_template for view in verify_views)
+  names.update(view.error_template for view in login_views + verify_views)
+  for name in names:
+    loader.get_template(name)
+
+  resources = _tenant_resources()
+  with translation.override(settings.LANGUAGE_CODE):
+    for view in login_views:
+      bases = (view.login_info_class, view.register_info_class)
+      for classes in [bases] + [r.get_info_classes(*bases) for r in resources]:
+        for info_class in classes:
+          # e.g. the base classes, a mail needs a system name.
+          if getattr(info_class, "system_name", None) is not None:
+            render.get_compiled(info_class())
+      rejections.get_page(view.error_template, "Your IP is banned.")
+
+
+def warm_database() -> None:
+  """Open the connections of the ban and mail record lookups.
+
+  Bans are not cached, `is_ip_banned` reads IPBan on each request: there is no ban
+  cache to prime, only the connection.
+  """
+  models.IPBan.objects.filter(ip=PROBE_IP).exists()
+  models.EmailRecord.objects.filter(email=PROBE_EMAIL).exists()
+
+
+def warm_cache() -> None:
+  """Connect to the cache of the rate limits."""
+  caches[conf.get_config().cache_alias].get("login_email:warm-up")
+
+
+STEPS: t.Dict[str, t.Callable[[], None]] = {
+  "keys": warm_keys,
+  "templates": warm_templates,
+  "database": warm_database,
+  "cache": warm_cache,
+}
+# steps that open connections, not shared across a fork.
+CONNECTION_STEPS = ("database", "cache")
+# steps of the views, found in the URLconf with `urlconf`.
+VIEW_STEPS = ("keys", "templates")
+
+
+def warm_up(
+  connections: bool = True, urlconf: bool = True
+) -> t.Dict[str, t.Optional[float]]:
+  """Run the steps, step -> seconds, None when it failed."""
+  timings: t.Dict[str, t.Optional[float]] = {}
+  for name, step in STEPS.items():
+    if not connections and name in CONNECTION_STEPS:
+      continue
+    start = time.perf_counter()
+    try:
+      step(urlconf) if name in VIEW_STEPS else step()
+    except Exception:
+      logger.warning("login_email warm-up: %s failed", name, exc_info=True)
+      timings[name] = None
+      continue
+    timings[name] = time.perf_counter() - start
+  return timings
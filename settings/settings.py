@@ -95,8 +95,15 @@ database_sqlite = {
   "NAME": BASE_DIR / "db.sqlite3",
 }
 
+# Example read replica, used with `django_login_email.routers.LoginEmailRouter`.
+database_sqlite_replica = {
+  "ENGINE": "django.db.backends.sqlite3",
+  "NAME": BASE_DIR / "db-replica.sqlite3",
+}
+
 DATABASES = {
   "default": database_sqlite,
+  "replica": database_sqlite_replica,
 }
 
 
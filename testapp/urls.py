@@ -8,4 +8,5 @@ urlpatterns = [
   path("login", v.LoginView.as_view(), name="login"),
   path("verify", v.VerifyView.as_view(), name="verify"),
   path("logout", v.LogoutView.as_view(), name="logout"),
+  path("health", v.HealthView.as_view(), name="health"),
 ]
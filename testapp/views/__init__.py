@@ -20,3 +20,7 @@ class VerifyView(v.EmailVerifyView):
 
 class LogoutView(v.EmailLogoutView):
   pass
+
+
+class HealthView(v.HealthView):
+  pass
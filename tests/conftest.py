@@ -0,0 +1,10 @@
+import pytest
+from django.core.cache import caches
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+  """cooldowns and rate limits live in the cache, do not leak them between tests."""
+  for c in caches.all():
+    c.clear()
+  yield
@@ -0,0 +1,113 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from django_login_email import (
+  admin,
+  audit,
+  cooldown,
+  iputils,
+  models,
+  rejections,
+  tenants,
+)
+
+
+@pytest.fixture
+def records(db):
+  future = timezone.now() + timezone.timedelta(minutes=10)
+  return [
+    models.EmailRecord.objects.create(
+      email=f"user{i}@163.com", expired_time=future, mail_type="login", salt=str(i)
+    )
+    for i in range(3)
+  ]
+
+
+def test_paginator_estimate(records):
+  qs = models.EmailRecord.objects.order_by("pk")
+  with mock.patch.object(admin, "estimate_count", return_value=5_000_000):
+    assert admin.EstimatedCountPaginator(qs, 100).count == 5_000_000
+    assert admin.EstimatedCountPaginator(qs.filter(validated=False), 100).count == 3
+
+  with mock.patch.object(admin, "estimate_count", return_value=None):
+    assert admin.EstimatedCountPaginator(qs, 100).count == 3
+
+
+def test_changelist(admin_client, records):
+  url = reverse("admin:django_login_email_emailrecord_changelist")
+  r = admin_client.get(url, {"q": "user1", "mail_type": "login", "validated__exact": 0})
+  assert r.status_code == 200
+  assert list(r.context["cl"].result_list) == [records[1]]
+
+
+def test_expire(admin_client, records):
+  c = cooldown.get_cooldown()
+  c.claim(records[0].email, 600)
+
+  url = reverse("admin:django_login_email_emailrecord_changelist")
+  admin_client.post(
+    url, {"action": "expire", "_selected_action": [r.pk for r in records[:2]]}
+  )
+
+  assert models.EmailRecord.objects.filter(validated=True).count() == 2
+  assert c.claim(records[0].email, 600)
+
+
+def test_unban(admin_client, db):
+  recorder = iputils.Recorder()
+  for _ in range(recorder.times + 1):
+    recorder.record("10.0.0.1")
+  ban = models.IPBan.objects.get(ip="10.0.0.1")
+
+  url = reverse("admin:django_login_email_ipban_changelist")
+  r = admin_client.get(url, {"q": "10.0.0.1"})
+  assert list(r.context["cl"].result_list) == [ban]
+
+  admin_client.post(url, {"action": "unban", "_selected_action": [ban.pk]})
+  assert not models.IPBan.objects.exists()
+  assert cache.get("10.0.0.1") is None
+
+
+@override_settings(LOGIN_EMAIL={"TENANTS": {"acme": {"ban_scope": "tenant"}}})
+def test_unban_resets_every_counter(admin_client, db):
+  ip = "10.0.0.2"
+  recorders = [
+    iputils.Recorder(prefix=tenants.get_recorder_prefix("acme")),
+    rejections.get_failure_recorder(),
+  ]
+  for recorder in recorders:
+    for _ in range(recorder.times):
+      recorder.record(ip)
+    assert recorder.exceeded(ip)
+  ban = models.IPBan.add_ip_ban(ip, "test")
+
+  url = reverse("admin:django_login_email_ipban_changelist")
+  admin_client.post(url, {"action": "unban", "_selected_action": [ban.pk]})
+  assert not any(recorder.exceeded(ip) for recorder in recorders)
+
+
+def test_purge_releases_the_cooldown(admin_client, records):
+  c = cooldown.get_cooldown()
+  c.claim(records[0].email, 600)
+
+  url = reverse("admin:django_login_email_emailrecord_changelist")
+  admin_client.post(url, {"action": "purge", "_selected_action": [records[0].pk]})
+
+  assert not models.EmailRecord.objects.filter(pk=records[0].pk).exists()
+  assert c.claim(records[0].email, 600)
+
+
+def test_login_attempt_search_by_email(admin_client):
+  models.LoginAttempt.objects.create(
+    kind="login", outcome="sent", email_hash=audit.email_hash("a@b.com")
+  )
+  models.LoginAttempt.objects.create(kind="login", outcome="sent")
+  url = reverse("admin:django_login_email_loginattempt_changelist")
+  res = admin_client.get(url, {"q": "A@b.com"})
+  assert res.status_code == 200
+  assert res.context["cl"].result_count == 1
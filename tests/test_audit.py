@@ -0,0 +1,167 @@
+import datetime
+import threading
+import time
+import types
+
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from django_login_email import audit
+from django_login_email.models import LoginAttempt
+
+# the background thread never flushes during a test.
+NEVER = 10**9
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+  b = audit.AuditBuffer(capacity=3, flush_size=NEVER, flush_interval_ms=NEVER)
+  monkeypatch.setattr(audit, "_buffer", b)
+  return b
+
+
+def test_ring_buffer_keeps_newest(db, buffer):
+  for i in range(5):
+    buffer.add({"kind": "login", "outcome": str(i)})
+  assert buffer.metrics() == {"buffered": 3, "written": 0, "dropped": 2}
+  assert LoginAttempt.objects.count() == 0
+
+  assert buffer.flush() == 3
+  outcomes = LoginAttempt.objects.values_list("outcome", flat=True)
+  assert sorted(outcomes) == ["2", "3", "4"]
+
+
+def test_ip_is_normalized():
+  assert audit.normalize_ip(" 10.0.0.1 ") == "10.0.0.1"
+  assert audit.normalize_ip("2001:DB8::1") == "2001:db8::1"
+  assert audit.normalize_ip("1.2.3.4, evil") is None
+  assert audit.normalize_ip("") is None
+
+
+def test_bad_row_does_not_lose_the_batch(db, buffer, monkeypatch):
+  def bulk_create(*args, **kwargs):
+    raise IntegrityError("bad row")
+
+  create = LoginAttempt.objects.create
+
+  def create_one(**kwargs):
+    if kwargs["outcome"] == "bad":
+      raise IntegrityError("bad row")
+    return create(**kwargs)
+
+  monkeypatch.setattr(LoginAttempt.objects, "bulk_create", bulk_create)
+  monkeypatch.setattr(LoginAttempt.objects, "create", create_one)
+  for outcome in ("a", "bad", "b"):
+    buffer.add({"kind": "login", "outcome": outcome})
+  assert buffer.flush() == 2
+  assert sorted(LoginAttempt.objects.values_list("outcome", flat=True)) == ["a", "b"]
+  assert buffer.metrics() == {"buffered": 0, "written": 2, "dropped": 1}
+
+
+def test_failed_flush_is_queued_again(db, buffer, monkeypatch):
+  def fail(*args, **kwargs):
+    raise OperationalError("database is down")
+
+  def create(**kwargs):
+    raise AssertionError("an outage is not retried row by row")
+
+  monkeypatch.setattr(LoginAttempt.objects, "bulk_create", fail)
+  monkeypatch.setattr(LoginAttempt.objects, "create", create)
+  for i in range(2):
+    buffer.add({"kind": "login", "outcome": str(i)})
+  with pytest.raises(OperationalError):
+    buffer.flush()
+  assert buffer.metrics() == {"buffered": 2, "written": 0, "dropped": 0}
+
+  monkeypatch.undo()
+  assert buffer.flush() == 2
+  assert sorted(LoginAttempt.objects.values_list("outcome", flat=True)) == ["0", "1"]
+
+
+def test_outage_during_the_row_by_row_flush(db, buffer, monkeypatch):
+  def bulk_create(*args, **kwargs):
+    raise IntegrityError("bad row")
+
+  create = LoginAttempt.objects.create
+
+  def create_one(**kwargs):
+    if kwargs["outcome"] != "a":
+      raise OperationalError("database is down")
+    return create(**kwargs)
+
+  monkeypatch.setattr(LoginAttempt.objects, "bulk_create", bulk_create)
+  monkeypatch.setattr(LoginAttempt.objects, "create", create_one)
+  for outcome in ("a", "b", "c"):
+    buffer.add({"kind": "login", "outcome": outcome})
+  with pytest.raises(OperationalError):
+    buffer.flush()
+  assert buffer.metrics() == {"buffered": 2, "written": 1, "dropped": 0}
+
+
+def test_one_flush_thread(buffer, monkeypatch):
+  started = []
+
+  class SlowThread(object):
+    def __init__(self, **kwargs):
+      time.sleep(0.01)
+
+    def start(self):
+      started.append(self)
+
+  monkeypatch.setattr(audit, "threading", types.SimpleNamespace(Thread=SlowThread))
+  barrier = threading.Barrier(8)
+
+  def add():
+    barrier.wait()
+    buffer._ensure_thread()
+
+  threads = [threading.Thread(target=add) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(started) == 1
+
+
+def test_disabled_by_default(buffer):
+  audit.record("login", "sent", "127.0.0.1", "a@b.com")
+  assert buffer.metrics()["buffered"] == 0
+
+
+@override_settings(LOGIN_EMAIL={"AUDIT": True})
+def test_login_view_records_attempt(db, client, buffer):
+  client.post(reverse("login_email:login"), {"email": " Svtter@163.com"})
+  buffer.flush()
+  a = LoginAttempt.objects.get()
+  assert a.kind == "login"
+  assert a.outcome == "sent"
+  assert a.ip == "127.0.0.1"
+  assert a.email_hash == audit.email_hash("svtter@163.com")
+  assert set(a.stages) == {"ban_check", "rate_limit", "send"}
+
+
+def test_purge_command(db):
+  now = timezone.now()
+  LoginAttempt.objects.bulk_create(
+    [
+      LoginAttempt(kind="login", outcome="sent", created_at=now),
+      LoginAttempt(
+        kind="login", outcome="sent", created_at=now - datetime.timedelta(days=100)
+      ),
+    ]
+  )
+  call_command("purge_login_attempts", "--days", "30")
+  assert LoginAttempt.objects.count() == 1
+
+
+@override_settings(LOGIN_EMAIL={"AUDIT_RETENTION_DAYS": 30})
+def test_purge_command_zero_days(db):
+  LoginAttempt.objects.create(
+    kind="login", outcome="sent", created_at=timezone.now() - datetime.timedelta(hours=1)
+  )
+  call_command("purge_login_attempts", "--days", "0")
+  assert LoginAttempt.objects.count() == 0
@@ -0,0 +1,77 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+
+from django_login_email import checks, conf, iputils
+from django_login_email.views.limit import LoginTimeLimit
+
+
+def test_defaults():
+  c = conf.get_config()
+  assert c.token_ttl_minutes == 10
+  assert c.cache_alias == "default"
+
+
+@override_settings(LOGIN_EMAIL={"TOKEN_TTL_MINUTES": 15, "RATE_LIMIT_TIMES": 5})
+def test_login_email_dict():
+  assert conf.get_config().token_ttl_minutes == 15
+  assert LoginTimeLimit().minutes == 15
+  assert LoginTimeLimit(3).minutes == 3
+  assert iputils.Recorder().times == 5
+
+
+@override_settings(LOGIN_EMAIL_BATCH_SIZE=10, USE_X_FORWARDED_FOR=True)
+def test_legacy_names():
+  c = conf.get_config()
+  assert c.batch_size == 10
+  assert c.use_x_forwarded_for is True
+
+
+@override_settings(LOGIN_EMAIL_BATCH_SIZE=10, LOGIN_EMAIL={"BATCH_SIZE": 20})
+def test_dict_wins_over_legacy():
+  assert conf.get_config().batch_size == 20
+
+
+def test_reload_on_change():
+  assert conf.get_config().token_ttl_minutes == 10
+  with override_settings(LOGIN_EMAIL={"TOKEN_TTL_MINUTES": 1}):
+    assert conf.get_config().token_ttl_minutes == 1
+  assert conf.get_config().token_ttl_minutes == 10
+
+
+@pytest.mark.parametrize(
+  "values",
+  [
+    {"TOKEN_TTL_MINUTES": 0},
+    {"TOKEN_TTL_MINUTES": True},
+    {"COOLDOWN_BACKEND": "redis"},
+    {"BREAKER_FAILURE_RATE": 1.5},
+    {"CACHE_ALIAS": "missing"},
+  ],
+)
+def test_invalid(values):
+  assert conf.validate(values)
+  with override_settings(LOGIN_EMAIL=values):
+    with pytest.raises(ImproperlyConfigured):
+      conf.get_config()
+    assert [e.id for e in checks.check_settings(None)] == ["django_login_email.E001"]
+
+
+@override_settings(LOGIN_EMAIL={"TOKEN_TTL": 5, "SEND_TIMEOUT": None})
+def test_unknown_key_warning():
+  assert [e.id for e in checks.check_settings(None)] == ["django_login_email.W001"]
+  assert conf.get_config().send_timeout is None
+
+
+@override_settings(LOGIN_EMAIL={"TRUSTED_PROXIES": ["10.0.0.0/8", "192.0.2.1"]})
+def test_trusted_proxies_parsed_once():
+  networks = conf.get_config().trusted_proxies
+  assert [str(n) for n in networks] == ["10.0.0.0/8", "192.0.2.1/32"]
+  assert conf.validate({"TRUSTED_PROXIES": ["10.0.0.0/33"]})
+  assert conf.validate({"TRUSTED_PROXIES": "10.0.0.0/8"})
+
+
+@override_settings(LOGIN_EMAIL={"MAIL_DISPATCH": "async"})
+def test_async_dispatch_requires_aiosmtplib(monkeypatch):
+  monkeypatch.setattr(checks.importlib.util, "find_spec", lambda name: None)
+  assert [e.id for e in checks.check_mail_dispatch(None)] == ["django_login_email.E003"]
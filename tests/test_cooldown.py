@@ -0,0 +1,112 @@
+import datetime
+
+import pytest
+from django.test import override_settings
+
+from django_login_email import cooldown, errors, smtp
+from django_login_email.email import EmailFunc, MailRecord, TimeLimit
+from django_login_email.token import TokenDict
+
+sample_mail = "svtter@163.com"
+
+
+class Mixin(EmailFunc):
+  tl = TimeLimit()
+  expired_time = None
+
+  def __init__(self):
+    self.reads = 0
+
+  def get_mail_record(self, mail: str) -> MailRecord:
+    self.reads += 1
+    return MailRecord(
+      email=mail, expired_time=self.expired_time, validated=False, salt=""
+    )
+
+  def save_token(self, token: TokenDict):
+    pass
+
+  def disable_token(self, token: TokenDict):
+    pass
+
+
+def test_normalize_email():
+  c = cooldown.CacheCooldown()
+  assert c.key(" Svtter@163.com") == c.key("svtter@163.com")
+
+
+def test_rejection_without_db_read():
+  e = Mixin()
+  assert e.check_could_send(sample_mail)
+  assert e.reads == 1
+
+  assert not e.check_could_send(sample_mail)
+  assert not e.check_could_send(sample_mail.upper())
+  assert e.reads == 1
+
+
+def test_db_fallback():
+  """the cache lost the cooldown, but the record is still valid."""
+  e = Mixin()
+  e.expired_time = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
+    minutes=5
+  )
+  assert not e.check_could_send(sample_mail)
+  assert e.reads == 1
+
+  assert not e.check_could_send(sample_mail)
+  assert e.reads == 1
+
+
+@override_settings(LOGIN_EMAIL_COOLDOWN_BACKEND="database")
+def test_database_backend():
+  e = Mixin()
+  assert e.check_could_send(sample_mail)
+  assert e.check_could_send(sample_mail)
+  assert e.reads == 2
+
+
+def test_release_on_send_error():
+  class Failed(Mixin):
+    def check_user(self, email) -> bool:
+      return True
+
+    def send_valid(self, email: str, mail_type: str):
+      raise errors.EmailSendError("boom")
+
+  e = Failed()
+  with pytest.raises(errors.EmailSendError):
+    e.send_login_mail(sample_mail)
+  assert e.check_could_send(sample_mail)
+
+
+@override_settings(LOGIN_EMAIL={"MAIL_DISPATCH": "async"})
+def test_release_when_the_sender_cannot_start(monkeypatch):
+  def get_sender():
+    raise ImportError("No module named 'aiosmtplib'")
+
+  monkeypatch.setattr(smtp, "get_sender", get_sender)
+  saved = []
+
+  class Async(Mixin):
+    def check_user(self, email) -> bool:
+      return True
+
+    def save_token(self, token: TokenDict):
+      saved.append(token)
+
+  e = Async()
+  with pytest.raises(errors.EmailSendError):
+    e.send_login_mail(sample_mail)
+  assert saved == []
+  assert e.check_could_send(sample_mail)
+
+
+@override_settings(LOGIN_EMAIL={"COOLDOWN_MINUTES": 2})
+def test_cooldown_shorter_than_ttl():
+  """a token with 10 minutes TTL, saved 3 minutes ago, 2 minutes cooldown."""
+  e = Mixin()
+  e.expired_time = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
+    minutes=7
+  )
+  assert e.check_could_send(sample_mail)
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from django_login_email import checks, domains, forms
+
+
+@pytest.fixture
+def blocklist(tmp_path):
+  p = tmp_path / "blocklist.txt"
+  p.write_text("# disposable\nmailinator.com\nTempMail.org  # upper case\n\n")
+  return p
+
+
+def test_iter_suffixes():
+  assert list(domains.iter_suffixes("a.b.com")) == ["a.b.com", "b.com", "com"]
+
+
+def test_blocklist(blocklist):
+  f = domains.DomainFilter(blocklist_path=str(blocklist))
+  assert not f.is_allowed("bot@mailinator.com")
+  assert not f.is_allowed("bot@eu.Mailinator.com")
+  assert not f.is_allowed("bot@tempmail.org")
+  assert f.is_allowed("svtter@163.com")
+  assert f.is_allowed("bot@notmailinator.com")
+
+
+def test_allowlist(tmp_path):
+  p = tmp_path / "allowlist.txt"
+  p.write_text("mycompany.com\n")
+  f = domains.DomainFilter(allowlist_path=str(p))
+  assert f.is_allowed("a@mycompany.com")
+  assert f.is_allowed("a@eu.mycompany.com")
+  assert not f.is_allowed("a@163.com")
+
+
+def test_reload_on_mtime(blocklist):
+  f = domains.DomainFilter(blocklist_path=str(blocklist), reload_interval=0)
+  assert f.is_allowed("a@163.com")
+
+  blocklist.write_text("163.com\n")
+  st = os.stat(blocklist)
+  os.utime(blocklist, (st.st_atime, st.st_mtime + 10))
+  assert not f.is_allowed("a@163.com")
+
+
+def test_unreadable_list_keeps_the_current_one(blocklist, caplog):
+  f = domains.DomainFilter(blocklist_path=str(blocklist), reload_interval=0)
+  blocklist.unlink()
+  assert not f.is_allowed("bot@mailinator.com")
+  assert f.is_allowed("a@163.com")
+  assert caplog.text.count("Failed to load email domain list") == 1
+
+  blocklist.write_text("163.com\n")
+  assert not f.is_allowed("a@163.com")
+
+
+def test_missing_allowlist_allows_nothing(tmp_path, caplog):
+  f = domains.DomainFilter(allowlist_path=str(tmp_path / "missing.txt"))
+  assert not f.is_allowed("a@mycompany.com")
+  assert "Failed to load email domain list" in caplog.text
+
+
+def test_check_reports_unreadable_list(tmp_path, blocklist):
+  missing = str(tmp_path / "missing.txt")
+  with override_settings(
+    LOGIN_EMAIL={"DOMAIN_BLOCKLIST": str(blocklist), "DOMAIN_ALLOWLIST": missing}
+  ):
+    errors = checks.check_domain_lists(None)
+  assert [e.id for e in errors] == ["django_login_email.E002"]
+  assert "DOMAIN_ALLOWLIST" in errors[0].msg
+
+
+def test_login_form(blocklist):
+  with override_settings(LOGIN_EMAIL_DOMAIN_BLOCKLIST=str(blocklist)):
+    form = forms.LoginForm(data={"email": "bot@mailinator.com"})
+    assert not form.is_valid()
+    assert "email" in form.errors
+
+    form = forms.LoginForm(data={"email": "svtter@163.com"})
+    assert form.is_valid()
+
+
+def test_reload_command(blocklist, capsys):
+  with override_settings(LOGIN_EMAIL_DOMAIN_BLOCKLIST=str(blocklist)):
+    call_command("reload_email_domains")
+  assert "blocklist: 2 domains" in capsys.readouterr().out
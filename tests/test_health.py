@@ -0,0 +1,65 @@
+import pytest
+from django.test import override_settings
+
+from django_login_email import health
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+  health.clear()
+  yield
+  health.clear()
+
+
+def test_checks_pass(db):
+  result = health.run_checks()
+  assert result["status"] == "ok"
+  assert list(result["checks"]) == ["database", "cache", "token"]
+  for check in result["checks"].values():
+    assert check["status"] == "ok"
+    assert check["ms"] >= 0
+  assert result["checks"]["database"]["threshold_ms"] == 100
+
+
+def test_slow_and_failed_checks(db, monkeypatch):
+  with override_settings(LOGIN_EMAIL={"HEALTH_THRESHOLDS_MS": {"token": 0.000001}}):
+    assert health.run_checks()["status"] == "degraded"
+
+  def fail():
+    raise ConnectionError("secret-host:6379")
+
+  monkeypatch.setitem(health.CHECKS, "cache", fail)
+  result = health.run_checks()
+  assert result["status"] == "error"
+  assert result["checks"]["cache"] == {
+    "ms": result["checks"]["cache"]["ms"],
+    "threshold_ms": 50,
+    "status": "error",
+    "error": "ConnectionError",
+  }
+
+
+def test_smtp_noop(db):
+  # the locmem backend of the tests has no session to ask.
+  assert health.run_checks(smtp=True)["checks"]["smtp"]["status"] == "ok"
+  with override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+    EMAIL_HOST="127.0.0.1",
+    EMAIL_PORT=9,
+    EMAIL_USE_TLS=False,
+    EMAIL_USE_SSL=False,
+  ):
+    assert health.run_checks(smtp=True)["checks"]["smtp"]["status"] == "error"
+
+
+def test_result_is_cached(db, monkeypatch):
+  calls = []
+  monkeypatch.setitem(health.CHECKS, "token", lambda: calls.append(1))
+  now = [0.0]
+  with override_settings(LOGIN_EMAIL={"HEALTH_CACHE_SECONDS": 5}):
+    first = health.get_health(clock=lambda: now[0])
+    now[0] = 4.9
+    assert health.get_health(clock=lambda: now[0]) is first
+    now[0] = 5.0
+    assert health.get_health(clock=lambda: now[0]) is not first
+  assert len(calls) == 2
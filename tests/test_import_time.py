@@ -0,0 +1,13 @@
+"""Modules imported at startup, see `python -m benchmarks.bench_import` for their time."""
+
+from benchmarks.bench_import import STARTUP, importtime
+
+# imported lazily, on the first login/verify request.
+LAZY = ("Crypto", "django_login_email.views.login", "django_login_email.forms")
+
+
+def test_lazy_imports():
+  times = importtime(STARTUP)
+  assert "django_login_email.views" in times
+  loaded = [m for m in times if m.startswith(LAZY)]
+  assert loaded == []
@@ -1,4 +1,6 @@
+import pytest
 from django.core.cache import cache
+from django.test import RequestFactory, override_settings
 
 from django_login_email import iputils
 
@@ -24,3 +26,42 @@ def test_iputils_3_times(db):
 
   ip_utils.record_send({"REMOTE_ADDR": "127.0.0.1"})
   assert ip_utils.is_ip_banned("127.0.0.1")
+
+
+def _request(remote_addr, xff=None):
+  extra = {"REMOTE_ADDR": remote_addr}
+  if xff:
+    extra["HTTP_X_FORWARDED_FOR"] = xff
+  return RequestFactory().get("/", **extra)
+
+
+TRUSTED = {"TRUSTED_PROXIES": ["10.0.0.0/8", "fd00::/8"]}
+
+
+@pytest.mark.parametrize(
+  "remote_addr, xff, expected",
+  [
+    # not from a proxy, the header is ignored.
+    ("203.0.113.9", "1.2.3.4", "203.0.113.9"),
+    ("10.0.0.1", None, "10.0.0.1"),
+    # the client forged the first entry.
+    ("10.0.0.1", "1.2.3.4, 198.51.100.7, 10.1.1.1", "198.51.100.7"),
+    ("fd00::1", "2001:db8::5", "2001:db8::5"),
+    # all hops trusted, the leftmost is the client.
+    ("10.0.0.1", "10.2.2.2", "10.2.2.2"),
+    ("10.0.0.1", "garbage, 10.2.2.2", "10.2.2.2"),
+  ],
+)
+def test_trusted_proxies(remote_addr, xff, expected):
+  with override_settings(LOGIN_EMAIL=TRUSTED):
+    ip = iputils.IPBanUtils().get_client_ip(_request(remote_addr, xff))
+  assert ip == expected
+
+
+@override_settings(LOGIN_EMAIL=TRUSTED)
+def test_client_ip_cached_on_request(monkeypatch):
+  utils = iputils.IPBanUtils()
+  request = _request("10.0.0.1", "198.51.100.7")
+  assert utils.get_client_ip(request) == "198.51.100.7"
+  monkeypatch.setattr(iputils, "client_ip_from_chain", None)
+  assert utils.get_client_ip(request) == "198.51.100.7"
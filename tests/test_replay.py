@@ -0,0 +1,56 @@
+import pytest
+from django.test import override_settings
+
+from django_login_email import replay
+
+
+@pytest.mark.parametrize("fp_rate", [0.01, 0.001])
+def test_bloom_false_positive_rate(fp_rate):
+  n = 5000
+  f = replay.BloomFilter(n, fp_rate)
+  for i in range(n):
+    f.add(f"in-{i}")
+  assert all(f"in-{i}" in f for i in range(n))
+  trials = 50000
+  fps = sum(f"out-{i}" in f for i in range(trials))
+  assert fps / trials < fp_rate * 2
+
+
+def test_rotation_keeps_items_for_ttl():
+  now = [1000.0]
+  f = replay.RotatingBloomFilter(
+    ttl=600, capacity=100, fp_rate=0.001, clock=lambda: now[0]
+  )
+  f.add("a")
+  now[0] += 599
+  assert "a" in f
+  now[0] += 300
+  assert "a" not in f
+  assert len(f._filters) <= f.buckets + 1
+
+
+@pytest.mark.parametrize("backend", ["cache", "bloom"])
+def test_replay_filter(backend):
+  f = replay.ReplayFilter(backend, ttl=600)
+  assert not f.is_consumed("salt")
+  f.add("salt")
+  assert f.is_consumed("salt")
+
+
+def test_bloom_is_confirmed_in_cache():
+  """another process consumed the token, or the cache lost it: ask the database."""
+  f = replay.ReplayFilter("bloom", ttl=600)
+  f.add("salt")
+  f.cache.clear()
+  assert not f.is_consumed("salt")
+
+
+@override_settings(LOGIN_EMAIL={"REPLAY_FILTER": "off"})
+def test_off():
+  assert replay.get_replay_filter(10) is None
+
+
+@override_settings(LOGIN_EMAIL={"REPLAY_FILTER": "bloom"})
+def test_one_filter_per_process():
+  assert replay.get_replay_filter(10) is replay.get_replay_filter(10)
+  assert replay.get_replay_filter(-1) is None
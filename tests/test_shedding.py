@@ -0,0 +1,67 @@
+import pytest
+from django.test import override_settings
+
+from django_login_email import shedding
+
+
+class Clock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def test_limit_is_enforced():
+  limiter = shedding.AdaptiveLimiter("t", initial=2)
+  assert limiter.acquire()
+  assert limiter.acquire()
+  assert not limiter.acquire()
+  limiter.release(0.01)
+  assert limiter.acquire()
+  assert limiter.metrics()["rejected"] == 1
+  assert limiter.metrics()["in_flight"] == 2
+
+
+def test_fast_requests_grow_the_limit_additively():
+  limiter = shedding.AdaptiveLimiter("t", initial=10, max_limit=12, target_ms=100)
+  # +1/limit each, a bit more than 10 requests for +1.
+  for _ in range(11):
+    assert limiter.acquire()
+    limiter.release(0.01)
+  assert limiter.metrics()["limit"] == 11
+  for _ in range(100):
+    limiter.acquire()
+    limiter.release(0.01)
+  assert limiter.metrics()["limit"] == 12
+
+
+def test_slow_requests_back_off_once_per_target():
+  clock = Clock()
+  limiter = shedding.AdaptiveLimiter(
+    "t", initial=100, min_limit=5, target_ms=100, backoff=0.5, clock=clock
+  )
+  # a burst of slow requests finishing together counts once.
+  for _ in range(10):
+    limiter.acquire()
+  for _ in range(10):
+    limiter.release(1.0)
+  assert limiter.metrics()["limit"] == 50
+  assert limiter.metrics()["slow"] == 10
+
+  for _ in range(5):
+    clock.now += 0.1
+    limiter.acquire()
+    limiter.release(0.01, ok=False)
+  assert limiter.metrics()["limit"] == 5
+
+
+def test_get_limiter_uses_settings_and_overrides():
+  with override_settings(LOGIN_EMAIL={"SHED_INITIAL_LIMIT": 3, "SHED_TARGET_MS": 50}):
+    limiter = shedding.get_limiter("a")
+    assert shedding.get_limiter("a") is limiter
+    assert limiter.metrics()["limit"] == 3
+    assert limiter.target == pytest.approx(0.05)
+    assert shedding.get_limiter("b", initial=7).metrics()["limit"] == 7
+    assert set(shedding.metrics()) >= {"a", "b"}
+  assert "a" not in shedding.metrics()
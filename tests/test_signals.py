@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+from django.test import override_settings
+
+from django_login_email import errors, iputils, signals
+from django_login_email.email import EmailFunc, MailRecord, TimeLimit
+
+sample_mail = "svtter@163.com"
+
+
+class Mixin(EmailFunc):
+  tl = TimeLimit()
+
+  def check_user(self, email) -> bool:
+    return True
+
+  def get_mail_record(self, mail: str) -> MailRecord:
+    return MailRecord(email=mail, expired_time=None, validated=False, salt="")
+
+  def send_valid(self, email: str, mail_type: str):
+    pass
+
+  def save_token(self, token):
+    pass
+
+  def disable_token(self, token):
+    pass
+
+
+@pytest.fixture
+def events():
+  got = []
+
+  def on_event(signal, **kwargs):
+    got.append((signal, kwargs))
+
+  sigs = [
+    signals.mail_requested,
+    signals.mail_sent,
+    signals.rate_limited,
+    signals.ip_banned,
+  ]
+  for s in sigs:
+    s.connect(on_event, dispatch_uid="test_signals")
+  yield got
+  for s in sigs:
+    s.disconnect(dispatch_uid="test_signals")
+
+
+def test_mail_signals(events):
+  e = Mixin()
+  e.send_login_mail(sample_mail)
+  with pytest.raises(errors.RateLimitError):
+    e.send_login_mail(sample_mail)
+  sent = [s for s, _ in events]
+  assert sent == [
+    signals.mail_requested,
+    signals.mail_sent,
+    signals.mail_requested,
+    signals.rate_limited,
+  ]
+  assert events[-1][1]["scope"] == "email"
+
+
+def test_ip_banned(db, events):
+  r = iputils.Recorder()
+  for _ in range(r.times + 1):
+    r.record("127.0.0.9")
+  assert [s for s, _ in events] == [signals.rate_limited, signals.ip_banned]
+  assert events[-1][1]["ip"] == "127.0.0.9"
+
+
+def test_failing_receiver_does_not_fail_request():
+  def broken(**kwargs):
+    raise RuntimeError("boom")
+
+  signals.mail_sent.connect(broken, dispatch_uid="broken")
+  try:
+    Mixin().send_login_mail(sample_mail)
+  finally:
+    signals.mail_sent.disconnect(dispatch_uid="broken")
+
+
+def test_async_dispatcher_backpressure():
+  release = threading.Event()
+  seen = []
+
+  def slow(**kwargs):
+    release.wait(5)
+    seen.append(kwargs["email"])
+
+  signals.mail_sent.connect(slow, dispatch_uid="slow")
+  try:
+    d = signals.AsyncDispatcher(workers=1, queue_size=2)
+    results = [d.submit(signals.mail_sent, None, email=str(i)) for i in range(5)]
+    # one event is running, two wait in the queue, the rest are dropped.
+    assert results.count(False) >= 2
+    release.set()
+    d.join()
+  finally:
+    signals.mail_sent.disconnect(dispatch_uid="slow")
+  m = d.metrics()
+  assert m["dropped"] == results.count(False)
+  assert m["dispatched"] == m["queued"] == len(seen)
+  assert m["depth"] == 0
+  assert m["max_depth"] <= 2
+
+
+@override_settings(LOGIN_EMAIL={"SIGNAL_DISPATCH": "async"})
+def test_async_emit(db, events, django_capture_on_commit_callbacks):
+  with django_capture_on_commit_callbacks() as callbacks:
+    Mixin().send_login_mail(sample_mail)
+  # nothing is sent before the commit.
+  assert events == []
+  for callback in callbacks:
+    callback()
+  signals.get_dispatcher().join()
+  assert {s for s, _ in events} == {signals.mail_requested, signals.mail_sent}
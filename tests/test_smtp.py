@@ -0,0 +1,223 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+from django.core.mail import EmailMessage
+
+aiosmtplib = pytest.importorskip("aiosmtplib")
+controller = pytest.importorskip("aiosmtpd.controller")
+
+from django_login_email import smtp
+
+from .views.conftest import MixinTest
+
+
+class Sink(object):
+  """Accepts every mail, and remembers the session of each."""
+
+  def __init__(self):
+    self.mails = []
+    self.deferrals = 0
+    self.sessions = set()
+    self.lock = threading.Lock()
+
+  async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+    if address.startswith("refused"):
+      return "550 No such user"
+    if address.startswith("later") and self.deferrals:
+      self.deferrals -= 1
+      return "451 4.7.1 Too many mails, slow down"
+    envelope.rcpt_tos.append(address)
+    return "250 OK"
+
+  async def handle_DATA(self, server, session, envelope):
+    with self.lock:
+      self.mails.append(envelope)
+      self.sessions.add(id(session))
+    return "250 OK"
+
+
+@pytest.fixture
+def sink():
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+  handler = Sink()
+  c = controller.Controller(handler, hostname="127.0.0.1", port=port)
+  c.start()
+  handler.port = port
+  yield handler
+  c.stop()
+
+
+def make_sender(sink, **kwargs):
+  return smtp.AsyncSMTPSender(
+    hostname="127.0.0.1",
+    port=sink.port,
+    username="",
+    password="",
+    start_tls=False,
+    **kwargs,
+  )
+
+
+def mail(to):
+  return EmailMessage("subject", "body", "noreply@example.com", [to])
+
+
+def test_sessions_are_reused(sink):
+  sender = make_sender(sink, connections=2, messages_per_connection=100)
+  done = []
+  results = sender.send_messages(
+    [mail(f"u{i}@example.com") for i in range(20)], done.append
+  )
+  assert all(r.ok for r in results)
+  assert [r.message.to[0] for r in results] == [f"u{i}@example.com" for i in range(20)]
+  assert len(done) == 20
+  assert len(sink.mails) == 20
+  assert len(sink.sessions) <= 2
+  metrics = sender.metrics()
+  assert metrics["connects"] <= 2
+  assert metrics["priorities"]["bulk"]["depth"] == 0
+
+
+def test_reconnects_after_messages_per_connection(sink):
+  sender = make_sender(sink, connections=1, messages_per_connection=3)
+  sender.send_messages([mail(f"u{i}@example.com") for i in range(7)])
+  assert len(sink.sessions) == 3
+
+
+def test_refused_message_keeps_the_session(sink):
+  sender = make_sender(sink, connections=1)
+  bad, good = sender.send_messages([mail("refused@example.com"), mail("ok@example.com")])
+  assert not bad.ok and good.ok
+  assert sender.metrics()["connects"] == 1
+
+
+def test_full_queue_fails_fast(sink):
+  sender = make_sender(sink, queue_size=1)
+  sender._slots["bulk"].acquire()
+  with pytest.raises(smtp.errors.EmailSendError):
+    sender.submit(mail("u@example.com"))
+
+
+def test_email_func_bulk(db, sink, monkeypatch):
+  sender = make_sender(sink)
+  mx = MixinTest()
+  monkeypatch.setattr(mx, "get_mail_sender", lambda: sender)
+  results = mx.send_valid_bulk(["a@example.com", "b@example.com"], "login")
+  assert all(r.ok for r in results)
+  assert sorted(e.rcpt_tos[0] for e in sink.mails) == ["a@example.com", "b@example.com"]
+  assert b"token=" in sink.mails[0].content
+
+
+def test_token_bucket():
+  now = [0.0]
+  b = smtp.TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+  assert [b.reserve(), b.reserve()] == [0, 0]
+  assert b.reserve() == 0.5
+  now[0] += 1.5
+  assert b.reserve() == 0
+
+
+@pytest.mark.parametrize(
+  "reply, seconds",
+  [
+    ("4.7.0 Try again in 30 seconds", 30),
+    ("Please retry after 5 min", 300),
+    ("Too many mails, slow down", None),
+  ],
+)
+def test_retry_after(reply, seconds):
+  error = aiosmtplib.SMTPResponseException(451, reply)
+  assert smtp.retry_after(error) == seconds
+  assert smtp.deferral_code(error) == 451
+
+
+def item(message, queued_at=0):
+  return smtp._Item(message, None, None, queued_at=queued_at)
+
+
+def take(s):
+  """(priority, domain, messages) of the next batch."""
+  batch = asyncio.run(s.next_batch(0))
+  return batch and (*batch[:2], [i.message for i in batch[2]])
+
+
+def test_scheduler_batches_by_domain():
+  s = smtp.DomainScheduler(batch_size=2, domain_limit=1)
+  for to in ["a@x.com", "b@y.com", "c@x.com", "d@x.com"]:
+    s.put(to.split("@")[1], [item(to)])
+  assert take(s) == ("bulk", "x.com", ["a@x.com", "c@x.com"])
+  # x.com is busy, the next session takes another domain.
+  assert take(s) == ("bulk", "y.com", ["b@y.com"])
+  assert take(s) is None
+  s.release("bulk", "x.com")
+  assert take(s) == ("bulk", "x.com", ["d@x.com"])
+
+
+def test_priorities_share_by_weight():
+  s = smtp.DomainScheduler(batch_size=1)
+  for i in range(20):
+    s.put(f"b{i}.com", [item(i)], "bulk")
+    s.put(f"l{i}.com", [item(i)], "login")
+  taken = []
+  for _ in range(18):
+    priority, domain, _ = take(s)
+    taken.append(priority)
+    s.release(priority, domain)
+  assert taken[0] == "login"
+  assert taken.count("login") == 16 and taken.count("bulk") == 2
+
+
+def test_priority_connections():
+  now = [0.0]
+  s = smtp.DomainScheduler(batch_size=1, limits={"bulk": 1}, clock=lambda: now[0])
+  s.put("a.com", [item(None)], "bulk")
+  s.put("b.com", [item(None)], "bulk")
+  assert take(s)[:2] == ("bulk", "a.com")
+  # bulk has its one session, and waits.
+  assert take(s) is None
+  s.put("c.com", [item(None)], "login")
+  assert take(s)[:2] == ("login", "c.com")
+  now[0] = 5
+  bulk = s.metrics()["bulk"]
+  assert bulk == {"depth": 1, "oldest_age": 5, "active": 1, "max_wait": 0}
+
+
+def test_domain_rate(sink):
+  sender = make_sender(sink, connections=4, domain_rates={"x.com": 20}, domain_burst=1)
+  start = time.monotonic()
+  sender.send_messages([mail(f"u{i}@x.com") for i in range(5)])
+  assert time.monotonic() - start >= 0.2
+
+
+def test_deferral_is_retried(sink):
+  sink.deferrals = 1
+  sender = make_sender(sink, connections=1, deferral_seconds=0.05)
+  results = sender.send_messages([mail("later@x.com"), mail("ok@x.com")])
+  assert all(r.ok for r in results)
+  assert sender.metrics()["deferred"] == 1
+  assert len(sink.mails) == 2
+
+
+def test_unexpected_error_fails_the_rest_of_the_batch(sink, monkeypatch):
+  sender = make_sender(sink, connections=1)
+  send_one = sender._send_one
+  calls = []
+
+  async def flaky(session, message):
+    calls.append(message)
+    if len(calls) == 2:
+      raise RuntimeError("bug")
+    return await send_one(session, message)
+
+  monkeypatch.setattr(sender, "_send_one", flaky)
+  futures = [sender.submit(mail(f"u{i}@x.com")) for i in range(3)]
+  results = [f.result(timeout=5) for f in futures]
+  # every future resolves, the rest of the batch of the failed one included.
+  assert results[0].ok
+  assert isinstance(results[1].error, RuntimeError)
+  assert sender._slots["bulk"]._value == sender.queue_size
@@ -1 +1,44 @@
 """test the usage of token"""
+
+import json
+
+import pytest
+
+from django_login_email import token
+from django_login_email.email import MailRecord
+
+
+def test_login_token_reads_like_dict():
+  tk = token.LoginToken("a@b.com", 1, "salt", "login")
+  assert tk["email"] == "a@b.com"
+  assert tk.get("mail_type") == "login"
+  assert tk.get("missing", 0) == 0
+  assert dict(tk)["salt"] == "salt"
+  assert tk == {
+    "email": "a@b.com",
+    "expired_time": 1,
+    "salt": "salt",
+    "mail_type": "login",
+  }
+  with pytest.raises(KeyError):
+    tk["missing"]
+  assert not hasattr(tk, "__dict__")
+
+
+def test_round_trip():
+  m = token.TokenManager(10)
+  saved = []
+  token_v = m.encrypt_mail("a@b.com", "login", saved.append)
+  tk = m.transform_token(m.decrypt_token(token_v))
+  assert tk == saved[0]
+  assert json.loads(m.decrypt_token(token_v)) == saved[0].to_dict()
+
+
+def test_missing_key():
+  with pytest.raises(KeyError):
+    token.LoginToken.from_dict({"email": "a@b.com"})
+
+
+def test_mail_record_slots():
+  r = MailRecord(expired_time=None, email="a@b.com", validated=False, salt="")
+  assert not hasattr(r, "__dict__")
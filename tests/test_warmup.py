@@ -0,0 +1,83 @@
+import io
+
+import pytest
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from django_login_email import rejections, render, warmup
+
+
+@pytest.fixture(autouse=True)
+def cold():
+  render.clear_cache()
+  rejections.clear_pages()
+  yield
+  render.clear_cache()
+  rejections.clear_pages()
+
+
+def test_views_are_found_in_the_urlconf():
+  login_views, verify_views = warmup._views()
+  assert [v.__name__ for v in login_views] == ["LoginView"]
+  assert [v.__name__ for v in verify_views] == ["VerifyView"]
+
+
+def test_warm_up(db):
+  timings = warmup.warm_up()
+  assert list(timings) == ["keys", "templates", "database", "cache"]
+  assert None not in timings.values()
+  # the login and register mails of the login view.
+  assert len(render._compiled) == 2
+  assert len(rejections._pages) == 1
+
+
+def test_before_fork_opens_no_connection():
+  # without the db fixture, a query would fail its step.
+  timings = warmup.warm_up(connections=False)
+  assert list(timings) == ["keys", "templates"]
+  assert None not in timings.values()
+
+
+def test_failed_step_is_skipped(db, monkeypatch, caplog):
+  def fail(urlconf):
+    raise RuntimeError("boom")
+
+  monkeypatch.setitem(warmup.STEPS, "templates", fail)
+  timings = warmup.warm_up()
+  assert timings["templates"] is None
+  assert timings["cache"] is not None
+  assert "templates failed" in caplog.text
+
+
+def test_ready_hook(monkeypatch):
+  calls = []
+  monkeypatch.setattr(warmup, "warm_up", lambda **kwargs: calls.append(kwargs))
+  config = apps.get_app_config("django_login_email")
+  config.ready()
+  assert calls == []
+  with override_settings(LOGIN_EMAIL={"WARM_UP_ON_READY": True}):
+    config.ready()
+  assert calls == [{"connections": False, "urlconf": False}]
+
+
+def test_ready_does_not_read_the_urlconf(monkeypatch):
+  def get_resolver():
+    raise AssertionError("the URLconf was read")
+
+  monkeypatch.setattr(warmup, "get_resolver", get_resolver)
+  timings = warmup.warm_up(connections=False, urlconf=False)
+  assert None not in timings.values()
+  # the package's own info classes have no system name, no mail to compile.
+  assert len(render._compiled) == 0
+  assert len(rejections._pages) == 1
+
+
+def test_command(db, monkeypatch):
+  out = io.StringIO()
+  call_command("warm_login_email", stdout=out)
+  assert "Warmed up." in out.getvalue()
+
+  monkeypatch.setitem(warmup.STEPS, "cache", lambda: 1 / 0)
+  with pytest.raises(CommandError, match="cache"):
+    call_command("warm_login_email", stdout=io.StringIO())
@@ -0,0 +1,98 @@
+import socket
+import threading
+import time
+
+import pytest
+from django.test import override_settings
+
+from django_login_email import breaker, errors
+
+
+@pytest.fixture
+def stalled_smtp():
+  """An SMTP server that accepts connections and never sends its greeting."""
+  server = socket.socket()
+  server.bind(("127.0.0.1", 0))
+  server.listen(16)
+  conns = []
+  stop = threading.Event()
+
+  def serve():
+    server.settimeout(0.05)
+    while not stop.is_set():
+      try:
+        conns.append(server.accept()[0])
+      except OSError:
+        pass
+
+  th = threading.Thread(target=serve, daemon=True)
+  th.start()
+  yield server.getsockname()[1]
+  stop.set()
+  th.join()
+  for c in conns:
+    c.close()
+  server.close()
+
+
+def fail():
+  raise OSError("relay down")
+
+
+def test_open_after_failures():
+  b = breaker.CircuitBreaker(min_calls=4, failure_rate=0.5)
+  b.call(lambda: None)
+  b.call(lambda: None)
+  for _ in range(2):
+    with pytest.raises(OSError):
+      b.call(fail)
+  assert b.state() == "open"
+  with pytest.raises(errors.CircuitOpenError):
+    b.call(lambda: None)
+
+
+def test_half_open_probe():
+  b = breaker.CircuitBreaker(min_calls=1, reset_timeout=0.1)
+  with pytest.raises(OSError):
+    b.call(fail)
+  assert b.state() == "open"
+
+  time.sleep(0.15)
+  assert b.state() == "half-open"
+  assert b.allow()
+  # only one probe at a time.
+  assert not b.allow()
+
+  b.record_failure()
+  assert b.state() == "open"
+
+  time.sleep(0.15)
+  b.call(lambda: None)
+  assert b.state() == "closed"
+
+
+def test_shared_between_instances():
+  b1 = breaker.CircuitBreaker(min_calls=1)
+  b2 = breaker.CircuitBreaker(min_calls=1)
+  b1.record_failure()
+  assert b2.state() == "open"
+
+
+def test_stalled_smtp(db, mx_send, stalled_smtp):
+  with override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+    EMAIL_HOST="127.0.0.1",
+    EMAIL_PORT=stalled_smtp,
+    LOGIN_EMAIL_SEND_TIMEOUT=0.2,
+    LOGIN_EMAIL_BREAKER_MIN_CALLS=2,
+  ):
+    for _ in range(2):
+      start = time.monotonic()
+      with pytest.raises(errors.EmailSendError):
+        mx_send.send_valid("svtter@163.com", "login")
+      assert time.monotonic() - start < 2
+
+    start = time.monotonic()
+    with pytest.raises(errors.CircuitOpenError):
+      mx_send.send_valid("svtter@163.com", "login")
+    assert time.monotonic() - start < 0.1
@@ -0,0 +1,31 @@
+import pytest
+from django.urls import reverse
+
+from django_login_email import health
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+  health.clear()
+  yield
+  health.clear()
+
+
+def test_health(db, client):
+  res = client.get(reverse("login_email:health"))
+  assert res.status_code == 200
+  assert "no-cache" in res["Cache-Control"]
+  data = res.json()
+  assert data["status"] == "ok"
+  assert set(data["checks"]) == {"database", "cache", "token"}
+  assert "limiters" in data
+
+
+def test_unhealthy_is_503(db, client, monkeypatch):
+  def fail():
+    raise RuntimeError
+
+  monkeypatch.setitem(health.CHECKS, "database", fail)
+  res = client.get(reverse("login_email:health"))
+  assert res.status_code == 503
+  assert res.json()["checks"]["database"]["status"] == "error"
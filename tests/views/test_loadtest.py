@@ -0,0 +1,79 @@
+import smtplib
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from django_login_email import loadtest, models
+
+
+@pytest.fixture
+def sink():
+  s = loadtest.SMTPSink(port=0).start()
+  yield s
+  s.stop()
+
+
+def test_sink_token(sink):
+  with smtplib.SMTP("127.0.0.1", sink.port) as smtp:
+    smtp.sendmail(
+      "noreply@example.com",
+      ["a@example.com"],
+      'Subject: hi\r\n\r\nClick <a href="http://x/verify?token=abc%2Bd">Link</a>\r\n',
+    )
+  assert sink.received == 1
+  assert sink.pop_token() == "abc%2Bd"
+  assert sink.pop_token() is None
+
+
+def test_percentile():
+  values = list(range(1, 101))
+  assert loadtest.percentile(values, 50) == 50
+  assert loadtest.percentile(values, 99) == 99
+  assert loadtest.percentile([], 99) == 0.0
+
+
+def test_parse_mix():
+  assert loadtest.parse_mix("login=2,verify") == {"login": 2, "verify": 1}
+  with pytest.raises(ValueError):
+    loadtest.parse_mix("unknown=1")
+
+
+def test_run(live_server, sink):
+  with override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+    EMAIL_HOST="127.0.0.1",
+    EMAIL_PORT=sink.port,
+    USE_X_FORWARDED_FOR=True,
+  ):
+    lt = loadtest.LoadTest(live_server.url, sink, mix={"login": 1}, workers=2)
+    lt.run(6)
+    assert sink.received == 6
+
+    lt.mix = {"verify": 1, "replay": 1, "expired": 1}
+    report = lt.run(12)
+
+  outcomes = {(r.kind, r.outcome) for r in report.results}
+  assert ("verify", "302:redirect") in outcomes
+  assert ("expired", "403:rejected") in outcomes
+  assert "p99 ms" in report.format()
+
+
+def test_command_mix_error():
+  with pytest.raises(Exception, match="Invalid kind"):
+    call_command("login_email_loadtest", "--mix", "nope=1")
+
+
+@pytest.mark.django_db
+def test_command_removes_seeded_bans(monkeypatch):
+  kept = str(loadtest.BENCHMARK_NET[-2])
+  models.IPBan.add_ip_ban(kept, "before the run")
+
+  def run(self, requests):
+    assert models.IPBan.objects.filter(ip__in=self.banned_ips).count() == 3
+    raise RuntimeError("run failed")
+
+  monkeypatch.setattr(loadtest.LoadTest, "run", run)
+  with pytest.raises(RuntimeError):
+    call_command("login_email_loadtest", "--seed-bans", "3", "--smtp-port", "0")
+  assert list(models.IPBan.objects.values_list("ip", flat=True)) == [kept]
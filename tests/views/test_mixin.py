@@ -1,4 +1,9 @@
+import pytest
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+
+from django_login_email import errors
 
 
 def test_email_mixin(db, mx_send):
@@ -35,3 +40,33 @@ def test_user_exist(db, mx_send):
   mx_send.send_valid("svtter@163.com", "login")
   mr = mx_send.get_mail_record("svtter@163.com")
   assert mr.validated is False
+
+
+@pytest.mark.parametrize("store", ["record", "table"])
+def test_failed_send_ends_the_cooldown(db, mx_send, monkeypatch, store):
+  """the token of an unsent mail is discarded, the next request sends."""
+  mx_send.token_store = store
+
+  def send(self, *args, **kwargs):
+    raise OSError("relay down")
+
+  with monkeypatch.context() as m:
+    m.setattr(EmailMultiAlternatives, "send", send)
+    with pytest.raises(errors.EmailSendError):
+      mx_send.send_login_mail("svtter@163.com")
+
+  mx_send.send_login_mail("svtter@163.com")
+  assert len(mail.outbox) == 1
+
+
+def test_render_error_ends_the_cooldown(db, mx_send, monkeypatch):
+  def render(self, token):
+    raise RuntimeError("broken template")
+
+  with monkeypatch.context() as m:
+    m.setattr(mx_send.register_info_class, "render", render)
+    with pytest.raises(RuntimeError):
+      mx_send.send_login_mail("svtter@163.com")
+
+  mx_send.send_login_mail("svtter@163.com")
+  assert len(mail.outbox) == 1
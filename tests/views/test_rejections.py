@@ -0,0 +1,66 @@
+import pytest
+from django.template import loader
+from django.test import override_settings
+from django.urls import reverse
+
+from django_login_email import models, rejections
+
+GARBAGE = "bm90IGEgdG9rZW4%3D"
+
+
+@pytest.fixture(autouse=True)
+def pages():
+  rejections.clear_pages()
+  yield
+  rejections.clear_pages()
+
+
+@pytest.fixture
+def renders(monkeypatch):
+  calls = []
+  original = loader.render_to_string
+
+  def render_to_string(template_name, *args, **kwargs):
+    calls.append(template_name)
+    return original(template_name, *args, **kwargs)
+
+  monkeypatch.setattr(rejections, "render_to_string", render_to_string)
+  return calls
+
+
+def test_banned_is_403_rendered_once(db, client, renders):
+  models.IPBan.add_ip_ban("127.0.0.1", "test")
+  url = reverse("login_email:login")
+  for _ in range(3):
+    res = client.post(url, {"email": "a@example.com"})
+    assert res.status_code == 403
+    assert "Your IP is banned." in res.content.decode()
+    assert "no-store" in res["Cache-Control"]
+  assert renders == ["login_email/error.html"]
+
+
+@override_settings(LOGIN_EMAIL={"RATE_LIMIT_TIMES": 1, "RATE_LIMIT_MINUTES": 7})
+def test_rate_limit_is_429_with_retry_after(db, client, mailoutbox):
+  url = reverse("login_email:login")
+  client.post(url, {"email": "a@example.com"})
+  res = client.post(url, {"email": "b@example.com"})
+  assert res.status_code == 429
+  assert res["Retry-After"] == "420"
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_FAILURE_LIMIT": 1, "VERIFY_FAILURE_MINUTES": 2})
+def test_verify_refusals(db, client):
+  url = reverse("login_email:verify")
+  res = client.get(url, {"token": "x" + GARBAGE})
+  assert res.status_code == 404
+  res = client.get(url, {"token": GARBAGE})
+  assert res.status_code == 429
+  assert res["Retry-After"] == "120"
+
+
+@override_settings(LOGIN_EMAIL={"CACHE_REJECTIONS": False})
+def test_uncached_keeps_the_request(db, client, renders):
+  models.IPBan.add_ip_ban("127.0.0.1", "test")
+  res = client.post(reverse("login_email:login"), {"email": "a@example.com"})
+  assert res.status_code == 403
+  assert renders == []
@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.core import mail
+
+from django_login_email import email, render
+
+loginInfo, registerInfo = email.get_info_class("meterhub")
+
+
+def test_get_info_class_cached():
+  assert email.get_info_class("meterhub") == (loginInfo, registerInfo)
+
+
+def test_render_same_as_build_message():
+  e = loginInfo()
+  e.build_message("1234567890")
+  text, html = e.render("1234567890")
+  assert html == e.message
+  assert text == (
+    "Welcome to meterhub! Please click the link below to login.\n\n"
+    "http://127.0.0.1:8000/account/verify?token=1234567890\n"
+  )
+
+
+def test_compiled_once():
+  render.clear_cache()
+  with mock.patch.object(
+    render, "render_to_string", wraps=render.render_to_string
+  ) as rts:
+    for token in ("a", "b", "c"):
+      text, html = registerInfo().render(token)
+      assert html.endswith(f'token={token}">Link</a>')
+  assert rts.call_count == 2
+
+
+def test_instance_fields():
+  """welcome_text set per instance, e.g. with the user's name, is not cached across."""
+
+  class GreetInfo(loginInfo):
+    def __init__(self, name):
+      super().__init__()
+      self.welcome_text = f"Hello {name}!<br>"
+
+  assert GreetInfo("Ann").render("t")[0].startswith("Hello Ann!")
+  assert GreetInfo("Bob").render("t")[0].startswith("Hello Bob!")
+
+
+def test_build_message_override():
+  class MyInfo(loginInfo):
+    def build_message(self, token):
+      self.message = f"<b>{token}</b>"
+
+  assert MyInfo().render("abc") == ("abc", "<b>abc</b>")
+
+
+def test_send_multipart(db, mx_send):
+  mx_send.send_valid("svtter@163.com", "register")
+  assert len(mail.outbox) == 1
+  msg = mail.outbox[0]
+  assert "token=" in msg.body
+  html, mimetype = msg.alternatives[0]
+  assert mimetype == "text/html"
+  assert "register" in html
@@ -0,0 +1,77 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from django_login_email import email, models, token
+from django_login_email.iputils import IPBanUtils
+from django_login_email.views import mixin
+
+sample_mail = "svtter@163.com"
+
+replica = override_settings(
+  DATABASE_ROUTERS=["django_login_email.routers.LoginEmailRouter"],
+  LOGIN_EMAIL_READ_DATABASE="replica",
+)
+
+pytestmark = pytest.mark.django_db(databases=["default", "replica"])
+
+
+class MyVerify(email.EmailVerifyMixin, mixin.MailRecordModelMixin):
+  tl = email.TimeLimit(10)
+
+
+@replica
+def test_reads_go_to_replica(mx_send):
+  mx_send.send_valid(sample_mail, "login")
+
+  # replication lag: the replica has no row yet.
+  assert mx_send.get_mail_record(sample_mail).expired_time is None
+  assert mx_send.get_mail_record(sample_mail, using="default").expired_time
+  assert mx_send.get_mail_record_for_write(sample_mail).expired_time
+
+
+@replica
+def test_cooldown_reads_primary(mx_send):
+  mx_send.send_valid(sample_mail, "login")
+  assert not mx_send.check_could_send(sample_mail)
+
+
+@replica
+def test_verify_reads_primary(mx_send):
+  m = token.TokenManager(10)
+  token_v = m.encrypt_mail(sample_mail, "login", mx_send.save_token)
+
+  u = MyVerify().verify_token(token_v)
+  assert u.email == sample_mail
+  assert models.EmailRecord.objects.using("default").get(email=sample_mail).validated
+
+
+def test_explicit_using(mx_send):
+  get_user_model().objects.using("replica").create(username="a", email=sample_mail)
+  models.IPBan.objects.using("replica").create(ip="127.0.0.1", reason="test")
+
+  assert not mx_send.check_user(sample_mail)
+  assert mx_send.check_user(sample_mail, using="replica")
+
+  ip_utils = IPBanUtils()
+  assert not ip_utils.is_ip_banned("127.0.0.1")
+  assert ip_utils.is_ip_banned("127.0.0.1", using="replica")
+
+
+@pytest.mark.parametrize("store", ["record", "table"])
+def test_writes_use_write_db(mx_send, store):
+  mx_send.write_db = "replica"
+  mx_send.token_store = store
+  m = token.TokenManager(10)
+  token_v = m.encrypt_mail(sample_mail, "login", mx_send.save_token)
+  assert mx_send.get_mail_record_for_write(sample_mail).expired_time
+
+  class Verify(MyVerify):
+    write_db = "replica"
+    token_store = store
+
+  Verify().verify_token(token_v)
+  model = models.EmailToken if store == "table" else models.EmailRecord
+  assert not model.objects.using("default").exists()
+  row = model.objects.using("replica").get()
+  assert row.consumed if store == "table" else row.validated
@@ -0,0 +1,88 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from django_login_email import shedding, tenants
+from django_login_email.views.verify import EmailVerifyView
+
+
+@pytest.fixture
+def shed():
+  with override_settings(LOGIN_EMAIL={"LOAD_SHEDDING": True, "SHED_INITIAL_LIMIT": 1}):
+    yield
+
+
+def test_over_the_limit_is_503_before_any_query(
+  db, client, shed, django_assert_num_queries
+):
+  limiter = shedding.get_limiter("login")
+  assert limiter.acquire()
+  with django_assert_num_queries(0):
+    res = client.post(reverse("login_email:login"), {"email": "a@example.com"})
+  assert res.status_code == 503
+  assert res["Retry-After"] == "1"
+  assert limiter.metrics()["rejected"] == 1
+
+
+def test_requests_release_their_slot(db, client, shed):
+  url = reverse("login_email:login")
+  for _ in range(3):
+    res = client.post(url, {"email": "a@example.com"})
+    assert res.status_code != 503
+  metrics = shedding.metrics()["login"]
+  assert metrics["in_flight"] == 0
+  assert metrics["accepted"] == 3
+  # the form is cheap, only POST is limited.
+  assert shedding.get_limiter("login").acquire()
+  assert client.get(url).status_code == 200
+
+
+def test_verify_is_limited_on_get(db, client, shed):
+  assert shedding.get_limiter("verify").acquire()
+  res = client.get(reverse("login_email:verify"), {"token": "x"})
+  assert res.status_code == 503
+
+
+def test_per_view_options(db, rf, shed):
+  class View(EmailVerifyView):
+    load_shedding = False
+
+  assert View().get_limiter() is None
+
+  class Tight(EmailVerifyView):
+    shed_name = "tight"
+    shed_options = {"initial": 4, "target_ms": 100}
+
+  limiter = Tight().get_limiter()
+  assert limiter.name == "tight"
+  assert limiter.metrics()["limit"] == 4
+
+
+def test_refused_before_the_tenant_is_loaded(db, client, monkeypatch):
+  loaded = []
+
+  def loader(tenant_id):
+    loaded.append(tenant_id)
+
+  cache = tenants.TenantCache(loader, max_size=8)
+
+  def get_cache():
+    return cache
+
+  # cleared when the settings change.
+  get_cache.cache_clear = lambda: None
+  with override_settings(
+    LOGIN_EMAIL={
+      "LOAD_SHEDDING": True,
+      "SHED_INITIAL_LIMIT": 1,
+      "TENANT_RESOLVER": "django_login_email.tenants.by_host",
+    }
+  ):
+    monkeypatch.setattr(tenants, "get_cache", get_cache)
+    assert shedding.get_limiter("login").acquire()
+    url = reverse("login_email:login")
+    assert client.post(url, {"email": "a@example.com"}).status_code == 503
+    assert loaded == []
+    shedding.get_limiter("login").release(0.01)
+    assert client.post(url, {"email": "a@example.com"}).status_code == 200
+    assert loaded == ["testserver"]
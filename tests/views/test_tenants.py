@@ -0,0 +1,109 @@
+import re
+
+import pytest
+from django.core import mail
+from django.test import override_settings
+from django.urls import reverse
+
+from django_login_email import tenants
+
+TENANTS = {
+  "a.example.com": {
+    "SYSTEM_NAME": "Brand A",
+    "FROM_EMAIL": "noreply@a.example.com",
+    "VERIFY_URL": "https://a.example.com/account/verify?token=",
+    "BAN_SCOPE": "tenant",
+  },
+  "b.example.com": {"SYSTEM_NAME": "Brand B", "RATE_LIMIT_TIMES": 1},
+}
+
+pytestmark = pytest.mark.usefixtures("tenant_settings")
+
+
+@pytest.fixture
+def tenant_settings():
+  with override_settings(
+    ALLOWED_HOSTS=["*"],
+    LOGIN_EMAIL={
+      "TENANT_RESOLVER": "django_login_email.tenants.by_host",
+      "TENANTS": TENANTS,
+    },
+  ):
+    yield
+
+
+def login(client, host, address="svtter@163.com"):
+  return client.post(reverse("login_email:login"), {"email": address}, HTTP_HOST=host)
+
+
+def test_tenant_mail(db, client):
+  login(client, "a.example.com:8000")
+  msg = mail.outbox[-1]
+  assert "Brand A" in msg.subject
+  assert msg.from_email == "noreply@a.example.com"
+  assert "https://a.example.com/account/verify?token=" in msg.body
+
+
+def test_token_key_per_tenant(db, client):
+  login(client, "a.example.com")
+  token_v = re.search(r"token=(\S+)", mail.outbox[-1].body).group(1)
+  url = reverse("login_email:verify")
+  res = client.get(url, {"token": token_v}, HTTP_HOST="b.example.com")
+  assert res.status_code == 404
+  res = client.get(url, {"token": token_v}, HTTP_HOST="a.example.com")
+  assert res.status_code == 302
+
+
+def test_unknown_host_uses_global_settings(db, client):
+  login(client, "other.example.com")
+  assert "Brand" not in mail.outbox[-1].subject
+
+
+def test_resources_are_cached():
+  a = tenants.get_resources("a.example.com")
+  assert tenants.get_resources("a.example.com") is a
+  assert a.recorder.prefix.startswith("login_email:tenant:")
+  b = tenants.get_resources("b.example.com")
+  assert b.recorder.prefix == ""
+  assert b.recorder.times == 1
+  assert a.token_key != b.token_key
+  assert tenants.get_resources("missing") is None
+
+
+def test_lru_bound():
+  cache = tenants.TenantCache(lambda i: tenants.Tenant(id=i), max_size=2)
+  first = cache.get("1")
+  cache.get("2")
+  assert cache.get("1") is first
+  cache.get("3")
+  assert len(cache) == 2
+  # "2" was the least recently used.
+  assert (cache.hits, cache.misses) == (1, 3)
+  cache.get("2")
+  assert cache.misses == 4
+
+
+def test_unknown_ids_do_not_evict_tenants():
+  cache = tenants.TenantCache(
+    lambda i: tenants.Tenant(id=i) if i == "real" else None, max_size=2, max_unknown=2
+  )
+  real = cache.get("real")
+  for i in range(10):
+    assert cache.get(f"junk-{i}.example.com") is None
+  assert len(cache._unknown) == 2
+  assert cache.get("real") is real
+  assert cache.misses == 11
+
+
+@pytest.mark.parametrize(
+  "host, expected",
+  [
+    ("Login.Brand-A.com:8000", "login.brand-a.com"),
+    ("login.brand-a.com", "login.brand-a.com"),
+    ("[::1]:8000", "[::1]"),
+    ("[::1]", "[::1]"),
+  ],
+)
+def test_by_host(rf, settings, host, expected):
+  settings.ALLOWED_HOSTS = ["*"]
+  assert tenants.by_host(rf.get("/", HTTP_HOST=host)) == expected
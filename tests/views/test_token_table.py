@@ -0,0 +1,111 @@
+import datetime
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from django_login_email import cooldown, email, errors, models, token
+from django_login_email.views import mixin
+
+sample_mail = "svtter@163.com"
+
+
+class MyVerify(email.EmailVerifyMixin, mixin.MailRecordModelMixin):
+  tl = email.TimeLimit(10)
+
+
+pytestmark = pytest.mark.usefixtures("table")
+
+
+@pytest.fixture
+def table():
+  with override_settings(
+    LOGIN_EMAIL={"TOKEN_STORE": "table", "VERIFY_NEGATIVE_TTL": 0, "REPLAY_FILTER": "off"}
+  ):
+    yield
+
+
+@pytest.fixture
+def tokens(mx_send):
+  """Send `n` login tokens to `sample_mail`, without the cooldown."""
+  saved = []
+
+  class TokenManager(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  mx_send.get_token_manager = lambda: TokenManager(10)
+
+  def send(n):
+    for _ in range(n):
+      mx_send.send_valid(sample_mail, "login")
+    return saved
+
+  return send
+
+
+def test_outstanding_tokens_are_independent(db, tokens):
+  first, second = tokens(2)
+  assert models.EmailToken.objects.filter(email=sample_mail).count() == 2
+  assert not models.EmailRecord.objects.exists()
+  v = MyVerify()
+  assert v.verify_token(second).email == sample_mail
+  assert v.verify_token(first).email == sample_mail
+  with pytest.raises(errors.ValidatedError):
+    v.verify_token(first)
+
+
+def test_verify_is_one_update(db, tokens, django_user_model):
+  (t,) = tokens(1)
+  django_user_model.objects.create(username=sample_mail, email=sample_mail)
+  with CaptureQueriesContext(connection) as queries:
+    MyVerify().verify_token(t)
+  sqls = [q["sql"] for q in queries]
+  assert len(sqls) == 2, sqls
+  assert sqls[1].startswith("UPDATE")
+  assert not any("login_email_emailrecord" in q for q in sqls)
+
+
+@override_settings(LOGIN_EMAIL={"TOKEN_STORE": "table", "TOKEN_MAX_PER_EMAIL": 2})
+def test_cap_drops_oldest(db, tokens):
+  first, *_ = tokens(3)
+  assert models.EmailToken.objects.filter(email=sample_mail).count() == 2
+  with pytest.raises(errors.TokenError):
+    MyVerify().verify_token(first)
+
+
+def test_expired_tokens(db, tokens):
+  tokens(2)
+  past = timezone.now() - datetime.timedelta(minutes=1)
+  models.EmailToken.objects.update(expired_time=past)
+  call_command("purge_login_tokens")
+  assert not models.EmailToken.objects.exists()
+
+
+def test_cooldown_reads_latest_token(db, mx_send, tokens):
+  tokens(1)
+  assert not mx_send.check_could_send(sample_mail)
+  mx_send.reset_mail(sample_mail)
+  assert mx_send.check_could_send(sample_mail)
+
+
+def test_second_device_gets_a_link(db, mx_send, mailoutbox):
+  """through the send path, with the default cooldown of the table store."""
+  mx_send.send_login_mail(sample_mail)
+  with pytest.raises(errors.RateLimitError):
+    mx_send.send_login_mail(sample_mail)
+
+  # a minute later: the claim expired in the cache, the token was saved a minute ago.
+  cooldown.get_cooldown().release(sample_mail)
+  models.EmailToken.objects.update(
+    expired_time=F("expired_time") - datetime.timedelta(minutes=1)
+  )
+  mx_send.send_login_mail(sample_mail)
+
+  assert len(mailoutbox) == 2
+  assert models.EmailToken.objects.filter(email=sample_mail, consumed=False).count() == 2
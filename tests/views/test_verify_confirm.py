@@ -0,0 +1,52 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from django_login_email import token
+
+sample_mail = "svtter@163.com"
+
+
+@pytest.fixture
+def token_v(mx_send):
+  saved = []
+
+  class TokenManager(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  mx_send.get_token_manager = lambda: TokenManager(10)
+  mx_send.send_valid(sample_mail, "login")
+  return saved[0]
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_CONFIRM": True})
+def test_get_does_not_consume(db, client, token_v):
+  url = reverse("login_email:verify")
+  with CaptureQueriesContext(connection) as queries:
+    res = client.get(url, {"token": token_v})
+  assert res.status_code == 200
+  assert sample_mail in res.content.decode()
+  assert "no-store" in res["Cache-Control"]
+  assert len(queries) == 0
+  assert not get_user_model().objects.filter(email=sample_mail).exists()
+
+  res = client.post(url, {"token": token_v})
+  assert res.status_code == 302
+  assert get_user_model().objects.filter(email=sample_mail).exists()
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_CONFIRM": True})
+def test_get_rejects_expired(db, client):
+  expired = token.TokenManager(-1).encrypt_mail(sample_mail, "login", lambda _: None)
+  res = client.get(reverse("login_email:verify"), {"token": expired})
+  assert "Invalid or expired token." in res.content.decode()
+
+
+def test_get_verifies_by_default(db, client, token_v):
+  res = client.get(reverse("login_email:verify"), {"token": token_v})
+  assert res.status_code == 302
@@ -0,0 +1,123 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from django_login_email import email, errors, models, token
+from django_login_email.views import mixin
+
+sample_mail = "svtter@163.com"
+GARBAGE = "bm90IGEgdG9rZW4%3D"
+
+
+class MyVerify(email.EmailVerifyMixin, mixin.MailRecordModelMixin):
+  tl = email.TimeLimit(10)
+
+
+@pytest.fixture
+def decrypts(monkeypatch):
+  calls = []
+  original = token.TokenManager.decrypt_token
+
+  def decrypt_token(self, token):
+    calls.append(token)
+    return original(self, token)
+
+  monkeypatch.setattr(token.TokenManager, "decrypt_token", decrypt_token)
+  return calls
+
+
+def test_rejected_token_skips_decrypt(db, decrypts):
+  v = MyVerify()
+  with pytest.raises(ValueError):
+    v.verify_token(GARBAGE)
+  with pytest.raises(errors.TokenError):
+    v.verify_token(GARBAGE)
+  assert len(decrypts) == 1
+
+
+def test_consumed_token_skips_db(db, mx_send):
+  saved = []
+
+  class TokenManager(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  mx_send.get_token_manager = lambda: TokenManager(10)
+  mx_send.send_valid(sample_mail, "login")
+  v = MyVerify()
+  v.verify_token(saved[0])
+  with CaptureQueriesContext(connection) as queries:
+    # still told apart from a bad token.
+    with pytest.raises(errors.ValidatedError):
+      v.verify_token(saved[0])
+  assert len(queries) == 0
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_NEGATIVE_TTL": 0})
+def test_negative_cache_disabled(db, decrypts):
+  v = MyVerify()
+  for _ in range(2):
+    with pytest.raises(ValueError):
+      v.verify_token(GARBAGE)
+  assert len(decrypts) == 2
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_FAILURE_LIMIT": 2})
+def test_throttle_failures_per_ip(db, client, decrypts):
+  url = reverse("login_email:verify")
+  for i in range(3):
+    client.get(url, {"token": f"{GARBAGE}{i}"})
+  # throttled while the counter lasts, never banned.
+  assert not models.IPBan.objects.filter(ip="127.0.0.1").exists()
+
+  res = client.get(url, {"token": "other"})
+  assert res.status_code == 429
+  assert "Too many failed attempts" in res.content.decode()
+  assert len(decrypts) == 2
+
+  cache.clear()
+  assert client.get(url, {"token": "other"}).status_code != 429
+
+
+@override_settings(LOGIN_EMAIL={"VERIFY_FAILURE_LIMIT": 2})
+def test_used_link_is_not_a_failure(db, client, mx_send):
+  saved = []
+
+  class TokenManager(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  mx_send.get_token_manager = lambda: TokenManager(10)
+  mx_send.send_valid(sample_mail, "login")
+  url = reverse("login_email:verify")
+  assert client.get(url, {"token": saved[0]}).status_code == 302
+  for _ in range(4):
+    assert client.get(url, {"token": saved[0]}).status_code == 403
+
+
+@pytest.mark.parametrize("backend", ["cache", "bloom"])
+def test_replay_filter_skips_db(db, mx_send, backend):
+  saved = []
+
+  class TokenManager(token.TokenManager):
+    def encrypt_mail(self, *args, **kwargs):
+      saved.append(super().encrypt_mail(*args, **kwargs))
+      return saved[-1]
+
+  mx_send.get_token_manager = lambda: TokenManager(10)
+  mx_send.send_valid(sample_mail, "login")
+  # only the replay filter, not the negative cache of 041.
+  with override_settings(
+    LOGIN_EMAIL={"VERIFY_NEGATIVE_TTL": 0, "REPLAY_FILTER": backend}
+  ):
+    v = MyVerify()
+    v.verify_token(saved[0])
+    with CaptureQueriesContext(connection) as queries:
+      with pytest.raises(errors.ValidatedError):
+        v.verify_token(saved[0])
+  assert len(queries) == 0